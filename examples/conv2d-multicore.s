@@ -0,0 +1,118 @@
+; conv2d.s split between cores: core CORE computes output rows CORE, CORE + CORES, ...
+; Run with e.g. --cores 2. R13 is never written, so is always 0.
+ADDI R0 R13 matrix
+ADDI R1 R13 kernel
+ADDI R2 R13 output
+
+ADDI R12 R13 0x4        ; output rows
+ADD R3 R13 CORE         ; i: output row
+LT R11 R3 R12           ; more cores than rows
+LNOT R11 R11
+BRATI R11 done
+row:
+ADDI R4 R13 0x0         ; j: output column
+col:
+ADDI R7 R13 0x0         ; sum
+ADDI R5 R13 0x0         ; k: kernel row
+krow:
+ADDI R6 R13 0x0         ; l: kernel column
+kcol:
+ADD R8 R3 R5            ; matrix[(i + k) * 6 + j + l]
+MULI R8 R8 0x6
+ADD R8 R8 R4
+ADD R8 R8 R6
+LDW R9 R0 R8
+MULI R10 R5 0x3         ; kernel[k * 3 + l]
+ADD R10 R10 R6
+LDW R10 R1 R10
+MUL R9 R9 R10
+ADD R7 R7 R9
+ADDI R6 R6 0x1
+SUBI R11 R6 0x3
+BRATI R11 kcol
+ADDI R5 R5 0x1
+SUBI R11 R5 0x3
+BRATI R11 krow
+
+MULI R8 R3 0x4          ; output[i * 4 + j] = sum
+ADD R8 R8 R4
+ADD R8 R8 R2
+STW R8 R7
+ADDI R4 R4 0x1
+SUBI R11 R4 0x4
+BRATI R11 col
+ADD R3 R3 CORES
+LT R11 R3 R12
+BRATI R11 row
+done:
+HALT
+
+; 6x6 input
+matrix:
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+
+; 3x3 kernel
+kernel:
+0x01
+0x02
+0x01
+0x00
+0x01
+0x00
+0x02
+0x01
+0x02
+
+; 4x4 output
+output:
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
@@ -0,0 +1,111 @@
+; conv2d.s with the vector extension: a whole output row is computed at once, by accumulating each kernel
+; element times the matching 4 elements of the input.
+; R13 is never written, so is always 0.
+ADDI R0 R13 matrix
+ADDI R1 R13 kernel
+ADDI R2 R13 output
+ADDI R12 R13 0x1        ; unit stride
+ADDI R11 R13 0x4
+SETVL R11               ; 4 elements: one output row
+
+ADDI R3 R13 0x0         ; i: output row
+row:
+VMULS V0 V0 R13         ; clear the accumulator
+ADDI R5 R13 0x0         ; k: kernel row
+krow:
+ADDI R6 R13 0x0         ; l: kernel column
+kcol:
+ADD R8 R3 R5            ; &matrix[(i + k) * 6 + l]
+MULI R8 R8 0x6
+ADD R8 R8 R6
+ADD R8 R8 R0
+VLD V1 R8 R12
+MULI R10 R5 0x3         ; kernel[k * 3 + l]
+ADD R10 R10 R6
+LDW R10 R1 R10
+VMULS V2 V1 R10
+VADD V0 V0 V2
+ADDI R6 R6 0x1
+SUBI R11 R6 0x3
+BRATI R11 kcol
+ADDI R5 R5 0x1
+SUBI R11 R5 0x3
+BRATI R11 krow
+
+MULI R8 R3 0x4          ; output row i
+ADD R8 R8 R2
+VST V0 R8 R12
+ADDI R3 R3 0x1
+SUBI R11 R3 0x4
+BRATI R11 row
+HALT
+
+; 6x6 input
+matrix:
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+
+; 3x3 kernel
+kernel:
+0x01
+0x02
+0x01
+0x00
+0x01
+0x00
+0x02
+0x01
+0x02
+
+; 4x4 output
+output:
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
@@ -0,0 +1,113 @@
+; 2D convolution (no padding) of a 6x6 matrix with a 3x3 kernel, one multiply-accumulate at a time.
+; R13 is never written, so is always 0.
+ADDI R0 R13 matrix
+ADDI R1 R13 kernel
+ADDI R2 R13 output
+
+ADDI R3 R13 0x0         ; i: output row
+row:
+ADDI R4 R13 0x0         ; j: output column
+col:
+ADDI R7 R13 0x0         ; sum
+ADDI R5 R13 0x0         ; k: kernel row
+krow:
+ADDI R6 R13 0x0         ; l: kernel column
+kcol:
+ADD R8 R3 R5            ; matrix[(i + k) * 6 + j + l]
+MULI R8 R8 0x6
+ADD R8 R8 R4
+ADD R8 R8 R6
+LDW R9 R0 R8
+MULI R10 R5 0x3         ; kernel[k * 3 + l]
+ADD R10 R10 R6
+LDW R10 R1 R10
+MUL R9 R9 R10
+ADD R7 R7 R9
+ADDI R6 R6 0x1
+SUBI R11 R6 0x3
+BRATI R11 kcol
+ADDI R5 R5 0x1
+SUBI R11 R5 0x3
+BRATI R11 krow
+
+MULI R8 R3 0x4          ; output[i * 4 + j] = sum
+ADD R8 R8 R4
+ADD R8 R8 R2
+STW R8 R7
+ADDI R4 R4 0x1
+SUBI R11 R4 0x4
+BRATI R11 col
+ADDI R3 R3 0x1
+SUBI R11 R3 0x4
+BRATI R11 row
+HALT
+
+; 6x6 input
+matrix:
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+0x02
+0x09
+0x05
+0x01
+0x08
+0x04
+0x00
+0x07
+0x03
+0x0A
+0x06
+
+; 3x3 kernel
+kernel:
+0x01
+0x02
+0x01
+0x00
+0x01
+0x00
+0x02
+0x01
+0x02
+
+; 4x4 output
+output:
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
@@ -0,0 +1,23 @@
+; -----------------------------------------
+; factorial.s using a hardware loop: the fetch stage repeats the loop body,
+; so there's no counter test or branch in it
+; --------------------------------------
+
+_start:
+; Load input into r0
+LDWIC r0 input
+; Set r1 to 1 (initial value of accumulator)
+ADDI r1 r1 0x1 ; REG[r1] <- 1
+
+LOOP r0 loop_end
+MUL r1 r1 r0 ; REG[r1] <- REG[r1] * REG[r0]
+SUBI r0 r0 0x1 ; REG[r0] <- REG[r0] - 1
+loop_end:
+
+_end:
+HALT
+
+
+
+input:
+0xFF
@@ -0,0 +1,38 @@
+; -----------------------------------------
+; fibb.s using a hardware loop: the fetch stage repeats the loop body,
+; so there's no counter test or branch in it
+; --------------------------------------
+
+_start:
+; Load input (n) into r0
+LDWIC r0 input
+; the loop runs n - 1 times (we pre-initialise the start)
+SUBI r0 r0 0x1 ; REG[r0] <- REG[r0] - 1
+
+ADDI r1 r1 0x0 ; REG[r1] <- 0
+ADDI r2 r2 0x1 ; REG[r2] <- 1
+
+LOOP r0 loop_end
+; r3 = r1+r2
+ADD r3 r1 r2
+
+; move r2 into r1
+SUB r1 r1 r1
+ADD r1 r1 r2
+
+; move r3 into r2
+SUB r2 r2 r2
+ADD r2 r2 r3
+loop_end:
+
+; r0 = result
+SUB r0 r0 r0
+ADD r0 r0 r2
+
+_end:
+HALT
+
+
+
+input:
+0xFFF
@@ -0,0 +1,66 @@
+; -----------------------------------------
+; calculate fibonacci(input) recursively:
+; fib(n) = n if n < 2, otherwise fib(n - 1) + fib(n - 2)
+;
+; r12 is the link register, and r11 points to the
+; next free word of a stack that grows upwards from
+; the end of the program
+; --------------------------------------
+
+_start:
+; Load input (n) into r0
+LDWIC r0 input
+; r10 = 2, for the base case
+ADDI r10 r13 0x2
+; set up the stack
+ADDI r11 r13 stack
+
+CALL r12 fib ; REG[r1] <- fib(REG[r0])
+
+_end:
+HALT
+
+
+; r1 = fib(r0). Uses r0, r2 and r3.
+fib:
+LT r3 r0 r10 ; REG[r3] <- REG[r0] < 2
+BRATI r3 fib_base
+
+; push the return address and n
+STW r11 r12
+ADDI r11 r11 0x1
+STW r11 r0
+ADDI r11 r11 0x1
+
+SUBI r0 r0 0x1
+CALL r12 fib ; REG[r1] <- fib(n - 1)
+
+; pop n, and push fib(n - 1) in its place
+SUBI r11 r11 0x1
+LDWC r0 r11
+STW r11 r1
+ADDI r11 r11 0x1
+
+SUBI r0 r0 0x2
+CALL r12 fib ; REG[r1] <- fib(n - 2)
+
+; pop fib(n - 1) and add it on
+SUBI r11 r11 0x1
+LDWC r2 r11
+ADD r1 r1 r2
+
+; pop the return address
+SUBI r11 r11 0x1
+LDWC r12 r11
+RET r12
+
+fib_base:
+ADD r1 r0 r13 ; REG[r1] <- n
+RET r12
+
+
+input:
+0xA
+
+stack:
+0x0
@@ -0,0 +1,90 @@
+; matmul.s using nested hardware loops: the loop counters are only kept for working out addresses, and none of the
+; loops need a test or a branch.
+; R13 is never written, so is always 0.
+ADDI R0 R13 a
+ADDI R1 R13 b
+ADDI R2 R13 c
+
+ADDI R3 R13 0x0         ; i: row of C
+LOOPI 0x4 rows_done
+ADDI R4 R13 0x0         ; j: column of C
+LOOPI 0x4 cols_done
+ADDI R7 R13 0x0         ; sum
+ADDI R5 R13 0x0         ; k
+LOOPI 0x4 dot_done
+MULI R8 R3 0x4          ; a[i * 4 + k]
+ADD R8 R8 R5
+LDW R9 R0 R8
+MULI R8 R5 0x4          ; b[k * 4 + j]
+ADD R8 R8 R4
+LDW R10 R1 R8
+MUL R9 R9 R10
+ADD R7 R7 R9
+ADDI R5 R5 0x1
+dot_done:
+
+MULI R8 R3 0x4          ; c[i * 4 + j] = sum
+ADD R8 R8 R4
+ADD R8 R8 R2
+STW R8 R7
+ADDI R4 R4 0x1
+cols_done:
+ADDI R3 R3 0x1
+rows_done:
+HALT
+
+; 4x4 inputs, row-major
+a:
+0x01
+0x02
+0x03
+0x04
+0x05
+0x06
+0x07
+0x08
+0x09
+0x0A
+0x0B
+0x0C
+0x0D
+0x0E
+0x0F
+0x10
+
+b:
+0x02
+0x07
+0x03
+0x08
+0x04
+0x00
+0x05
+0x01
+0x06
+0x02
+0x07
+0x03
+0x08
+0x04
+0x00
+0x05
+
+; 4x4 output
+c:
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
@@ -0,0 +1,89 @@
+; matmul.s with the vector extension: each element of C is the dot product of a row of A (unit stride) and a
+; column of B (stride 4), multiplied elementwise and then reduced.
+; R13 is never written, so is always 0.
+ADDI R0 R13 a
+ADDI R1 R13 b
+ADDI R2 R13 c
+ADDI R12 R13 0x1        ; row stride
+ADDI R9 R13 0x4         ; column stride
+SETVL R9                ; 4 elements
+
+ADDI R3 R13 0x0         ; i: row of C
+row:
+MULI R8 R3 0x4          ; row i of A
+ADD R8 R8 R0
+VLD V0 R8 R12
+ADDI R4 R13 0x0         ; j: column of C
+col:
+ADD R8 R1 R4            ; column j of B
+VLD V1 R8 R9
+VMUL V2 V0 V1
+VREDSUM R7 V2
+
+MULI R8 R3 0x4          ; c[i * 4 + j]
+ADD R8 R8 R4
+ADD R8 R8 R2
+STW R8 R7
+ADDI R4 R4 0x1
+SUBI R11 R4 0x4
+BRATI R11 col
+ADDI R3 R3 0x1
+SUBI R11 R3 0x4
+BRATI R11 row
+HALT
+
+; 4x4 inputs, row-major
+a:
+0x01
+0x02
+0x03
+0x04
+0x05
+0x06
+0x07
+0x08
+0x09
+0x0A
+0x0B
+0x0C
+0x0D
+0x0E
+0x0F
+0x10
+
+b:
+0x02
+0x07
+0x03
+0x08
+0x04
+0x00
+0x05
+0x01
+0x06
+0x02
+0x07
+0x03
+0x08
+0x04
+0x00
+0x05
+
+; 4x4 output
+c:
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
+0x00
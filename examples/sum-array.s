@@ -0,0 +1,20 @@
+; sums the words at data into r1 and stores the sum at result.
+; length and data are meant to be filled in at load time, e.g.
+;   python main.py sum-array.s --load-data length.bin@length --load-data input.npy@data --dump-data result:1@sum.npy
+LDWIC r2 length
+ADDI r3 r13 data
+loop:
+LDW r4 r3 r0
+ADD r1 r1 r4
+ADDI r0 r0 1
+LT r5 r0 r2
+BRATI r5 loop
+ADDI r6 r13 result
+STW r6 r1
+HALT
+length:
+0x0
+result:
+0x0
+data:
+0x0
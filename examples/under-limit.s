@@ -0,0 +1,79 @@
+; -----------------------------------------
+; sets ok[i] to 1 for every reading under 100, and
+; counts the readings under it in r8 and the ones at
+; or over it in r7
+;
+; reading / 100 is 0 for most readings, so the forward
+; branch to bad is usually not taken. While the DIV
+; works out its condition, speculation dispatches the
+; store after the branch, which waits in the memory
+; unit until the branch resolves, and is thrown away
+; the 3 times it's taken.
+; -----------------------------------------
+
+_start:
+ADDI r2 r13 readings ; r2 points to the reading
+ADDI r3 r13 ok       ; r3 points to its flag
+ADDI r4 r13 0x10     ; r4 = readings left
+ADDI r10 r13 0x64    ; r10 = 100
+ADDI r11 r13 0x1
+LDWC r5 r2           ; REG[r5] <- the first reading
+
+loop:
+DIV r6 r5 r10        ; REG[r6] <- REG[r5] / 100
+BRATI r6 bad
+
+STW r3 r11           ; MEM[REG[r3]] <- 1
+LDWI r5 r2 0x1       ; REG[r5] <- the next reading
+ADDI r8 r8 0x1
+
+next:
+ADDI r2 r2 0x1
+ADDI r3 r3 0x1
+SUBI r4 r4 0x1
+BRATI r4 loop
+
+_end:
+HALT
+
+bad:
+LDWI r5 r2 0x1       ; REG[r5] <- the next reading
+ADDI r7 r7 0x1
+JMPAI next
+
+
+readings:
+0x12
+0x2A
+0x07
+0x90
+0x33
+0x05
+0x3C
+0x19
+0x64
+0x4D
+0x0B
+0x2E
+0x58
+0xC8
+0x21
+0x0F
+
+ok:
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
+0x0
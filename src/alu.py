@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
 from math import floor
-from typing import List
+from typing import Dict, List
 
+import bypass
+import log
+import machine
 import registers
+import speculation
 import writeback
 import base_instruction
 import clock
@@ -564,8 +568,16 @@ class Divide(BaseALUInstruction):
 
 class ALU:
     def __init__(self, register_file: registers.RegisterFile, write_back: writeback.WriteBack, clock: clock.Clock,
-                 memory: memory.Memory):
+                 memory: memory.Memory, bypass_network: bypass.BypassNetwork | None = None,
+                 machine_config: machine.MachineConfig | None = None,
+                 speculation_state: speculation.Speculation | None = None):
         self.__register_file = register_file
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        # an instruction down the wrong path can divide by zero, which only matters once it's certain it happens
+        self.__speculation = speculation_state if speculation_state is not None else speculation.Speculation()
+        # operands are read through the bypass network, and results broadcast on it
+        self.__bypass = bypass_network if bypass_network is not None else \
+            bypass.BypassNetwork(register_file, self.__machine)
         self.__clock = clock
         self.__write_back = write_back
         self.__instruction: None | BaseALUInstruction = None
@@ -573,6 +585,8 @@ class ALU:
 
         # used to keep track of which clock cycle the instruction that's executing should finish at.
         self.__finish_at: None | int = 0
+        # instructions executed, by type
+        self.operations: Dict[type, int] = {}
 
     def give_instruction(self, instruction: BaseALUInstruction):
         self.__instruction = instruction
@@ -580,6 +594,16 @@ class ALU:
     def get_instruction(self) -> BaseALUInstruction | None:
         return self.__instruction
 
+    # throws away an instruction dispatched past a taken branch
+    def squash(self, tag: int):
+        if self.__instruction is not None and self.__instruction.speculation_tag == tag:
+            self.__instruction = None
+            self.__finish_at = None
+
+    # an ALU operation, for the energy estimate. The control unit does the compares of fused compare-and-branch pairs.
+    def count_operation(self, instruction: BaseALUInstruction):
+        self.operations[type(instruction)] = self.operations.get(type(instruction), 0) + 1
+
     # whether the ALU is available for being given a new instruction (i.e. has it finished executing the last one).
     def is_available(self) -> bool:
         return self.__instruction is None
@@ -590,25 +614,42 @@ class ALU:
             return False
 
 
-        print(f"ALU execute: {self.__instruction}")
+        if log.ALU.enabled:
+            log.ALU.info(f"ALU execute: {self.__instruction}")
 
         # hasn't started "executing" yet.
         if self.__finish_at is None:
-            self.__finish_at = self.__clock.get_time() + self.__instruction.get_execution_cycles()
+            self.__finish_at = self.__clock.get_time() + self.__machine.get_latency(self.__instruction)
 
         # only execute when the timer runs out, to simulate it taking however many cycles to execute
         # we also need to make sure that the memory unit is free (even though there's no dependence between them)
         # to ensure in-order execution
         if self.__clock.get_time() + 1 >= self.__finish_at:
-            write_back_action = self.__instruction.execute(self.__register_file)
+            # a replayed instruction's result isn't needed, only when it's ready
+            if self.__instruction.trace_record is not None:
+                write_back_action = writeback.WriteBackAction(self.__instruction.get_dest(), 0)
+            else:
+                try:
+                    write_back_action = self.__instruction.execute(self.__bypass)
+                except ArithmeticError:
+                    if not self.__speculation.is_speculative(self.__instruction.speculation_tag):
+                        raise
+                    if log.ALU.verbose:
+                        log.ALU.debug(f"\t Fails, waiting for the branch before it to resolve")
+                    return False
             # stall if memory unit busy
             if not self.__memory.is_mem_busy():
-                print(f"\t forward through MEM: {registers.PhysicalRegisters(write_back_action.reg).name} <- {write_back_action.data}")
+                if log.ALU.enabled:
+                    log.ALU.info(f"\t forward through MEM: {registers.PhysicalRegisters(write_back_action.reg).name} <- {write_back_action.data}")
                 self.__memory.pass_to_wb(write_back_action)
+                write_back_action.tag = self.__instruction.speculation_tag
+                self.__bypass.publish(write_back_action, "alu")
+                self.count_operation(self.__instruction)
                 self.__finish_at = None
                 self.__instruction = None
                 return True
             else:
-                print(f"\t Stalling waiting for memory")
+                if log.ALU.verbose:
+                    log.ALU.debug(f"\t Stalling waiting for memory")
 
         return False
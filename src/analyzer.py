@@ -0,0 +1,140 @@
+from collections import deque
+from typing import Deque, Dict, List, Sequence, Tuple
+
+import base_instruction
+import machine
+import memory
+import registers
+
+
+# Schedules the dynamic instruction stream on an idealised machine with a fixed issue width: every instruction
+# issues as soon as its operands are ready and there's a free issue slot, as long as it's within `window` instructions
+# of the oldest unfinished instruction. Only the last `window` instructions and the issue slots of cycles they could
+# still use are kept, so memory doesn't grow with the length of the trace.
+class IssueModel:
+    def __init__(self, width: int, window: int):
+        self.width = width
+        self.__window = window
+
+        self.__finish_times: Deque[int] = deque()
+        self.__slots: Dict[int, int] = {}
+        # nothing can issue before this, as the instruction window was full until then
+        self.__earliest = 0
+        self.cycles = 0
+
+    def issue(self, ready: int) -> int:
+        if len(self.__finish_times) == self.__window:
+            self.__earliest = max(self.__earliest, self.__finish_times.popleft())
+            # slots for cycles before this can't be used any more
+            if len(self.__slots) > 4 * self.__window:
+                self.__slots = {cycle: used for (cycle, used) in self.__slots.items() if cycle >= self.__earliest}
+
+        cycle = max(ready, self.__earliest)
+        while self.__slots.get(cycle, 0) >= self.width:
+            cycle += 1
+        self.__slots[cycle] = self.__slots.get(cycle, 0) + 1
+        return cycle
+
+    def finish(self, finish_time: int):
+        self.__finish_times.append(finish_time)
+        self.cycles = max(self.cycles, finish_time)
+
+
+# When the latest value of each memory word is ready, for the words stored to in the last `window` instructions. Older
+# entries are dropped as the stores fall out of the window, so a load of a word that hasn't been stored to since is
+# taken to be ready straight away, and memory doesn't grow with the number of addresses the program touches.
+class MemoryReadyTimes:
+    def __init__(self, window: int):
+        self.__window = window
+        # address -> (ready time, the instruction that stored it), oldest store first
+        self.__ready: Dict[int, Tuple[int, int]] = {}
+
+    def get(self, address: int) -> int:
+        entry = self.__ready.get(address)
+        return entry[0] if entry is not None else 0
+
+    def set(self, address: int, ready: int, instruction: int):
+        # moved to the end, as it's now the newest
+        self.__ready.pop(address, None)
+        self.__ready[address] = (ready, instruction)
+        while True:
+            (oldest, (_, stored_by)) = next(iter(self.__ready.items()))
+            if stored_by > instruction - self.__window:
+                break
+            del self.__ready[oldest]
+
+
+# Builds the dynamic dependency graph of a program as it runs, without storing it: each register and memory word
+# only remembers when its latest value is ready. Branches are assumed to be perfectly predicted, so the results are an
+# upper bound on what any pipeline could achieve with the machine's latencies. Memory words are only remembered for as
+# long as a store to them is in the window: for the issue models, anything older has finished before an instruction
+# can issue, and for the critical path, a load more than `memory_window` instructions after the store it depends on is
+# taken not to depend on it.
+class DataflowAnalyzer:
+    def __init__(self, widths: Sequence[int] = (1, 2, 4, 8), window: int = 256,
+                 machine_config: machine.MachineConfig | None = None, memory_window: int = 1 << 16):
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.instructions = 0
+        # longest chain of dependent instructions, in cycles
+        self.critical_path = 0
+
+        # ready times with unlimited issue width, then for each issue model
+        self.__reg_ready: List[int] = [0] * len(registers.ArchRegisters)
+        self.__mem_ready = MemoryReadyTimes(max(window, memory_window))
+        self.__models = [IssueModel(width, window) for width in widths]
+        self.__model_reg_ready: List[List[int]] = [[0] * len(registers.ArchRegisters) for _ in widths]
+        self.__model_mem_ready = [MemoryReadyTimes(window) for _ in widths]
+
+    # functional.Observer, called for every executed instruction with every address it accessed
+    def observe(self, pc: int, instruction: base_instruction.BaseInstruction, addresses: List[int]):
+        latency = self.__machine.get_latency(instruction)
+        sources = [src for src in instruction.get_sources() if isinstance(src, registers.ArchRegisters)]
+        dest = instruction.get_dest()
+        is_memory = isinstance(instruction, memory.BaseMemoryInstruction)
+        is_load = is_memory and dest is not None
+        is_store = is_memory and dest is None
+
+        self.instructions += 1
+        self.critical_path = max(self.critical_path, self.__schedule(
+            self.__reg_ready, self.__mem_ready, sources, dest, addresses, is_load, is_store, latency))
+
+        for (model, reg_ready, mem_ready) in zip(self.__models, self.__model_reg_ready, self.__model_mem_ready):
+            self.__schedule(reg_ready, mem_ready, sources, dest, addresses, is_load, is_store, latency, model)
+
+    def __schedule(self, reg_ready: List[int], mem_ready: MemoryReadyTimes, sources: List[int], dest: int | None,
+                   addresses: List[int], is_load: bool, is_store: bool, latency: int,
+                   model: IssueModel | None = None) -> int:
+        ready = max([0] + [reg_ready[src] for src in sources])
+        # a load depends on the last store to each of the words it reads (all of them, for a strided vector load)
+        if is_load:
+            ready = max([ready] + [mem_ready.get(address) for address in addresses])
+
+        issue = model.issue(ready) if model is not None else ready
+        finish = issue + latency
+        if model is not None:
+            model.finish(finish)
+
+        if dest is not None:
+            reg_ready[dest] = finish
+        if is_store:
+            for address in addresses:
+                mem_ready.set(address, finish, self.instructions)
+        return finish
+
+    def get_ilp(self) -> float:
+        return self.instructions / self.critical_path if self.critical_path != 0 else 0
+
+    # {issue width: best achievable CPI}
+    def get_best_cpi(self) -> Dict[int, float]:
+        return {model.width: model.cycles / self.instructions if self.instructions != 0 else 0
+                for model in self.__models}
+
+    def print_report(self, achieved_cpi: float | None = None):
+        print(f"Dataflow limit over {self.instructions} instructions:")
+        print(f"\t Critical path: {self.critical_path} cycles")
+        print(f"\t Available ILP: {self.get_ilp():.2f} instructions per cycle")
+        for (width, cpi) in self.get_best_cpi().items():
+            print(f"\t Best CPI at issue width {width}: {cpi:.3f}")
+        if achieved_cpi is not None:
+            print(f"\t Achieved CPI: {achieved_cpi:.3f}")
+
@@ -1,18 +1,25 @@
+import argparse
+import hashlib
 import os
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
 import base_instruction
 import instructions
+import machine
+import objectfile
 import registers
+import scheduler
 
 
 class Assembler:
+    # mnemonic -> Instructions entry, so each line is resolved with a single lookup
+    __opcodes: Dict[str, instructions.Instructions] = {inst.value[0]: inst for inst in instructions.Instructions}
 
     # if input path is specified, text is loaded from file. Otherwise, it can be passed as a string.
     # if both are provided, it will ignore the string and use the file.
     def __init__(self, input_file: None | str = None, input_str: None | str = None):
-        self.__labels = {}
+        self.__labels: Dict[str, int] = {}
 
         self.__input_path = Path(input_file) if input_file is not None else None
         self.__input_str = input_str
@@ -21,225 +28,182 @@ class Assembler:
             raise ValueError("Either an input string or an asm file must be provided.")
 
     def assemble(self) -> List[base_instruction.BaseInstruction | int]:
-        assembled = []
+        return [objectfile.build_instruction(word) for word in self.assemble_words()]
+
+    def assemble_object(self) -> objectfile.ObjectFile:
+        return objectfile.ObjectFile.encode(self.assemble_words(), self.__labels)
 
+    # assembles the program without constructing the instruction objects
+    def assemble_words(self) -> List[objectfile.EncodedWord]:
         if self.__input_path is not None:
             with open(self.__input_path, "r") as fh:
-                lines = fh.readlines()
+                lines = fh.read().splitlines()
         else:
-            lines = self.__input_str.split(os.linesep)
+            lines = self.__input_str.splitlines()
 
-        # remove comments
-        lines = [x.split(";")[0] for x in lines]
+        self.__labels = {}
+        statements = self.__tokenise(lines)
 
-        # remove empty lines
-        lines = [x.strip() for x in lines if x.strip() != ""]
+        # every label is known now, so operands can be resolved with a dictionary lookup
+        return [self.__parse_inst(tokens, lines, line_num) for (line_num, tokens) in statements]
 
-        # extract PC values for labels
-        idx = 0
-        while idx < len(lines):
-            line = lines[idx]
-            colon_count = line.count(":")
+    # Single pass over the source: strips comments, records the PC value of each label in the symbol table and splits
+    # each remaining line into tokens. Returns the (line number, tokens) of every line that occupies memory.
+    def __tokenise(self, lines: List[str]) -> List[Tuple[int, List[str]]]:
+        statements = []
+        label_lines: Dict[str, int] = {}
 
+        for (line_num, line) in enumerate(lines, start=1):
+            text = line.split(";", 1)[0]
+
+            colon_count = text.count(":")
             if colon_count > 1:
                 raise Exception(
-                    "Unrecognised syntax: multiple colons found. There can be only one label defined per line.")
+                    f"Unrecognised syntax on line {line_num}: multiple colons found. "
+                    f"There can be only one label defined per line.\n\t {line}")
 
             if colon_count == 1:
-                [left, right] = line.split(":")
-
-                if left in self.__labels:
-                    raise Exception("Labels cannot be reused.")
+                [label, text] = text.split(":")
+                label = label.strip()
 
-                self.__labels[left] = idx
+                if len(label) == 0 or len(label.split()) > 1:
+                    raise Exception(f"Invalid label name \"{label}\" on line {line_num}:\n\t {line}")
 
-                if len(right) == 0:
-                    del lines[idx]
-                    idx -= 1
-                else:
-                    lines[idx] = right
+                if label in self.__labels:
+                    raise Exception(f"Labels cannot be reused: \"{label}\" on line {line_num} was already defined "
+                                    f"on line {label_lines[label]}.")
 
-            idx += 1
+                self.__labels[label] = len(statements)
+                label_lines[label] = line_num
 
-        # replace references to labels with extracted PC values
-        labels_names = self.__labels.keys()
-        for (idx, line) in enumerate(lines):
-            for label_name in labels_names:
-                a = label_name in line
-                if a:
-                    lines[idx] = line.replace(label_name, hex(self.__labels[label_name]))
+            tokens = text.split()
+            if len(tokens) > 0:
+                statements.append((line_num, tokens))
 
-        # convert to Instructions
-        for (idx, line) in enumerate(lines):
-            instruction = self.__parse_inst(lines, idx)
+        return statements
 
-            assembled.append(instruction)
+    def __parse_operands(self, instruction_name: str, operand_format: str, tokens: List[str], lines: List[str],
+                         line_num: int) -> List[registers.ArchRegisters | int]:
+        line = lines[line_num - 1]
 
-        return assembled
-
-    def __parse_operands(self, instruction_name, segments: List[str], lines: List[str], line_num: int, num_regs: int,
-                         num_immediate=0) -> List[registers.ArchRegisters | int]:
-
-        num_operands = num_regs + num_immediate
-        line = lines[line_num]
-
-        if len(segments) - 1 > num_operands:
+        if len(tokens) - 1 != len(operand_format):
             raise Exception(
-                f"{instruction_name} expects {num_operands} operands, but only {len(segments) - 1} given in \n\t {line}")
-        try:
-            reg_operands = [self.__parse_register(reg, lines, line_num) for reg in segments[1:num_regs + 1]]
-
-            immediate_operands = [int(op, 16) for op in segments[num_regs + 1:num_regs + 1 + num_immediate]]
-            return reg_operands + immediate_operands
-        except IndexError:
-            raise Exception(
-                f"{instruction_name} expects {num_operands} operands, but only {len(segments) - 1} given in \n\t {line}")
-        except ValueError:
-            reg = " ".join(segments[num_regs + 1:num_regs + 1 + num_immediate])
-            raise Exception(f"Error interpreting immediate values: {reg} in line \n\t {line}")
-
-    def __parse_inst(self, lines: List[str], line_num: int) -> base_instruction.BaseInstruction | int:
-        segments = lines[line_num].upper().split(" ")
-        instruction = segments[0]
-
-        if instruction == instructions.Instructions.BitWiseAnd.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.BitWiseAnd.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.BitWiseXOr.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.BitWiseXOr.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.BitWiseOr.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.BitWiseOr.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.BitWiseNot.value[0]:
-            [dest, op1] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2)
-            return instructions.Instructions.BitWiseNot.value[1](dest, op1)
-
-        if instruction == instructions.Instructions.LogicalNot.value[0]:
-            [dest, op1] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2)
-            return instructions.Instructions.LogicalNot.value[1](dest, op1)
-
-        if instruction == instructions.Instructions.ADDITION.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.ADDITION.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.ADDITION_IMMEDIATE.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                     num_immediate=1)
-            return instructions.Instructions.ADDITION_IMMEDIATE.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.SUBTRACT.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.SUBTRACT.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.SUBTRACT_IMMEDIATE.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                     num_immediate=1)
-            return instructions.Instructions.SUBTRACT_IMMEDIATE.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.MULTIPLY.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.MULTIPLY.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.MULTIPLY_IMMEDIATE.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                     num_immediate=1)
-            return instructions.Instructions.MULTIPLY_IMMEDIATE.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.GREATER_THAN.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.GREATER_THAN.value[1](dest, op1, op2)
+                f"{instruction_name} expects {len(operand_format)} operands, but {len(tokens) - 1} given on line "
+                f"{line_num}:\n\t {line}")
 
-        if instruction == instructions.Instructions.LESSER_THAN.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.LESSER_THAN.value[1](dest, op1, op2)
+        return [self.__parse_register(token, kind == "v", lines, line_num) if kind in "rv"
+                else self.__parse_immediate(token, lines, line_num)
+                for (kind, token) in zip(operand_format, tokens[1:])]
 
-        if instruction == instructions.Instructions.EQUAL_TO.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.EQUAL_TO.value[1](dest, op1, op2)
+    def __parse_inst(self, tokens: List[str], lines: List[str], line_num: int) -> objectfile.EncodedWord:
+        instruction_name = tokens[0].upper()
+        instruction = Assembler.__opcodes.get(instruction_name)
 
-        if instruction == instructions.Instructions.LEFT_SHIFT.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.LEFT_SHIFT.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.LEFT_SHIFT_IMMEDIATE.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                     num_immediate=1)
-            return instructions.Instructions.LEFT_SHIFT_IMMEDIATE.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.RIGHT_SHIFT.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.RIGHT_SHIFT.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.RIGHT_SHIFT_IMMEDIATE.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                     num_immediate=1)
-            return instructions.Instructions.RIGHT_SHIFT_IMMEDIATE.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.DIVISION.value[0]:
-            [dest, op1, op2] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.DIVISION.value[1](dest, op1, op2)
-
-        if instruction == instructions.Instructions.JUMP_ABSOLUTE.value[0]:
-            [addr] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=1)
-            return instructions.Instructions.JUMP_ABSOLUTE.value[1](addr)
-
-        if instruction == instructions.Instructions.JUMP_ABSOLUTE_IMMEDIATE.value[0]:
-            [addr] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=0, num_immediate=1)
-            return instructions.Instructions.JUMP_ABSOLUTE_IMMEDIATE.value[1](addr)
-
-        if instruction == instructions.Instructions.BRANCH_ABSOLUTE_TRUE.value[0]:
-            [cond, address] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2)
-            return instructions.Instructions.BRANCH_ABSOLUTE_TRUE.value[1](cond, address)
-
-        if instruction == instructions.Instructions.BRANCH_ABSOLUTE_TRUE_IMMEDIATE.value[0]:
-            [cond, address] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=1, num_immediate=1)
-            return instructions.Instructions.BRANCH_ABSOLUTE_TRUE_IMMEDIATE.value[1](cond, address)
-
-        if instruction == instructions.Instructions.LOAD_WORD.value[0]:
-            [dest, base, offset] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.LOAD_WORD.value[1](dest, base, offset)
-
-        if instruction == instructions.Instructions.LOAD_WORD_IMMEDIATE.value[0]:
-            [dest, base, offset] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2,
-                                                         num_immediate=1)
-            return instructions.Instructions.LOAD_WORD_IMMEDIATE.value[1](dest, base, offset)
-
-        if instruction == instructions.Instructions.LOAD_WORD_CONSTANT.value[0]:
-            [dest, addr] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2)
-            return instructions.Instructions.LOAD_WORD_CONSTANT.value[1](dest, addr)
-
-        if instruction == instructions.Instructions.LOAD_WORD_CONSTANT_IMMEDIATE.value[0]:
-            [dest, addr] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=1, num_immediate=1)
-            return instructions.Instructions.LOAD_WORD_CONSTANT_IMMEDIATE.value[1](dest, addr)
-
-        if instruction == instructions.Instructions.STORE_WORD.value[0]:
-            [addr, source] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=3)
-            return instructions.Instructions.STORE_WORD.value[1](addr, source)
-
-        if instruction == instructions.Instructions.STORE_WORD_IMMEDIATE.value[0]:
-            [addr, source] = self.__parse_operands(instruction, segments, lines, line_num, num_regs=2, num_immediate=1)
-            return instructions.Instructions.STORE_WORD_IMMEDIATE.value[1](addr, source)
+        # anything that isn't an instruction is a data word
+        if instruction is None:
+            if len(tokens) == 1 and (tokens[0] in self.__labels or self.__is_hex(tokens[0])):
+                return self.__parse_immediate(tokens[0], lines, line_num)
+            raise Exception(
+                f"Unrecognised Instruction \"{instruction_name}\" on line {line_num}:\n\t {lines[line_num - 1]}")
 
-        if instruction == instructions.Instructions.HALT.value[0]:
-            return instructions.Instructions.HALT.value[1]()
-
-        if instruction == instructions.Instructions.NO_OP.value[0]:
-            return instructions.Instructions.NO_OP.value[1]()
+        operands = self.__parse_operands(instruction_name, instruction.value[2], tokens, lines, line_num)
+        return instruction, operands
 
+    def __parse_register(self, name: str, is_vector: bool, lines: List[str], line_num: int) -> registers.ArchRegisters:
         try:
-            return int(segments[0], 16)
+            register = registers.ArchRegisters[name.upper()]
+        except KeyError:
+            raise Exception(f"Unrecognised Register {name} on line {line_num}:\n\t {lines[line_num - 1]}")
+        if is_vector != (register in registers.VECTOR_REGISTERS):
+            expected = "a vector" if is_vector else "a scalar"
+            raise Exception(f"Expected {expected} register, not {name}, on line {line_num}:\n\t {lines[line_num - 1]}")
+        return register
+
+    # immediates are either hex values or label names, which are replaced by the label's PC value
+    def __parse_immediate(self, token: str, lines: List[str], line_num: int) -> int:
+        if token in self.__labels:
+            return self.__labels[token]
+        try:
+            return int(token, 16)
         except ValueError:
-            raise Exception(f"Unrecognised Instruction \"{instruction}\" on line {line_num}:\n\t {lines[line_num]}")
+            raise Exception(f"Error interpreting immediate value {token} on line {line_num}:\n\t {lines[line_num - 1]}")
 
-    def __parse_register(self, name: str, lines: List[str], line_num: int) -> registers.ArchRegisters:
+    @staticmethod
+    def __is_hex(token: str) -> bool:
         try:
-            return registers.ArchRegisters[name]
-        except KeyError:
-            raise Exception(f"Unrecognised Register {name} in \n\t{lines[line_num]}")
+            int(token, 16)
+            return True
+        except ValueError:
+            return False
 
     def get_label(self, key):
-        return self.__labels[key]
\ No newline at end of file
+        return self.__labels[key]
+
+    def get_labels(self) -> Dict[str, int]:
+        return self.__labels
+
+
+# Assembled programs are cached on disk as object files, keyed by the hash of the source, the assembler version and
+# the instruction set, so a program that's run many times is only assembled once.
+class ObjectCache:
+    def __init__(self, cache_dir: str | Path | None = None):
+        if cache_dir is None:
+            cache_root = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+            cache_dir = Path(cache_root) / "coms30046-sim" / "objects"
+        self.__cache_dir = Path(cache_dir)
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, source: bytes) -> Path:
+        key = hashlib.sha256(source)
+        key.update(f"{objectfile.ASSEMBLER_VERSION}:{objectfile.FORMAT_VERSION}:{objectfile.isa_fingerprint()}".encode())
+        return self.__cache_dir / f"{key.hexdigest()}.o"
+
+    def assemble(self, input_file: str | Path) -> objectfile.ObjectFile:
+        with open(input_file, "rb") as fh:
+            source = fh.read()
+
+        path = self.get_path(source)
+        if path.exists():
+            try:
+                obj = objectfile.ObjectFile.load(path)
+                self.hits += 1
+                return obj
+            except Exception:
+                # corrupted or stale entry, so overwrite it
+                pass
+
+        self.misses += 1
+        obj = Assembler(input_str=source.decode()).assemble_object()
+        self.__cache_dir.mkdir(parents=True, exist_ok=True)
+        obj.save(path)
+        return obj
+
+
+# Load a program from either an assembly file or an object file. Assembly is cached unless cache is None.
+def load_program(input_file: str | Path, cache: ObjectCache | None = None) -> objectfile.ObjectFile:
+    if objectfile.ObjectFile.is_object_file(input_file):
+        return objectfile.ObjectFile.load(input_file)
+    if cache is not None:
+        return cache.assemble(input_file)
+    return Assembler(input_file).assemble_object()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Assemble a program into an object file")
+    arg_parser.add_argument("input_file", type=str, help="The assembly file to assemble")
+    arg_parser.add_argument("--output", "-o", type=str, default=None,
+                            help="Where to write the object file. Default: the input file with a .o extension")
+    arg_parser.add_argument("--schedule", action="store_true",
+                            help="Reorder instructions within basic blocks to reduce pipeline stalls")
+    arg_parser.add_argument("--machine", type=str, default=None, metavar="FILE",
+                            help="Schedule for the latencies in this machine description (.toml or .json)")
+
+    args = arg_parser.parse_args()
+    output = args.output if args.output is not None else Path(args.input_file).with_suffix(".o")
+    obj = Assembler(args.input_file).assemble_object()
+    if args.schedule:
+        machine_config = machine.MachineConfig.load(args.machine) if args.machine is not None else None
+        obj = scheduler.schedule_object(obj, machine_config)
+    obj.save(output)
@@ -5,6 +5,11 @@ from src import registers
 
 
 class BaseInstruction(metaclass=ABCMeta):
+    # what this instruction did, when replaying a trace (see tracefile.py)
+    trace_record = None
+    # the branch this instruction was dispatched past, if it was (see speculation.py)
+    speculation_tag = None
+
     @abstractmethod
     def get_dest(self) -> registers.Registers | None:
         pass
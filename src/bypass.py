@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+
+import machine
+import registers
+import writeback
+
+# Each functional unit that produces register results has its own path back to the execute stage (the control unit's
+# results are CALLs' return addresses)
+PATHS = ("alu", "mem", "vec", "cu")
+
+
+# Results are broadcast on the bypass network as soon as a functional unit produces them, and stay there until they're
+# written back. Instructions read their operands through the network, so a consumer can start executing the cycle after
+# its producer finishes instead of waiting for the register file to be written.
+class BypassNetwork:
+    def __init__(self, register_file: registers.RegisterFile, machine_config: machine.MachineConfig | None = None):
+        self.__register_file = register_file
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+
+        # physical register -> (result waiting to be written back, path it was produced on)
+        self.__results: Dict[int, Tuple[writeback.WriteBackAction, str]] = {}
+        # operands of dispatched instructions, by where they came from
+        self.__uses: Dict[str, int] = {path: 0 for path in PATHS}
+        self.__register_reads = 0
+
+    def is_enabled(self, path: str) -> bool:
+        return self.__machine.forward_results and self.__machine.bypass_paths.get(path, False)
+
+    # called by a functional unit when it produces a result
+    def publish(self, action: writeback.WriteBackAction, path: str):
+        self.__results[action.reg] = (action, path)
+
+    # is there a result for this register that hasn't been written back yet?
+    def is_pending(self, register: registers.Registers) -> bool:
+        return register in self.__results
+
+    # can a consumer of this register start executing now, rather than waiting for write-back?
+    def can_forward(self, register: registers.Registers) -> bool:
+        return register not in self.__results or self.is_enabled(self.__results[register][1])
+
+    # called when an instruction is dispatched, to count which of its operands will be bypassed
+    def record_dispatch(self, sources: List[registers.Registers]):
+        for source in sources:
+            # some instructions list immediates as sources
+            if not isinstance(source, registers.Registers):
+                continue
+            if source in self.__results:
+                self.__uses[self.__results[source][1]] += 1
+            else:
+                self.__register_reads += 1
+
+    def get_register_value(self, register: registers.Registers) -> int:
+        if register in self.__results:
+            (action, path) = self.__results[register]
+            if self.is_enabled(path):
+                return action.data
+        return self.__register_file.get_register_value(register)
+
+    # write-back goes through here, so results leave the network once they're in the register file
+    def write_back(self, action: writeback.WriteBackAction):
+        self.__register_file.set_register_value(action.reg, action.data)
+        if action.reg in self.__results and self.__results[action.reg][0] is action:
+            del self.__results[action.reg]
+
+    # results of instructions dispatched past a taken branch never happened
+    def squash(self, tag: int):
+        for (register, (action, _)) in list(self.__results.items()):
+            if action.tag == tag:
+                del self.__results[register]
+
+    def get_uses(self) -> Dict[str, int]:
+        return dict(self.__uses)
+
+    def get_register_reads(self) -> int:
+        return self.__register_reads
+
+    def print_statistics(self):
+        total = self.__register_reads + sum(self.__uses.values())
+        if total == 0:
+            return
+        uses: List[str] = [f"{path}={count} ({100 * count / total:.1f}%)" for (path, count) in self.__uses.items()]
+        print(f"Operands bypassed: {', '.join(uses)}; read from register file: {self.__register_reads}")
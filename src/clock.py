@@ -1,25 +1,29 @@
-# SINGLETON CLOCK
-from time import sleep
+from time import perf_counter, sleep
 
 
+# Each core has its own clock. Given a speed, it paces the simulation to that many cycles per second, so it can be
+# watched; otherwise it runs as fast as it can.
 class Clock:
-    __clock = None
-
-    def __new__(cls, *args, **kwargs):
-        if cls.__clock is None:
-            cls.__clock = super(Clock, cls).__new__(cls)
-
-        return cls.__clock
-
-    def __init__(self, speed: int = 0):
-        if not hasattr(self, "_initialised"):
-            self.__time = 0
-            self._initialised = True
-            self.__speed = speed
+    def __init__(self, speed: float = 0):
+        self.__time = 0
+        self.__speed = speed
+        # when the first cycle started
+        self.__start: float | None = None
 
     def tick(self):
-        sleep(self.__speed/4)
         self.__time += 1
+        if self.__speed > 0:
+            self.__pace()
+
+    # Waits until this cycle is due to end. It's measured from the start of the run rather than being a fixed sleep
+    # every tick, so time spent simulating the cycle doesn't slow the pace down.
+    def __pace(self):
+        now = perf_counter()
+        if self.__start is None:
+            self.__start = now
+        due = self.__start + self.__time / self.__speed
+        if due > now:
+            sleep(due - now)
 
     def get_time(self):
         return self.__time
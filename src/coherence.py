@@ -0,0 +1,197 @@
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, List, Tuple
+
+import dram
+import machine
+
+"""
+Private data caches for the cores of a multicore system, kept coherent by snooping on a shared bus.
+
+Caches only keep track of which lines they hold and in what state, for timing: the data itself always lives in the
+shared storage, which every access reads or writes when it completes. Each line is in one of the states
+
+    M (modified)  - the only copy, and it's dirty
+    E (exclusive) - the only copy, and it's clean. Only used by MESI: a write to it doesn't need the bus.
+    S (shared)    - there may be other copies, which are all clean
+    I (invalid)   - not in the cache
+
+Misses and upgrades are bus transactions, which happen one at a time and take the interconnect latency. A read miss is
+supplied by the cache holding the line in M if there is one (which also writes it back), and by memory otherwise.
+"""
+
+
+class LineState(Enum):
+    MODIFIED = "M"
+    EXCLUSIVE = "E"
+    SHARED = "S"
+    INVALID = "I"
+
+
+class CacheStatistics:
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.read_misses = 0
+        self.write_misses = 0
+        # writes to a line held in S, which have to invalidate the other copies
+        self.upgrades = 0
+        # writes to a line held in E, which become M without using the bus
+        self.silent_upgrades = 0
+        # lines taken away by other cores' writes
+        self.invalidations = 0
+        # dirty lines this cache supplied to another core's miss
+        self.interventions = 0
+        # dirty lines written back when evicted
+        self.write_backs = 0
+        # cycles spent waiting for the bus
+        self.bus_wait = 0
+
+    def get_hit_rate(self) -> float:
+        accesses = self.reads + self.writes
+        return 1 - (self.read_misses + self.write_misses) / accesses if accesses != 0 else 0
+
+    def get_statistics(self) -> Dict[str, float]:
+        return {"reads": self.reads, "writes": self.writes, "read_misses": self.read_misses,
+                "write_misses": self.write_misses, "hit_rate": self.get_hit_rate(), "upgrades": self.upgrades,
+                "silent_upgrades": self.silent_upgrades, "invalidations": self.invalidations,
+                "interventions": self.interventions, "write_backs": self.write_backs, "bus_wait": self.bus_wait}
+
+
+class Cache:
+    def __init__(self, core_id: int, interconnect: "Interconnect", machine_config: machine.MachineConfig):
+        self.core_id = core_id
+        self.__interconnect = interconnect
+        self.__settings = machine_config.cache
+        self.__line_words = self.__settings["line_words"]
+        self.__num_sets = self.__settings["lines"] // self.__settings["associativity"]
+
+        # line address -> state, least recently used first
+        self.__sets: List[OrderedDict[int, LineState]] = [OrderedDict() for _ in range(self.__num_sets)]
+        self.statistics = CacheStatistics()
+
+    def __get_set(self, line: int) -> OrderedDict[int, LineState]:
+        return self.__sets[line % self.__num_sets]
+
+    def get_state(self, address: int) -> LineState:
+        line = address // self.__line_words
+        return self.__get_set(line).get(line, LineState.INVALID)
+
+    def __set_state(self, line: int, state: LineState):
+        lines = self.__get_set(line)
+        lines[line] = state
+        lines.move_to_end(line)
+        if len(lines) > self.__settings["associativity"]:
+            (_, evicted) = lines.popitem(last=False)
+            if evicted == LineState.MODIFIED:
+                self.statistics.write_backs += 1
+
+    # Reads or writes a word at time `now`, and returns how many cycles it takes
+    def access(self, address: int, is_write: bool, now: int) -> int:
+        line = address // self.__line_words
+        lines = self.__get_set(line)
+        state = lines.get(line, LineState.INVALID)
+        latency = self.__settings["hit_latency"]
+
+        if not is_write:
+            self.statistics.reads += 1
+            if state == LineState.INVALID:
+                self.statistics.read_misses += 1
+                (bus_latency, shared) = self.__interconnect.read(self, line, now)
+                latency += bus_latency
+                state = LineState.SHARED if shared or not self.__interconnect.has_exclusive_state() \
+                    else LineState.EXCLUSIVE
+        else:
+            self.statistics.writes += 1
+            if state == LineState.INVALID:
+                self.statistics.write_misses += 1
+                latency += self.__interconnect.read_exclusive(self, line, now)
+            elif state == LineState.SHARED:
+                self.statistics.upgrades += 1
+                latency += self.__interconnect.upgrade(self, line, now)
+            elif state == LineState.EXCLUSIVE:
+                self.statistics.silent_upgrades += 1
+            state = LineState.MODIFIED
+
+        self.__set_state(line, state)
+        return latency
+
+    # Another cache's transaction on the bus. Returns the state this cache had the line in.
+    def snoop(self, line: int, exclusive: bool) -> LineState:
+        lines = self.__get_set(line)
+        state = lines.get(line, LineState.INVALID)
+        if state == LineState.INVALID:
+            return state
+
+        if state == LineState.MODIFIED:
+            self.statistics.interventions += 1
+        if exclusive:
+            self.statistics.invalidations += 1
+            del lines[line]
+        else:
+            lines[line] = LineState.SHARED
+        return state
+
+
+class Interconnect:
+    def __init__(self, machine_config: machine.MachineConfig):
+        self.__machine = machine_config
+        self.__latency = machine_config.multicore["interconnect_latency"]
+        self.__caches: List[Cache] = []
+        # the bus is busy with a transaction until then
+        self.__busy_until = 0
+        # the memory behind the bus, if it's modelled rather than taking memory_latency
+        self.dram = dram.DRAM(machine_config) if machine_config.dram["enabled"] else None
+
+        self.transactions = 0
+        # misses supplied by another cache rather than memory
+        self.cache_to_cache = 0
+
+    def add_cache(self) -> Cache:
+        cache = Cache(len(self.__caches), self, self.__machine)
+        self.__caches.append(cache)
+        return cache
+
+    def get_caches(self) -> List[Cache]:
+        return self.__caches
+
+    def has_exclusive_state(self) -> bool:
+        return self.__machine.multicore["protocol"] == "MESI"
+
+    # waits for the bus, then broadcasts the transaction to every other cache. Returns (cycles, their old states)
+    def __transaction(self, requester: Cache, line: int, now: int, exclusive: bool) -> Tuple[int, List[LineState]]:
+        start = max(now, self.__busy_until)
+        self.__busy_until = start + self.__latency
+        requester.statistics.bus_wait += start - now
+        self.transactions += 1
+
+        states = [cache.snoop(line, exclusive) for cache in self.__caches if cache is not requester]
+        return self.__busy_until - now, states
+
+    def __fetch_line(self, requester: Cache, line: int, now: int, exclusive: bool) -> Tuple[int, List[LineState]]:
+        (latency, states) = self.__transaction(requester, line, now, exclusive)
+        if LineState.MODIFIED in states:
+            self.cache_to_cache += 1
+        elif self.dram is not None:
+            line_words = self.__machine.cache["line_words"]
+            words = [(line * line_words + idx, False) for idx in range(line_words)]
+            latency = max(self.dram.access(words, now + latency)) - now
+        else:
+            latency += self.__machine.memory_latency
+        return latency, states
+
+    # a read miss. Returns (cycles, is the line in any other cache now?)
+    def read(self, requester: Cache, line: int, now: int) -> Tuple[int, bool]:
+        (latency, states) = self.__fetch_line(requester, line, now, False)
+        return latency, any(state != LineState.INVALID for state in states)
+
+    # a write miss: fetch the line and invalidate every other copy
+    def read_exclusive(self, requester: Cache, line: int, now: int) -> int:
+        return self.__fetch_line(requester, line, now, True)[0]
+
+    # a write to a shared line: it's already up to date, so the other copies just need to be invalidated
+    def upgrade(self, requester: Cache, line: int, now: int) -> int:
+        return self.__transaction(requester, line, now, True)[0]
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {"transactions": self.transactions, "cache_to_cache": self.cache_to_cache}
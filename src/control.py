@@ -6,8 +6,13 @@ import alu
 import memory
 import registers
 import base_instruction
+import speculation
+import bypass
 import clock
-from src import flags
+import log
+import machine
+import vector
+import writeback
 
 
 class BaseControlInstruction(base_instruction.BaseInstruction):
@@ -91,6 +96,12 @@ class BranchAbsoluteTrueImmediate(BaseControlInstruction):
             return self.__loc, None
         return None, None
 
+    def get_condition(self) -> registers.Registers:
+        return self.__cond
+
+    def get_target(self) -> int:
+        return self.__loc
+
     def get_dest(self) -> registers.Registers:
         return None
 
@@ -138,23 +149,320 @@ class NoOp(BaseControlInstruction):
         pass
 
 
+# Calls a subroutine: jumps to `location`, leaving the address of the instruction after the CALL in `link` for RET to go
+# back to. The target is known when the CALL is fetched, so the fetch stage goes straight there, and all that's left to
+# execute is writing the link register.
+class Call(BaseControlInstruction):
+    def __init__(self, link: registers.Registers, location: int):
+        self.__link = link
+        self.__loc = location
+        # given to it by whatever executes it, as only that knows where it is
+        self.return_address: int | None = None
+
+    def execute(self, register_file: registers.RegisterFile) -> Tuple[int, None]:
+        return self.__loc, None
+
+    def get_target(self) -> int:
+        return self.__loc
+
+    def get_dest(self) -> registers.Registers:
+        return self.__link
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.__link = registers.PhysicalRegisters(new)
+
+    def get_sources(self) -> List[registers.Registers]:
+        return []
+
+    def update_source_registers(self, rat: List[int]):
+        pass
+
+
+# Returns from a subroutine, to the address in `link`. The fetch stage predicts where with the return address stack.
+class Return(BaseControlInstruction):
+    def __init__(self, link: registers.Registers):
+        self.__link = link
+
+    def execute(self, register_file: registers.RegisterFile) -> Tuple[int, None]:
+        return register_file.get_register_value(self.__link), None
+
+    def get_dest(self) -> registers.Registers:
+        return None
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        pass
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__link]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__link = registers.PhysicalRegisters(rat[self.__link])
+
+
+# the instructions whose result a BRATI can be fused with
+FUSIBLE_COMPARES = (alu.LesserThan, alu.GreaterThan, alu.EqualTo, alu.AddImmediate, alu.SubtractImmediate)
+
+
+# A compare (or an ADDI/SUBI, which loops use to test their counter against zero) and the BRATI after it that branches
+# on its result, fetched as one micro-op. The control unit works out the compare, writes its result back as usual and
+# resolves the branch from it in the same cycle, so the branch neither takes a dispatch of its own nor waits for it.
+class FusedCompareBranch(BaseControlInstruction):
+    def __init__(self, compare: alu.BaseALUInstruction, branch: BranchAbsoluteTrueImmediate):
+        self.compare = compare
+        self.branch = branch
+
+    def get_result(self, register_file: registers.RegisterFile) -> writeback.WriteBackAction:
+        return self.compare.execute(register_file)
+
+    # where the branch goes, given what the compare produced
+    def resolve(self, result: int) -> int | None:
+        return self.branch.get_target() if result else None
+
+    def execute(self, register_file: registers.RegisterFile) -> Tuple[None | int, None]:
+        return self.resolve(self.get_result(register_file).data), None
+
+    def get_dest(self) -> registers.Registers:
+        return self.compare.get_dest()
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.compare.update_dest(new)
+
+    # the branch's condition is the compare's result, so it isn't read from a register
+    def get_sources(self) -> List[registers.Registers]:
+        return self.compare.get_sources()
+
+    def update_source_registers(self, rat: List[int]):
+        self.compare.update_source_registers(rat)
+
+
+# How many compare-and-branch pairs were executed as one micro-op
+class MacroFusion:
+    def __init__(self):
+        self.executed = 0
+        self.taken = 0
+        # the branches of pairs executed since take_uncounted was last called
+        self.__uncounted = 0
+
+    def record(self, taken: bool):
+        self.executed += 1
+        self.taken += 1 if taken else 0
+        self.__uncounted += 1
+
+    # each pair is two instructions, but the control unit only says it executed one
+    def take_uncounted(self) -> int:
+        uncounted = self.__uncounted
+        self.__uncounted = 0
+        return uncounted
+
+    def print_statistics(self, instructions: int):
+        if self.executed == 0:
+            return
+        print(f"Macro-op fusion: {self.executed} compare-and-branch pairs executed as one micro-op ({self.taken} "
+              f"taken), {100 * 2 * self.executed / instructions:.1f}% of instructions, {self.executed} fewer "
+              f"dispatches")
+
+
+# Zero-overhead loop: the instructions from the next one up to (not including) `end` are repeated `count` times.
+# The fetch stage does the looping, so the body doesn't need a branch.
+class BaseLoopInstruction(BaseControlInstruction):
+    @abstractmethod
+    def get_count(self, register_file: registers.RegisterFile) -> int:
+        pass
+
+    @abstractmethod
+    def get_end(self) -> int:
+        pass
+
+    # the loop is set up when the instruction is dispatched, so there's nothing left to do here
+    def execute(self, register_file: registers.RegisterFile) -> Tuple[None, None]:
+        return None, None
+
+    def get_dest(self) -> registers.Registers:
+        return None
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        pass
+
+
+class LoopSetup(BaseLoopInstruction):
+    def __init__(self, count: registers.Registers, end: int):
+        self.__count = count
+        self.__end = end
+
+    def get_count(self, register_file: registers.RegisterFile) -> int:
+        return register_file.get_register_value(self.__count)
+
+    def get_end(self) -> int:
+        return self.__end
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__count]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__count = registers.PhysicalRegisters(rat[self.__count])
+
+
+class LoopSetupImmediate(BaseLoopInstruction):
+    def __init__(self, count: int, end: int):
+        self.__count = count
+        self.__end = end
+
+    def get_count(self, register_file: registers.RegisterFile) -> int:
+        return self.__count
+
+    def get_end(self) -> int:
+        return self.__end
+
+    def get_sources(self) -> List[registers.Registers]:
+        return []
+
+    def update_source_registers(self, rat: List[int]):
+        pass
+
+
+# The stack of active hardware loops, innermost last. Loops can be nested, and can end at the same place.
+class HardwareLoops:
+    def __init__(self):
+        # [first instruction of the body, end, iterations left]
+        self.__loops: List[List[int]] = []
+        # how many times the fetch stage went back to the start of a loop
+        self.loop_backs = 0
+
+    # returns where to continue from: the start of the body, or the end if there are no iterations
+    def start_loop(self, start: int, end: int, count: int) -> int:
+        if count <= 0 or end <= start:
+            return end
+        self.__loops.append([start, end, count])
+        return start
+
+    # the next instruction to fetch after the one at pc, going back to the start of a loop at the end of its body
+    def next_pc(self, pc: int) -> int:
+        next_pc = pc + 1
+        while len(self.__loops) > 0 and next_pc == self.__loops[-1][1]:
+            loop = self.__loops[-1]
+            if loop[2] > 1:
+                loop[2] -= 1
+                self.loop_backs += 1
+                return loop[0]
+            self.__loops.pop()
+        return next_pc
+
+    # is the instruction at pc the last of a loop's body?
+    def ends_body(self, pc: int) -> bool:
+        return any(loop[1] == pc + 1 for loop in self.__loops)
+
+    # a branch to pc leaves any loop whose body it isn't in
+    def leave(self, pc: int):
+        while len(self.__loops) > 0 and not (self.__loops[-1][0] <= pc < self.__loops[-1][1]):
+            self.__loops.pop()
+
+    def get_depth(self) -> int:
+        return len(self.__loops)
+
+    def checkpoint(self) -> List[List[int]]:
+        return [list(loop) for loop in self.__loops]
+
+    def restore(self, checkpoint: List[List[int]]):
+        self.__loops = [list(loop) for loop in checkpoint]
+
+
+# Return address stack: the fetch stage pushes the return address of every CALL it fetches, and pops one to predict
+# where each RET goes. When it's full, the oldest address is lost, so the return that needs it will be mispredicted.
+class ReturnAddressStack:
+    def __init__(self, depth: int):
+        self.__depth = depth
+        self.__addresses: List[int] = []
+
+        self.pushes = 0
+        # returns predicted from the stack, and how many of them were right
+        self.predictions = 0
+        self.correct = 0
+        # returns fetched with nothing on the stack
+        self.empty = 0
+        # addresses pushed off the bottom
+        self.overflows = 0
+
+    def push(self, address: int):
+        self.pushes += 1
+        if len(self.__addresses) == self.__depth:
+            self.__addresses.pop(0)
+            self.overflows += 1
+        self.__addresses.append(address)
+
+    # the predicted return address, or None if there isn't one
+    def pop(self) -> int | None:
+        return self.__addresses.pop() if len(self.__addresses) != 0 else None
+
+    # Called when a return is executed. Returns fetched down the wrong path are popped and put back, so they're only
+    # counted here.
+    def resolve(self, predicted: bool, correct: bool):
+        if not predicted:
+            self.empty += 1
+            return
+        self.predictions += 1
+        self.correct += 1 if correct else 0
+
+    def get_depth(self) -> int:
+        return len(self.__addresses)
+
+    def checkpoint(self) -> List[int]:
+        return list(self.__addresses)
+
+    def restore(self, checkpoint: List[int]):
+        self.__addresses = list(checkpoint)
+
+    def print_statistics(self):
+        if self.pushes == 0 and self.predictions == 0 and self.empty == 0:
+            return
+        print(f"Return address stack: {self.correct}/{self.predictions} predicted returns were right, {self.empty} "
+              f"returns found it empty, {self.overflows} of {self.pushes} return addresses lost to overflow")
+
+
 class Control:
     def __init__(self, alu: alu.ALU, mem: memory.Memory, register_file: registers.RegisterFile, clock: clock.Clock,
-                 writeback):
+                 writeback, bypass_network: bypass.BypassNetwork | None = None,
+                 machine_config: machine.MachineConfig | None = None, vector_unit: vector.VectorUnit | None = None,
+                 replay=None, speculation_state: speculation.Speculation | None = None):
         self.__register_file = register_file
+        # a tracefile.Replay (which can't be imported here, as it needs the instruction set). When replaying a trace,
+        # instructions are given their records instead of being evaluated.
+        self.__replay = replay
+        # shared with the memory unit, which holds speculative stores back
+        self.speculation = speculation_state if speculation_state is not None else speculation.Speculation()
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.__bypass = bypass_network if bypass_network is not None else \
+            bypass.BypassNetwork(register_file, self.__machine)
+        self.__vector = vector_unit if vector_unit is not None else \
+            vector.VectorUnit(register_file, clock, mem, self.__bypass, self.__machine)
         self.__ALU = alu
         self.__memory = mem
         self.__clock = clock
         self.__writeback = writeback
 
         self.__program_counter: int = 0
+        self.hardware_loops = HardwareLoops()
+        self.return_stack = ReturnAddressStack(self.__machine.return_stack["depth"])
+        self.fusion = MacroFusion()
         self.__instruction_register: base_instruction.BaseInstruction | None = None
+        # where the instruction in the IR was fetched from
+        self.__ir_address: int | None = None
+        # A CALL or RET in the IR changed the return address stack and hardware loops when it was fetched: what they
+        # were before, in case it has to be thrown away
+        self.__ir_checkpoint: Tuple[List[int], List[List[int]]] | None = None
+        # where the fetch stage went after the RET in the IR, and whether that came from the return address stack
+        self.__ir_prediction: Tuple[int, bool] | None = None
+        # where the fetch stage went after the conditional branch in the IR when speculating (None if it carried on)
+        self.__ir_predicted_target: int | None = None
+        # the same for the RET being executed, and the hardware loops from before it was fetched
+        self.__return_prediction: Tuple[int, bool, List[List[int]]] | None = None
         self.halt_status: int = 0
 
         self.__waiting_for_results = False
 
         # instruction to be executed in "execute" stage
         self.__instruction: BaseControlInstruction | None = None
+        # when the compare of a fused pair being executed finishes
+        self.__finish_at: int | None = None
 
     # rewrites arch registers and physical and checks for data hazards. If found, it stalls.
     # returns Tuple [is instruction a branch?, Did we change the PC early?]
@@ -164,7 +472,8 @@ class Control:
             return False, False
 
         is_new_branch = False
-        if isinstance(instruction, BranchAbsoluteTrue) or isinstance(instruction, BranchAbsoluteTrueImmediate) or isinstance(instruction, JumpAbsolute) or isinstance(instruction, JumpAbsoluteImmediate):
+        if isinstance(instruction, (BranchAbsoluteTrue, BranchAbsoluteTrueImmediate, JumpAbsolute,
+                                    JumpAbsoluteImmediate, Call, Return, FusedCompareBranch)):
             is_new_branch = True
 
         dest = instruction.get_dest()
@@ -178,79 +487,149 @@ class Control:
         if not (source_is_renamed or dest_is_renamed):
             instruction = copy.deepcopy(instruction)
             # look up the physical registers in the RAT and replace them
-            instruction.update_source_registers(self.__register_file.get_rat())
+            self.__register_file.rename_sources(instruction)
+            if self.__replay is not None:
+                instruction.trace_record = self.__replay.get_record(self.__ir_address)
             self.__instruction_register = instruction
         else:
             # we've already renamed it so must already have counted it as a branch
             is_new_branch = False
-        # if any of the source registers are being written to, we need to wait for them
+        self.__waiting_for_results = self.__is_waiting_for_sources(self.__instruction_register)
+
+        # if it's a JMP (unconditional branch) change PC here
+        if isinstance(instruction, JumpAbsolute) or isinstance(instruction, JumpAbsoluteImmediate):
+            new_pc, _ = self.__evaluate(instruction)
+            self.branch_to(new_pc)
+            return is_new_branch, new_pc != self.__program_counter
+
+        return is_new_branch, False
+
+    # if any of the source registers are being written to, we need to wait for them
+    def __is_waiting_for_sources(self, instruction: base_instruction.BaseInstruction) -> bool:
         """
         Conditions we wait:
             - a functional unit is executing an instruction that writes to a register that's used here
-            - the memory unit is about to push an action into the MEM/WB pipeline register that writes to this register
-            
-            - Result forwarding is off AND:
-                - the wb unit already has an action in its pipeline register that writes to this
-                - the memory unit is about to forward a result from EX to WB (in this case, the value is known)
+            - the memory unit has a pending action that writes to this register
+
+            - Result forwarding is off, or the bypass path from the unit that produced it is, AND:
+                - the result has been produced but not written back yet
         """
-        self.__waiting_for_results = False
-        sources = self.__instruction_register.get_sources()
+        sources = instruction.get_sources()
+        dest = instruction.get_dest()
 
         # if we aren't renaming registers, we also need to wait for the destination
-        if not flags.rename_registers and dest is not None:
+        if not self.__machine.rename_registers and dest is not None:
             sources.append(dest)
 
+        waiting = False
         for source in sources:
             alu_writing = self.__ALU.get_instruction().get_dest() == source if self.__ALU.get_instruction() is not None else False
             cu_writing = self.__instruction.get_dest() == source if self.__instruction is not None else False
             mem_writing = self.__memory.get_instruction().get_dest() == source if self.__memory.get_instruction() is not None else False
+            vec_writing = self.__vector.get_instruction().get_dest() == source if self.__vector.get_instruction() is not None else False
 
-            function_units_writing = alu_writing or cu_writing or mem_writing
-
-            # forwarded results from mem and wb units
-            wb_res = self.__writeback.forward_result(source)
-            mem_res = self.__memory.forward_result(source)
-            forwarded_result = wb_res if wb_res is not None else mem_res
+            function_units_writing = alu_writing or cu_writing or mem_writing or vec_writing
 
             # If result is still being written to in EX stage
             if function_units_writing:
-                print(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Still executing")
-                self.__waiting_for_results = True
+                if log.HAZARD.enabled:
+                    log.HAZARD.info(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Still executing")
+                waiting = True
             # if a memory action is about to cause a write to this register
             elif self.__memory.wil_change_reg(source):
-                print(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Memory result executing.")
-                self.__waiting_for_results = True
-            # it's in the EX/MEM or MEM/WB reg
-            elif forwarded_result is not None:
-                if not flags.forward_results:
-                    print(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Not Writtenback yet")
-                    self.__waiting_for_results = True
-            else:
-                continue
-
-        # if it's a JMP (unconditional branch) change PC here
-        if isinstance(instruction, JumpAbsolute) or isinstance(instruction, JumpAbsoluteImmediate):
-            new_pc, _ = instruction.execute(self.__register_file)
-            self.update_pc(new_pc)
-            return is_new_branch, new_pc != self.__program_counter
-
-        return is_new_branch, False
-
+                if log.HAZARD.enabled:
+                    log.HAZARD.info(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Memory result executing.")
+                waiting = True
+            # it's been produced, but can't be bypassed to us
+            elif not self.__bypass.can_forward(source):
+                if log.HAZARD.enabled:
+                    log.HAZARD.info(f"Hazard Check: waiting for {registers.PhysicalRegisters(source).name} to be written to. Not Writtenback yet")
+                waiting = True
+        return waiting
 
     def instruction_fetch(self) -> None:
         if self.halt_status == 1:
-            print("HALTED")
+            if log.FETCH.enabled:
+                log.FETCH.info("HALTED")
             return
 
-        print(f"fetch: {self.__program_counter}")
+        if log.FETCH.enabled:
+            log.FETCH.info(f"fetch: {self.__program_counter}")
 
         current_addr = self.__program_counter
         instruction = self.__memory.get(current_addr)
 
-        # only fetch and increment PC if the last instruction has already been decoded
+        # only fetch and increment PC if the last instruction has already been decoded.
+        # At the end of a hardware loop's body, the next instruction is the start of the body again.
         if self.is_ir_available():
-            self.update_ir(instruction)
-            self.update_pc(current_addr + 1)
+            fused = self.__fuse(instruction, current_addr)
+            self.update_ir(fused if fused is not None else instruction)
+            self.__ir_address = current_addr
+            if fused is not None:
+                if log.FETCH.enabled:
+                    log.FETCH.info(f"\t Fused with the branch at {current_addr + 1}")
+                self.update_pc(self.hardware_loops.next_pc(current_addr + 1))
+            elif isinstance(instruction, (Call, Return)):
+                self.__predict_call_or_return(instruction, current_addr)
+            elif self.__can_speculate(instruction):
+                self.__predict_branch(instruction, current_addr)
+            else:
+                self.update_pc(self.hardware_loops.next_pc(current_addr))
+
+    # A compare followed by a BRATI on its result are fetched together as one micro-op, unless a hardware loop goes
+    # back to its start between them
+    def __fuse(self, instruction, address: int) -> FusedCompareBranch | None:
+        if not self.__machine.fuse or not isinstance(instruction, FUSIBLE_COMPARES) or \
+                self.hardware_loops.ends_body(address):
+            return None
+        following = self.__memory.get(address + 1)
+        if isinstance(following, BranchAbsoluteTrueImmediate) and following.get_condition() == instruction.get_dest():
+            return FusedCompareBranch(instruction, following)
+        return None
+
+    # A CALL's target is part of the instruction, so the fetch stage goes straight there, pushing the return address.
+    # A RET goes wherever the return address stack says, or carries on to the next instruction if it's empty.
+    def __predict_call_or_return(self, instruction: Call | Return, address: int):
+        self.__ir_checkpoint = (self.return_stack.checkpoint(), self.hardware_loops.checkpoint())
+        if isinstance(instruction, Call):
+            if self.__machine.return_stack["enabled"]:
+                self.return_stack.push(address + 1)
+            self.branch_to(instruction.get_target())
+            return
+
+        predicted = self.return_stack.pop() if self.__machine.return_stack["enabled"] else None
+        if predicted is None:
+            self.__ir_prediction = (self.hardware_loops.next_pc(address), False)
+            self.update_pc(self.__ir_prediction[0])
+        else:
+            self.__ir_prediction = (predicted, True)
+            self.branch_to(predicted)
+        if log.FETCH.enabled:
+            log.FETCH.info(f"\t Return predicted to {self.__ir_prediction[0]}")
+
+    # A conditional branch that's going to be speculated past goes wherever the branch predictor says. The hardware
+    # loops from before it was fetched are kept, to go down the other path from if it was mispredicted.
+    def __predict_branch(self, instruction: BranchAbsoluteTrue | BranchAbsoluteTrueImmediate, address: int):
+        self.__ir_checkpoint = (self.return_stack.checkpoint(), self.hardware_loops.checkpoint())
+        target = instruction.get_target() if isinstance(instruction, BranchAbsoluteTrueImmediate) else None
+        self.__ir_predicted_target = self.speculation.predictor.predict(address, target)
+        if self.__ir_predicted_target is None:
+            self.update_pc(self.hardware_loops.next_pc(address))
+            return
+        if log.FETCH.enabled:
+            log.FETCH.info(f"\t Branch predicted taken to {self.__ir_predicted_target}")
+        self.branch_to(self.__ir_predicted_target)
+
+    # The instruction in the IR was fetched after a branch that's been taken: undo what fetching it did
+    def __discard_ir(self):
+        if self.__ir_checkpoint is not None:
+            (addresses, loops) = self.__ir_checkpoint
+            self.return_stack.restore(addresses)
+            self.hardware_loops.restore(loops)
+            self.__ir_checkpoint = None
+        self.__ir_prediction = None
+        self.__ir_predicted_target = None
+        self.__instruction_register = None
 
     def decode(self):
         instruction = self.__instruction_register
@@ -258,50 +637,192 @@ class Control:
         if instruction is None:
             return
 
-        print(f"decoding: {instruction}")
+        if log.DECODE.enabled:
+            log.DECODE.info(f"decoding: {instruction}")
 
         if not isinstance(instruction, base_instruction.BaseInstruction):
+            # data fetched after a branch or HALT that hasn't executed yet will be thrown away when it does
+            if not self.is_available() or self.speculation.is_active():
+                if log.DECODE.verbose:
+                    log.DECODE.debug("\t Data in IR, waiting for CU to finish")
+                return
             raise Exception("Encountered data (not instruction) within PC address")
 
-        dest = instruction.get_dest()
-        dest_is_renamed = dest is not None and isinstance(dest, registers.PhysicalRegisters)
-
-        # TODO: handle rename failed: e.g. if there weren't enough physical registers
-        # lets rename the registers
-        if flags.rename_registers and dest is not None and not dest_is_renamed:
-            print(f"\t Remapping {registers.ArchRegisters(dest).name}, for {instruction}")
-            new_dest = self.__register_file.alias_register(dest)
-            instruction.update_dest(new_dest)
-        self.__instruction_register = instruction
-
         occupied_units = sum([0 if available else 1 for available in
-                              [self.is_available(), self.__memory.is_available(), self.__ALU.is_available()]])
+                              [self.is_available(), self.__memory.is_available(), self.__ALU.is_available(),
+                               self.__vector.is_available()]])
+        # the branches being speculated past wait in the control unit without holding up what comes after them, but
+        # any other control instruction has to wait for them to resolve
+        if self.speculation.is_active() and isinstance(instruction, BaseControlInstruction):
+            occupied_units += 1
 
-        if self.__waiting_for_results:
-            print("\t Waiting for results, can't decode.")
+        # a producer that finished in this cycle's execute stage can be bypassed straight to this instruction
+        if self.__waiting_for_results and self.__machine.forward_results:
+            self.__waiting_for_results = self.__is_waiting_for_sources(self.__instruction_register)
 
-        if occupied_units == 0 and not self.__waiting_for_results:
-
-            if isinstance(instruction, alu.BaseALUInstruction):
+        if self.__waiting_for_results:
+            if log.DECODE.verbose:
+                log.DECODE.debug("\t Waiting for results, can't decode.")
+
+        # A branch that's speculated past waits for its condition in the control unit, so it can be dispatched while
+        # whatever produces the condition is still executing, as long as there aren't too many waiting already
+        speculate = self.__can_speculate(instruction) and self.is_available() and \
+            len(self.speculation.unresolved) < self.__machine.speculation["depth"]
+        if (occupied_units == 0 and not self.__waiting_for_results) or speculate:
+            dest = instruction.get_dest()
+            dest_is_renamed = dest is not None and isinstance(dest, registers.PhysicalRegisters)
+
+            # TODO: handle rename failed: e.g. if there weren't enough physical registers
+            # lets rename the registers. This is only done once the instruction is dispatched: if it's still waiting
+            # when a branch is taken it gets thrown away, and the old mapping must still be in the RAT.
+            if self.__machine.rename_registers and dest is not None and not dest_is_renamed:
+                if log.DECODE.enabled:
+                    log.DECODE.info(f"\t Remapping {registers.ArchRegisters(dest).name}, for {instruction}")
+                new_dest = self.__register_file.alias_register(dest)
+                instruction.update_dest(new_dest)
+
+            self.__bypass.record_dispatch(instruction.get_sources())
+            if self.__replay is not None:
+                self.__replay.dispatch(instruction)
+                # the branch of a fused pair is the next instruction in the trace
+                if isinstance(instruction, FusedCompareBranch):
+                    instruction.branch.trace_record = self.__replay.get_record(self.__ir_address + 1)
+                    self.__replay.dispatch(instruction.branch)
+            if self.speculation.is_active():
+                self.speculation.tag(instruction, self.__clock.get_time())
+
+            if speculate:
+                # it stays in the control unit until it resolves (see __resolve_branch)
+                checkpoint = (self.__register_file.checkpoint(), self.__ir_checkpoint[1])
+                self.speculation.start(instruction, self.__ir_address, self.__ir_predicted_target, checkpoint)
+                self.__ir_checkpoint = None
+                self.__ir_predicted_target = None
+                self.__instruction_register = None
+            elif isinstance(instruction, alu.BaseALUInstruction):
                 self.__ALU.give_instruction(instruction)
                 self.__instruction_register = None
+            elif isinstance(instruction, vector.BaseVectorInstruction):
+                self.__vector.give_instruction(instruction)
+                self.__instruction_register = None
             elif isinstance(instruction, memory.BaseMemoryInstruction):
-                self.__memory.give_instruction(instruction)
+                self.__memory.give_instruction(instruction, self.__ir_address)
                 self.__instruction_register = None
             elif isinstance(instruction, BaseControlInstruction):
+                # The fetch stage is waiting for this to leave the IR, so the PC is still the first instruction of the
+                # loop's body and nothing has been fetched from it yet
+                if isinstance(instruction, BaseLoopInstruction):
+                    count = instruction.trace_record.count if instruction.trace_record is not None else \
+                        instruction.get_count(self.__bypass)
+                    if log.DECODE.enabled:
+                        log.DECODE.info(f"\t Hardware loop: {count} iterations up to {instruction.get_end()}")
+                    self.update_pc(self.hardware_loops.start_loop(self.__program_counter, instruction.get_end(), count))
+                elif isinstance(instruction, Call):
+                    instruction.return_address = self.__ir_address + 1
+                elif isinstance(instruction, Return):
+                    (target, from_stack) = self.__ir_prediction
+                    self.__return_prediction = (target, from_stack, self.__ir_checkpoint[1])
+                self.__ir_checkpoint = None
+                self.__ir_prediction = None
                 self.give_instruction(instruction)
                 self.__instruction_register = None
             else:
                 raise Exception(f"No unit exists to execute instructions of type {type(instruction)}.")
         else:
-            print("Unit occupied, blocking")
+            if log.DECODE.verbose:
+                log.DECODE.debug("Unit occupied, blocking")
+
+    # Only conditional branches are speculated past. A replayed trace only has what was really executed in it.
+    def __can_speculate(self, instruction: base_instruction.BaseInstruction) -> bool:
+        return self.__machine.speculate and self.__machine.rename_registers and self.__replay is None and \
+            isinstance(instruction, (BranchAbsoluteTrue, BranchAbsoluteTrueImmediate))
+
+    # The oldest branch being speculated past resolves once its condition is ready and memory has finished with what
+    # came before it. If it went the other way from where the fetch stage went, everything after it is squashed and
+    # fetching starts again from where it really goes.
+    def __resolve_branch(self) -> Tuple[bool, bool, bool]:
+        branch = self.speculation.get_oldest()
+        if self.__is_waiting_for_sources(branch.instruction) or self.__memory.is_busy_with_older():
+            return False, False, False
+
+        (target, _) = self.__evaluate(branch.instruction)
+        self.speculation.predictor.update(branch.address, target, target == branch.predicted)
+        if target == branch.predicted:
+            self.speculation.commit()
+            return True, False, False
+
+        if log.CU.enabled:
+            log.CU.info(f"\t Branch mispredicted, squashing what was dispatched after it")
+        self.__discard_ir()
+        self.__squash()
+        if target is not None:
+            self.branch_to(target)
+        else:
+            self.update_pc(self.hardware_loops.next_pc(branch.address))
+        return True, True, False
+
+    # The oldest branch being speculated past was mispredicted: throw away everything dispatched after it, younger
+    # branches included, and put the register alias table and hardware loops back the way they were before it
+    def __squash(self):
+        tags = [branch.tag for branch in self.speculation.unresolved]
+        # the younger branches haven't executed either
+        unfinished = len(tags) - 1 + sum(1 for instruction in [self.__ALU.get_instruction(),
+                                                               self.__memory.get_instruction(),
+                                                               self.__vector.get_instruction()]
+                                         if instruction is not None and instruction.speculation_tag in tags)
+        for tag in tags:
+            for unit in (self.__ALU, self.__memory, self.__vector, self.__writeback, self.__bypass):
+                unit.squash(tag)
+        (rat, loops) = self.speculation.squash(self.__clock.get_time(), unfinished).checkpoint
+        self.__register_file.restore(rat)
+        self.hardware_loops.restore(loops)
+        self.__waiting_for_results = False
+
+    # the return address goes back through the memory unit, like an ALU result
+    def __write_link(self, instruction: Call):
+        action = writeback.WriteBackAction(instruction.get_dest(), instruction.return_address)
+        if log.CU.enabled:
+            log.CU.info(f"\t Link: {action.reg.name} <- {action.data}")
+        self.__memory.pass_to_wb(action)
+        self.__bypass.publish(action, "cu")
+
+    # Returns where to go if the fetch stage went the wrong way after the return, or None if it got it right
+    def __resolve_return(self, target: int) -> int | None:
+        (predicted, from_stack, loops) = self.__return_prediction
+        self.__return_prediction = None
+        self.return_stack.resolve(from_stack, target == predicted)
+        if target == predicted:
+            return None
+        if log.CU.enabled:
+            log.CU.info(f"\t Return mispredicted: went to {predicted} instead of {target}")
+        # the loops are as they were before the fetch stage followed the prediction
+        self.__discard_ir()
+        self.hardware_loops.restore(loops)
+        return target
+
+    # Returns [new PC, halt]. A replayed instruction does whatever the trace says it did.
+    def __evaluate(self, instruction: BaseControlInstruction) -> Tuple[int | None, int | None]:
+        record = instruction.trace_record
+        if record is None:
+            return instruction.execute(self.__bypass)
+        return record.target, 1 if record.halt else None
+
+    def get_pc(self) -> int:
+        return self.__program_counter
 
     def update_pc(self, new_val: int):
         self.__program_counter = new_val
 
+    # a jump or taken branch, which may leave hardware loops
+    def branch_to(self, new_pc: int):
+        self.update_pc(new_pc)
+        self.hardware_loops.leave(new_pc)
+
     def update_ir(self, inst: base_instruction.BaseInstruction | None):
         self.__instruction_register = inst
 
+    def get_ir(self) -> base_instruction.BaseInstruction | None:
+        return self.__instruction_register
+
     # has the last instruction been dispatched to the relevant unit already?
     def is_ir_available(self) -> bool:
         return self.__instruction_register is None
@@ -309,29 +830,57 @@ class Control:
     def give_instruction(self, instruction: BaseControlInstruction):
         self.__instruction = instruction
 
+    def get_instruction(self) -> BaseControlInstruction | None:
+        return self.__instruction
+
     # is the Control unit available to execute a new instruction?
     def is_available(self):
         return self.__instruction is None
 
     # return Tuple [did CU execute ins?, was PC changed?, was HALT encountered?]
     def execute(self) -> Tuple[bool, bool, bool]:
+        # nothing else is given to the control unit while there are branches to resolve
+        if self.speculation.is_active():
+            return self.__resolve_branch()
+
         if self.__instruction is None:
             return False, False, False
 
-        print(f"CU execute: {self.__instruction}")
+        if log.CU.enabled:
+            log.CU.info(f"CU execute: {self.__instruction}")
 
         if isinstance(self.__instruction, JumpAbsoluteImmediate) or isinstance(self.__instruction, JumpAbsolute):
-            print(f"\t JMP already evaluated at Decode Stage, doing nothing")
+            if log.CU.enabled:
+                log.CU.info(f"\t JMP already evaluated at Decode Stage, doing nothing")
             self.__instruction = None
             return True, False, False
 
+        if isinstance(self.__instruction, BaseLoopInstruction):
+            if log.CU.enabled:
+                log.CU.info(f"\t Hardware loop already set up at Decode Stage, doing nothing")
+            self.__instruction = None
+            return True, False, False
+
+        if isinstance(self.__instruction, FusedCompareBranch):
+            return self.__execute_fused(self.__instruction)
+
         # wait for memory to be available
         if not self.__memory.is_mem_busy():
-            new_pc, new_halt = self.__instruction.execute(self.__register_file)
-
-            if new_pc is not None and new_pc != self.__program_counter:
-                print(f"\t PC value changed.")
-                self.update_pc(new_pc)
+            new_pc, new_halt = self.__evaluate(self.__instruction)
+            if isinstance(self.__instruction, Call):
+                self.__write_link(self.__instruction)
+                # the fetch stage has already gone to the subroutine
+                new_pc = None
+            elif isinstance(self.__instruction, Return):
+                new_pc = self.__resolve_return(new_pc)
+
+            if new_pc is not None:
+                # whatever was fetched after it is thrown away
+                self.__discard_ir()
+                if new_pc != self.__program_counter:
+                    if log.CU.enabled:
+                        log.CU.info(f"\t PC value changed.")
+                    self.branch_to(new_pc)
             if new_halt is not None:
                 self.halt_status = new_halt
 
@@ -340,3 +889,35 @@ class Control:
             return True, (new_pc is not None), (new_halt is not None)
 
         return False, False, False
+
+    # The compare takes as long as it would on the ALU, and its result goes back through the memory unit like an ALU
+    # result. The branch is resolved from it straight away.
+    def __execute_fused(self, instruction: FusedCompareBranch) -> Tuple[bool, bool, bool]:
+        if self.__finish_at is None:
+            self.__finish_at = self.__clock.get_time() + self.__machine.get_latency(instruction.compare)
+        if self.__clock.get_time() + 1 < self.__finish_at or self.__memory.is_mem_busy():
+            return False, False, False
+
+        # a replayed pair's result isn't needed, only where the branch went
+        if instruction.trace_record is not None:
+            action = writeback.WriteBackAction(instruction.get_dest(), 0)
+            new_pc = instruction.branch.trace_record.target
+        else:
+            action = instruction.get_result(self.__bypass)
+            new_pc = instruction.resolve(action.data)
+        action.tag = instruction.speculation_tag
+        if log.CU.enabled:
+            log.CU.info(f"\t Fused compare: {registers.PhysicalRegisters(action.reg).name} <- {action.data}")
+        self.__memory.pass_to_wb(action)
+        self.__bypass.publish(action, "cu")
+        self.__ALU.count_operation(instruction.compare)
+        self.fusion.record(new_pc is not None)
+
+        if new_pc is not None:
+            self.__discard_ir()
+            if log.CU.enabled:
+                log.CU.info(f"\t PC value changed.")
+            self.branch_to(new_pc)
+        self.__finish_at = None
+        self.__instruction = None
+        return True, (new_pc is not None), False
@@ -0,0 +1,160 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from typing import List, TextIO, Tuple
+
+import log
+import multicore
+import processor
+import registers
+from src.base_instruction import BaseInstruction
+
+"""
+A live view of a running simulation, redrawn in place in the terminal with ANSI escape codes.
+
+Drawing is done on its own thread at a fixed frame rate, so watching a run costs the simulation next to nothing: when a
+frame is due, the drawing thread asks for a snapshot, and the simulation copies what's shown (registers, what each
+stage is working on and the counters) the next time it finishes a cycle. It never waits for the terminal, and frames
+are only as out of date as the cycle they were taken in. The simulation's own output is turned off while it's shown.
+"""
+
+# registers per row
+COLUMNS = 4
+# elements of a vector register that are shown
+VECTOR_ELEMENTS = 4
+# longest a scalar value can be before it's cut short
+VALUE_WIDTH = 12
+
+
+# What one core looked like at the end of a cycle
+class Snapshot:
+    def __init__(self, core: processor.Processor):
+        control_unit = core.control_unit
+        self.core_id = core.core_id
+        self.time = core.clock.get_time()
+        self.pc = control_unit.get_pc()
+        self.ir = control_unit.get_ir()
+        # the pipeline latches: what each unit is executing
+        self.stages: List[Tuple[str, BaseInstruction | None]] = [
+            ("CU", control_unit.get_instruction()),
+            ("ALU", core.alu.get_instruction()),
+            ("MEM", core.memory_unit.get_instruction()),
+            ("VEC", core.vector_unit.get_instruction()),
+        ]
+        self.memory_busy = core.memory_unit.is_mem_busy()
+        self.pending_writes = [(registers.PhysicalRegisters(action.reg).name, action.data)
+                               for action in core.write_back.get_pending()]
+        self.rat = list(core.register_file.get_rat())
+        self.values = core.register_file.get_physical_values()
+
+        self.instructions = core.inst_count
+        self.branches = core.num_branches
+        self.mispredicts = core.num_mispredicts
+        self.halted = core.halted
+
+
+def format_instruction(instruction: BaseInstruction | None) -> str:
+    return "-" if instruction is None else type(instruction).__name__
+
+
+def format_value(value) -> str:
+    if isinstance(value, list):
+        shown = ", ".join(str(element) for element in value[:VECTOR_ELEMENTS])
+        return f"[{shown}{', ...' if len(value) > VECTOR_ELEMENTS else ''}]"
+    text = str(value)
+    return text if len(text) <= VALUE_WIDTH else text[:VALUE_WIDTH - 3] + "..."
+
+
+class Dashboard:
+    def __init__(self, cores: List[processor.Processor], frame_rate: float = 10, out: TextIO | None = None):
+        if frame_rate <= 0:
+            raise Exception(f"The dashboard's frame rate has to be positive, not {frame_rate}.")
+        self.__cores = cores
+        self.__frame_time = 1 / frame_rate
+        self.__out = out if out is not None else sys.stdout
+
+        # set by the drawing thread when it wants a new snapshot
+        self.__wanted = threading.Event()
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__snapshots: List[Snapshot] | None = None
+        # (host time, simulated cycles) at the last frame, for the simulation rate
+        self.__last_frame: Tuple[float, int] | None = None
+        self.__rate = 0.0
+
+    # Called by the simulation after every cycle
+    def poll(self):
+        if not self.__wanted.is_set():
+            return
+        snapshots = [Snapshot(core) for core in self.__cores]
+        with self.__lock:
+            self.__snapshots = snapshots
+        self.__wanted.clear()
+
+    # Runs the simulation to the end while drawing it. Its statistics aren't printed.
+    def run(self, target: processor.Processor | multicore.MultiCore):
+        thread = threading.Thread(target=self.__draw_frames, daemon=True)
+        self.__out.write("\x1b[?25l\x1b[2J")
+        self.__wanted.set()
+        thread.start()
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), log.silenced():
+                while target.is_running():
+                    target.step()
+                    self.poll()
+        finally:
+            self.__stop.set()
+            thread.join()
+            # the last frame shows how the run ended
+            self.__wanted.set()
+            self.poll()
+            self.__draw()
+            self.__out.write("\x1b[?25h")
+            self.__out.flush()
+
+    def __draw_frames(self):
+        while not self.__stop.wait(self.__frame_time):
+            self.__draw()
+            self.__wanted.set()
+
+    def __draw(self):
+        with self.__lock:
+            snapshots = self.__snapshots
+        if snapshots is None:
+            return
+
+        now = time.perf_counter()
+        cycles = max(snapshot.time for snapshot in snapshots)
+        if self.__last_frame is not None and now > self.__last_frame[0]:
+            self.__rate = (cycles - self.__last_frame[1]) / (now - self.__last_frame[0])
+        self.__last_frame = (now, cycles)
+
+        lines = [f"{cycles} cycles ({self.__rate:.0f} cycles/s)", ""]
+        for snapshot in snapshots:
+            lines += self.__render(snapshot)
+        # go back to the top, overwrite each line and clear whatever's left of the last frame
+        self.__out.write("\x1b[H" + "".join(f"{line}\x1b[K\n" for line in lines) + "\x1b[J")
+        self.__out.flush()
+
+    @staticmethod
+    def __render(snapshot: Snapshot) -> List[str]:
+        state = "halted" if snapshot.halted else "running"
+        lines = [f"========== core {snapshot.core_id} ({state}) ==========",
+                 f"t={snapshot.time}  PC={snapshot.pc}  IR: {format_instruction(snapshot.ir)}",
+                 "  ".join(f"{name}: {format_instruction(instruction)}" for (name, instruction) in snapshot.stages)
+                 + f"  memory: {'busy' if snapshot.memory_busy else 'idle'}",
+                 "write-back: " + (", ".join(f"{reg} <- {format_value(data)}"
+                                             for (reg, data) in snapshot.pending_writes) or "-")]
+
+        mispredicted = f"{snapshot.mispredicts}/{snapshot.branches}" if snapshot.branches != 0 else "0"
+        cpi = f"{snapshot.time / snapshot.instructions:.3f}" if snapshot.instructions != 0 else "-"
+        lines.append(f"instructions: {snapshot.instructions}  CPI: {cpi}  mispredicts: {mispredicted}")
+
+        cells = [f"{reg.name:>5} (P{snapshot.rat[reg]:<2}) {format_value(snapshot.values[snapshot.rat[reg]]):<{VALUE_WIDTH}}"
+                 for reg in registers.ArchRegisters]
+        for row in range(0, len(cells), COLUMNS):
+            lines.append(" ".join(cells[row:row + COLUMNS]))
+        lines.append("")
+        return lines
@@ -0,0 +1,112 @@
+import ast
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Tuple
+
+"""
+Bulk data files that can be mapped into memory before a program runs, or dumped from memory after it halts.
+    .npy    NumPy arrays of integers (any shape, C order). Read and written without needing NumPy.
+    other   raw little-endian signed 64-bit words
+"""
+
+NPY_MAGIC = b"\x93NUMPY"
+
+# NumPy dtype (without byte order) -> array typecode
+_npy_types: Dict[str, str] = {
+    "i1": "b", "u1": "B",
+    "i2": "h", "u2": "H",
+    "i4": "i", "u4": "I",
+    "i8": "q", "u8": "Q",
+}
+
+
+def _from_little_endian(words: array) -> array:
+    if sys.byteorder != "little":
+        words.byteswap()
+    return words
+
+
+def _read_npy(data: bytes, path: Path) -> array:
+    # version 1 has a 2 byte header length, later versions have 4
+    if data[6] == 1:
+        (header_len,) = struct.unpack_from("<H", data, 8)
+        header_start = 10
+    else:
+        (header_len,) = struct.unpack_from("<I", data, 8)
+        header_start = 12
+    header = ast.literal_eval(data[header_start:header_start + header_len].decode("latin1"))
+
+    descr: str = header["descr"]
+    byte_order = descr[0]
+    dtype = descr[1:]
+    if dtype not in _npy_types:
+        raise Exception(f"{path}: only integer arrays can be loaded into memory, not {descr}.")
+    if header["fortran_order"]:
+        raise Exception(f"{path}: Fortran-ordered arrays aren't supported, save it in C order.")
+
+    words = array(_npy_types[dtype], data[header_start + header_len:])
+    file_byte_order = "big" if byte_order == ">" else "little"
+    if words.itemsize > 1 and file_byte_order != sys.byteorder:
+        words.byteswap()
+
+    if words.typecode == "Q":
+        # unsigned 64-bit values are reinterpreted, so those from 2^63 up wrap around like memory does
+        return array("q", words.tobytes())
+    return words if words.typecode == "q" else array("q", words)
+
+
+def read_data_file(path: str | Path) -> array:
+    path = Path(path)
+    data = path.read_bytes()
+
+    if data.startswith(NPY_MAGIC):
+        return _read_npy(data, path)
+
+    if len(data) % 8 != 0:
+        raise Exception(f"{path}: raw data files must contain 64-bit words, but it is {len(data)} bytes long.")
+    return _from_little_endian(array("q", data))
+
+
+def write_data_file(path: str | Path, words: array):
+    path = Path(path)
+    data = array("q", words)
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    with open(path, "wb") as fh:
+        if path.suffix == ".npy":
+            header = f"{{'descr': '<i8', 'fortran_order': False, 'shape': ({len(data)},), }}"
+            # the header is padded so that the data is 64-byte aligned
+            padding = (64 - (len(NPY_MAGIC) + 4 + len(header) + 1) % 64) % 64
+            header = header + " " * padding + "\n"
+            fh.write(NPY_MAGIC + bytes([1, 0]) + struct.pack("<H", len(header)) + header.encode("latin1"))
+        fh.write(data.tobytes())
+
+
+# Resolves an address given on the command line: either a hex value or a label from the program's symbol table.
+def parse_address(address: str, symbols: Dict[str, int]) -> int:
+    if address in symbols:
+        return symbols[address]
+    try:
+        return int(address, 16)
+    except ValueError:
+        raise Exception(f"\"{address}\" is neither a label in the program nor a hex address.")
+
+
+# FILE@ADDRESS
+def parse_load(spec: str, symbols: Dict[str, int]) -> Tuple[Path, int]:
+    if "@" not in spec:
+        raise Exception(f"Expected FILE@ADDRESS, not \"{spec}\".")
+    [path, address] = spec.rsplit("@", 1)
+    return Path(path), parse_address(address, symbols)
+
+
+# ADDRESS:LENGTH@FILE
+def parse_dump(spec: str, symbols: Dict[str, int]) -> Tuple[int, int, Path]:
+    if "@" not in spec or ":" not in spec.split("@", 1)[0]:
+        raise Exception(f"Expected ADDRESS:LENGTH@FILE, not \"{spec}\".")
+    [region, path] = spec.split("@", 1)
+    [address, length] = region.rsplit(":", 1)
+    return parse_address(address, symbols), int(length, 16), Path(path)
@@ -0,0 +1,135 @@
+from typing import Dict, List, Tuple
+
+import machine
+
+"""
+DRAM timing behind the memory unit (or, in a multicore system, behind the bus), in place of a flat memory latency.
+Memory is split into channels, each with its own data bus, and each channel into banks. A bank keeps the last row it
+opened in its row buffer (an open-page policy), so how long an access takes depends on what the bank did last:
+
+    row hit         the row is already open: just the column access, tCAS
+    row empty       nothing is open yet: open the row (tRCD) and then tCAS
+    row conflict    another row is open: close it (tRP), then tRCD and tCAS
+
+plus the controller's own latency on the way in, and tBURST cycles for the word on the channel's data bus, which
+carries one word at a time. Column accesses to an open row can be issued every tBURST cycles, so a run of row hits is
+pipelined, whereas opening a row holds the bank up.
+
+Word addresses are mapped so that consecutive words share a row: [row | bank | channel | column]. A sequential walk
+through an array therefore hits the open row almost every time, and moves on to the next bank when it leaves it,
+while random accesses mostly conflict.
+
+Requests that arrive together (the words of a vector access or of a cache line, and the prefetches a load triggers)
+are queued and scheduled FR-FCFS: requests that hit an open row go first, oldest first, then the oldest of the rest.
+With `scheduler = "FCFS"` they're simply taken in order.
+"""
+
+
+class Bank:
+    def __init__(self):
+        self.open_row: int | None = None
+        # when the next command can be issued to the bank
+        self.ready_at = 0
+
+
+class DRAM:
+    def __init__(self, machine_config: machine.MachineConfig | None = None):
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.__settings = self.__machine.dram
+        channels = self.__settings["channels"]
+        self.__banks: List[List[Bank]] = [[Bank() for _ in range(self.__settings["banks"])] for _ in range(channels)]
+        # when each channel's data bus is free
+        self.__bus_free: List[int] = [0] * channels
+
+        self.reads = 0
+        self.writes = 0
+        self.row_hits = 0
+        self.row_empty = 0
+        self.row_conflicts = 0
+        # cycles from requests arriving to their word being transferred
+        self.total_latency = 0
+
+    # word address -> (channel, bank, row)
+    def map_address(self, address: int) -> Tuple[int, int, int]:
+        rest = address // self.__settings["row_words"]
+        channel = rest % self.__settings["channels"]
+        rest //= self.__settings["channels"]
+        return channel, rest % self.__settings["banks"], rest // self.__settings["banks"]
+
+    # Requests of (address, is it a write?) that arrive together at `now`. Returns the cycle each one's word has been
+    # transferred by, in the order they were given.
+    def access(self, requests: List[Tuple[int, bool]], now: int) -> List[int]:
+        arrival = now + self.__settings["controller_latency"]
+        queue = [(idx, address, is_write, self.map_address(address))
+                 for (idx, (address, is_write)) in enumerate(requests)]
+        done = [0] * len(requests)
+        while len(queue) > 0:
+            chosen = self.__choose(queue)
+            (idx, address, is_write, location) = queue.pop(chosen)
+            done[idx] = self.__issue(location, arrival)
+            self.total_latency += done[idx] - now
+            if is_write:
+                self.writes += 1
+            else:
+                self.reads += 1
+        return done
+
+    # the position in the queue of the next request to issue
+    def __choose(self, queue: List[Tuple[int, int, bool, Tuple[int, int, int]]]) -> int:
+        if self.__settings["scheduler"] == "FR-FCFS":
+            for (position, (_, _, _, (channel, bank, row))) in enumerate(queue):
+                if self.__banks[channel][bank].open_row == row:
+                    return position
+        return 0
+
+    # Returns when the word has been transferred
+    def __issue(self, location: Tuple[int, int, int], arrival: int) -> int:
+        (channel, bank_number, row) = location
+        bank = self.__banks[channel][bank_number]
+        start = max(arrival, bank.ready_at)
+        if bank.open_row == row:
+            self.row_hits += 1
+            column_at = start
+        elif bank.open_row is None:
+            self.row_empty += 1
+            column_at = start + self.__settings["t_rcd"]
+        else:
+            self.row_conflicts += 1
+            column_at = start + self.__settings["t_rp"] + self.__settings["t_rcd"]
+        bank.open_row = row
+        bank.ready_at = column_at + self.__settings["t_burst"]
+
+        transfer_at = max(column_at + self.__settings["t_cas"], self.__bus_free[channel])
+        self.__bus_free[channel] = transfer_at + self.__settings["t_burst"]
+        return self.__bus_free[channel]
+
+    def get_requests(self) -> int:
+        return self.reads + self.writes
+
+    def get_row_hit_rate(self) -> float:
+        return self.row_hits / self.get_requests() if self.get_requests() != 0 else 0
+
+    # words per cycle over the whole run, and the most the channels could carry
+    def get_bandwidth(self, cycles: int) -> Tuple[float, float]:
+        peak = self.__settings["channels"] / self.__settings["t_burst"]
+        return (self.get_requests() / cycles if cycles != 0 else 0), peak
+
+    def get_statistics(self, cycles: int) -> Dict[str, float]:
+        requests = self.get_requests()
+        return {"reads": self.reads, "writes": self.writes, "row_hits": self.row_hits, "row_empty": self.row_empty,
+                "row_conflicts": self.row_conflicts, "row_hit_rate": self.get_row_hit_rate(),
+                "average_latency": self.total_latency / requests if requests != 0 else 0,
+                "bandwidth": self.get_bandwidth(cycles)[0]}
+
+    def print_statistics(self, cycles: int, word_bits: int):
+        requests = self.get_requests()
+        if requests == 0:
+            return
+        (bandwidth, peak) = self.get_bandwidth(cycles)
+        # words per cycle -> GB/s at the machine's clock frequency
+        scale = word_bits / 8 * self.__machine.energy["frequency_mhz"] * 1e6 / 1e9
+        print(f"DRAM: {requests} requests ({self.reads} reads, {self.writes} writes), "
+              f"{100 * self.get_row_hit_rate():.1f}% row hits, {100 * self.row_empty / requests:.1f}% row empty, "
+              f"{100 * self.row_conflicts / requests:.1f}% row conflicts, average latency "
+              f"{self.total_latency / requests:.1f} cycles")
+        print(f"\t bandwidth {bandwidth * scale:.3f} GB/s, {100 * bandwidth / peak:.1f}% of the peak {peak * scale:.1f} GB/s")
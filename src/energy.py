@@ -0,0 +1,112 @@
+from typing import Any, Dict, List
+
+import instructions
+import machine
+
+"""
+Activity-based energy estimate. Each core counts the events that cost energy as it runs (register file reads and
+writes, register alias table lookups and updates, ALU operations by type, vector elements, memory words (including
+prefetches) and write-backs), which are multiplied by the energy of each event from the machine description's [energy] section. A
+leakage energy every cycle stands in for everything that isn't counted.
+
+Energies are in picojoules, so with the default table a run's total is in the nanojoules to microjoules.
+"""
+
+# instruction class -> mnemonic
+MNEMONICS: Dict[type, str] = {inst.value[1]: inst.value[0] for inst in instructions.Instructions}
+
+
+# What a core did during a run. The core is a processor.Processor, which needs this module to report its energy.
+class Activity:
+    def __init__(self, core):
+        self.cycles = core.clock.get_time()
+        self.instructions = core.inst_count
+        self.register_reads = core.bypass_network.get_register_reads()
+        self.bypass_reads = sum(core.bypass_network.get_uses().values())
+        self.register_writes = core.register_file.writes
+        self.rename_lookups = core.register_file.rat_reads
+        self.rename_writes = core.register_file.rat_writes
+        self.alu_operations: Dict[str, int] = {MNEMONICS[cls]: count for (cls, count) in core.alu.operations.items()}
+        self.vector_elements = core.vector_unit.elements
+        self.memory_reads = core.memory_unit.reads
+        self.memory_writes = core.memory_unit.writes
+        # prefetched words are read from memory too, whether they're used or not
+        prefetcher = core.memory_unit.prefetcher
+        self.prefetches = prefetcher.issued if prefetcher is not None else 0
+        self.write_backs = core.write_back.writes
+
+
+class EnergyReport:
+    def __init__(self, activities: List[Activity], machine_config: machine.MachineConfig):
+        table = machine_config.energy
+        operations = machine_config.operation_energy
+        # the cores run side by side
+        self.cycles = max(activity.cycles for activity in activities)
+        self.instructions = sum(activity.instructions for activity in activities)
+        # seconds
+        self.time = self.cycles / (table["frequency_mhz"] * 1e6)
+
+        # picojoules, by where they went
+        self.breakdown: Dict[str, float] = {
+            "instructions": 0.0, "register file": 0.0, "bypass": 0.0, "rename": 0.0, "alu": 0.0, "vector": 0.0,
+            "memory": 0.0, "write-back": 0.0, "leakage": 0.0,
+        }
+        for activity in activities:
+            self.breakdown["instructions"] += activity.instructions * table["instruction"]
+            self.breakdown["register file"] += activity.register_reads * table["register_read"] + \
+                activity.register_writes * table["register_write"]
+            self.breakdown["bypass"] += activity.bypass_reads * table["bypass_read"]
+            self.breakdown["rename"] += activity.rename_lookups * table["rename_lookup"] + \
+                activity.rename_writes * table["rename_write"]
+            self.breakdown["alu"] += sum(count * operations.get(mnemonic, table["alu"])
+                                         for (mnemonic, count) in activity.alu_operations.items())
+            self.breakdown["vector"] += activity.vector_elements * table["vector_element"]
+            self.breakdown["memory"] += (activity.memory_reads + activity.prefetches) * table["memory_read"] + \
+                activity.memory_writes * table["memory_write"]
+            self.breakdown["write-back"] += activity.write_backs * table["write_back"]
+            # every core leaks for as long as the whole system runs
+            self.breakdown["leakage"] += self.cycles * table["leakage"]
+        # picojoules
+        self.energy = sum(self.breakdown.values())
+
+    def get_energy_per_instruction(self) -> float:
+        return self.energy / self.instructions if self.instructions != 0 else 0
+
+    # watts
+    def get_power(self) -> float:
+        return self.energy * 1e-12 / self.time if self.time != 0 else 0
+
+    # energy-delay product, in joule-seconds: lower is better, and it doesn't favour a design that saves energy by
+    # being much slower
+    def get_edp(self) -> float:
+        return self.energy * 1e-12 * self.time
+
+    def get_statistics(self) -> Dict[str, float]:
+        return {"energy_pj": self.energy, "energy_per_instruction_pj": self.get_energy_per_instruction(),
+                "power_w": self.get_power(), "edp_js": self.get_edp()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"cycles": self.cycles, "instructions": self.instructions, "time": self.time,
+                "breakdown": dict(self.breakdown)}
+
+    # a report saved with to_dict, without the run it came from
+    @staticmethod
+    def from_dict(saved: Dict[str, Any]) -> "EnergyReport":
+        report = EnergyReport.__new__(EnergyReport)
+        report.cycles = saved["cycles"]
+        report.instructions = saved["instructions"]
+        report.time = saved["time"]
+        report.breakdown = dict(saved["breakdown"])
+        report.energy = sum(report.breakdown.values())
+        return report
+
+    def print_report(self):
+        print(f"Energy: {self.energy / 1000:.1f} nJ ({self.get_energy_per_instruction():.1f} pJ per instruction), "
+              f"average power {1000 * self.get_power():.1f} mW, energy-delay product {self.get_edp():.3e} Js")
+        parts = [f"{part} {100 * energy / self.energy:.1f}%" for (part, energy) in self.breakdown.items()
+                 if energy != 0]
+        print(f"\t {', '.join(parts)}")
+
+
+def estimate(cores: List, machine_config: machine.MachineConfig) -> EnergyReport:
+    return EnergyReport([Activity(core) for core in cores], machine_config)
@@ -1,3 +1,7 @@
 pipeline = True
 rename_registers = True
 forward_results = True
+speculate = False
+fuse = False
+# which functional units' results are bypassed straight back to the execute stage when forwarding results
+bypass_paths = {"alu": True, "mem": True, "vec": True, "cu": True}
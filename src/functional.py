@@ -0,0 +1,183 @@
+from typing import Callable, List
+
+import alu
+import base_instruction
+import control
+import machine
+import memory
+import objectfile
+import processor
+import registers
+import storage
+import tracefile
+import translator
+import vector
+
+
+# Register file for the functional simulator: architectural registers only, no renaming or timing.
+class FunctionalRegisterFile:
+    def __init__(self):
+        self.__registers = [0] * len(registers.ArchRegisters)
+
+    def get_register_value(self, register: registers.ArchRegisters) -> int:
+        return self.__registers[register]
+
+    def set_register_value(self, register: registers.ArchRegisters, new_val: int):
+        self.__registers[register] = new_val
+
+    def get_registers(self) -> List[int]:
+        return list(self.__registers)
+
+    # the registers themselves, for translated code to use directly
+    def get_values(self) -> List[int]:
+        return self.__registers
+
+
+# Called for every executed instruction with (pc, instruction, the memory addresses it accessed, if any)
+Observer = Callable[[int, base_instruction.BaseInstruction, List[int]], None]
+
+
+# Executes a program one instruction at a time, with no pipeline: only the architectural state is modelled.
+# This is much faster than the Processor, and gives the result that any pipeline configuration should reach.
+class FunctionalSimulator:
+    def __init__(self, program: List[base_instruction.BaseInstruction | int] | objectfile.ObjectFile,
+                 memory_size: int = 1 << 24, word_bits: int = 64, machine_config: machine.MachineConfig | None = None,
+                 core_id: int = 0, cores: int = 1, entry: int = 0, translate: bool = False):
+        self.register_file = FunctionalRegisterFile()
+        self.register_file.set_register_value(registers.ArchRegisters.CORE, core_id)
+        self.register_file.set_register_value(registers.ArchRegisters.CORES, cores)
+        # only the vector length matters here, nothing is timed
+        self.__max_vector_length = (machine_config if machine_config is not None else
+                                    machine.MachineConfig()).max_vector_length
+        self.storage = storage.Storage(memory_size, word_bits=word_bits)
+        processor.preload_storage(self.storage, program)
+
+        self.pc = entry
+        self.hardware_loops = control.HardwareLoops()
+        self.halted = False
+        self.inst_count = 0
+        # every executed instruction is recorded here, if it's set
+        self.trace: tracefile.TraceWriter | None = None
+        # Basic blocks are compiled to Python as they're reached. They're translated from the object file, so a program
+        # that's already been decoded is always interpreted.
+        self.translator = translator.BlockTranslator(self.storage, program) \
+            if translate and isinstance(program, objectfile.ObjectFile) else None
+
+    # executes one instruction, then tells the observer what was executed
+    def step(self, observer: Observer | None = None):
+        instruction = self.storage.get(self.pc)
+        if not isinstance(instruction, base_instruction.BaseInstruction):
+            raise Exception(f"Encountered data (not instruction) at PC {self.pc}")
+
+        addresses: List[int] = []
+        next_pc = None
+        record = tracefile.TraceRecord(self.pc)
+
+        if isinstance(instruction, alu.BaseALUInstruction):
+            action = instruction.execute(self.register_file)
+            self.register_file.set_register_value(action.reg, action.data)
+
+        elif isinstance(instruction, vector.BaseVectorInstruction):
+            record.count = instruction.get_length(self.register_file, self.__max_vector_length)
+            action = instruction.execute(self.register_file, self.__max_vector_length)
+            self.register_file.set_register_value(action.reg, action.data)
+
+        elif isinstance(instruction, memory.BaseMemoryInstruction):
+            action = instruction.execute(self.register_file, None)
+            address = action.address
+            record.address = address
+            addresses = [address]
+            if action.count is not None:
+                count = max(0, min(action.count, self.__max_vector_length))
+                (record.count, record.stride) = (count, action.stride)
+                addresses = [address + idx * action.stride for idx in range(count)]
+                if action.register is not None:
+                    value = [self.storage.get(addr) for addr in addresses]
+                    self.register_file.set_register_value(action.register,
+                                                          vector.make_vector(value, self.__max_vector_length))
+                else:
+                    for (addr, data) in zip(addresses, action.data):
+                        self.__store(addr, data)
+            elif action.register is not None:
+                self.register_file.set_register_value(action.register, self.storage.get(address))
+            else:
+                self.__store(address, action.data)
+
+        elif isinstance(instruction, control.BaseLoopInstruction):
+            record.count = instruction.get_count(self.register_file)
+            next_pc = self.hardware_loops.start_loop(self.pc + 1, instruction.get_end(), record.count)
+
+        elif isinstance(instruction, control.BaseControlInstruction):
+            (new_pc, halt) = instruction.execute(self.register_file)
+            if isinstance(instruction, control.Call):
+                self.register_file.set_register_value(instruction.get_dest(), self.pc + 1)
+            if new_pc is not None:
+                next_pc = new_pc
+                record.target = new_pc
+                self.hardware_loops.leave(new_pc)
+            if halt is not None:
+                self.halted = True
+                record.halt = True
+
+        else:
+            raise Exception(f"No unit exists to execute instructions of type {type(instruction)}.")
+
+        if observer is not None:
+            observer(self.pc, instruction, addresses)
+        if self.trace is not None:
+            self.trace.write(record)
+
+        self.inst_count += 1
+        if not self.halted:
+            self.pc = next_pc if next_pc is not None else self.hardware_loops.next_pc(self.pc)
+
+    # a store may overwrite translated code, which then has to be translated again
+    def __store(self, address: int, data: int):
+        self.storage.set(address, data)
+        if self.translator is not None:
+            self.translator.invalidate(address)
+
+    # runs until HALT (or the instruction limit). Returns the number of instructions executed.
+    def run(self, observer: Observer | None = None, max_instructions: int | None = None) -> int:
+        # every instruction has to be seen by the observer and the trace, so they can't be run as blocks
+        if self.translator is not None and observer is None and self.trace is None:
+            return self.__run_translated(max_instructions)
+
+        while not self.halted and (max_instructions is None or self.inst_count < max_instructions):
+            self.step(observer)
+        return self.inst_count
+
+    def __run_translated(self, max_instructions: int | None) -> int:
+        statistics = self.translator.statistics
+        register_values = self.register_file.get_values()
+        code = self.translator.get_code_addresses()
+
+        block = None
+        while not self.halted and (max_instructions is None or self.inst_count < max_instructions):
+            # the last block remembers where it went before, so it doesn't need to be looked up again
+            next_block = block.successors.get(self.pc) if block is not None else None
+            if next_block is not None and next_block.valid:
+                statistics.chained += 1
+            else:
+                next_block = self.translator.lookup(self.pc)
+                if next_block is not None and block is not None:
+                    block.successors[self.pc] = next_block
+
+            # interpret anything that can't be translated, and the last few instructions before the limit
+            if next_block is None or (max_instructions is not None and
+                                      self.inst_count + next_block.length > max_instructions):
+                self.step()
+                statistics.interpreted_instructions += 1
+                block = None
+                continue
+
+            block = next_block
+            (target, count) = block.function(register_values, self.storage, code, self.translator.invalidate)
+            self.inst_count += count
+            statistics.translated_instructions += count
+            if target is not None:
+                self.hardware_loops.leave(target)
+                self.pc = target
+            else:
+                self.pc = self.hardware_loops.next_pc(block.start + count - 1)
+        return self.inst_count
@@ -3,40 +3,54 @@ from enum import Enum
 import alu
 import control
 import memory
+import vector
 
 
+# (mnemonic, class, operand format) -- in the operand format, "r" is a scalar register, "v" a vector register and "i" an
+# immediate (hex) value. Operands are passed to the class' constructor in the order they appear.
 class Instructions(Enum):
-    BitWiseAnd = ("AND", alu.BitWiseAnd)
-    BitWiseOr = ("OR", alu.BitWiseOr)
-    BitWiseXOr = ("XOR", alu.BitWiseXOr)
-    BitWiseNot = ("NOT", alu.BitWiseNot)
-    LogicalNot = ("LNOT", alu.LogicalNot)
-    ADDITION = ("ADD", alu.Add)
-    ADDITION_IMMEDIATE = ("ADDI", alu.AddImmediate)
-    SUBTRACT = ("SUB", alu.Subtract)
-    SUBTRACT_IMMEDIATE = ("SUBI", alu.SubtractImmediate)
-    LESSER_THAN = ("LT", alu.LesserThan)
-    GREATER_THAN = ("GT", alu.GreaterThan)
-    EQUAL_TO = ("EQ", alu.EqualTo)
-    MULTIPLY = ("MUL", alu.Multiply)
-    MULTIPLY_IMMEDIATE = ("MULI", alu.MultiplyImmediate)
-    DIVISION = ("DIV", alu.Divide)
-    LEFT_SHIFT = ("LSHIFT", alu.LeftShift)
-    LEFT_SHIFT_IMMEDIATE = ("LSHIFTI", alu.LeftShiftImmediate)
-    RIGHT_SHIFT = ("RSHIFT", alu.RightShift)
-    RIGHT_SHIFT_IMMEDIATE = ("RSHIFTI", alu.RightShiftImmediate)
-    JUMP_ABSOLUTE = ("JMP", control.JumpAbsolute)
-    JUMP_ABSOLUTE_IMMEDIATE = ("JMPAI", control.JumpAbsoluteImmediate)
-    BRANCH_ABSOLUTE_TRUE = ("BRAT", control.BranchAbsoluteTrue)
-    BRANCH_ABSOLUTE_TRUE_IMMEDIATE = ("BRATI", control.BranchAbsoluteTrueImmediate)
-    LOAD_WORD = ("LDW", memory.LoadWord)
-    LOAD_WORD_IMMEDIATE = ("LDWI", memory.LoadWordImmediate)
-    LOAD_WORD_CONSTANT = ("LDWC", memory.LoadWordConstant)
-    LOAD_WORD_CONSTANT_IMMEDIATE = ("LDWIC", memory.LoadWordConstantImmediate)
-    STORE_WORD = ("STW", memory.StoreWord)
-    STORE_WORD_IMMEDIATE = ("STWI", memory.StoreWordImmediate)
-    HALT = ("HALT", control.Halt)
-    NO_OP = ("NOP", control.NoOp)
+    BitWiseAnd = ("AND", alu.BitWiseAnd, "rrr")
+    BitWiseOr = ("OR", alu.BitWiseOr, "rrr")
+    BitWiseXOr = ("XOR", alu.BitWiseXOr, "rrr")
+    BitWiseNot = ("NOT", alu.BitWiseNot, "rr")
+    LogicalNot = ("LNOT", alu.LogicalNot, "rr")
+    ADDITION = ("ADD", alu.Add, "rrr")
+    ADDITION_IMMEDIATE = ("ADDI", alu.AddImmediate, "rri")
+    SUBTRACT = ("SUB", alu.Subtract, "rrr")
+    SUBTRACT_IMMEDIATE = ("SUBI", alu.SubtractImmediate, "rri")
+    LESSER_THAN = ("LT", alu.LesserThan, "rrr")
+    GREATER_THAN = ("GT", alu.GreaterThan, "rrr")
+    EQUAL_TO = ("EQ", alu.EqualTo, "rrr")
+    MULTIPLY = ("MUL", alu.Multiply, "rrr")
+    MULTIPLY_IMMEDIATE = ("MULI", alu.MultiplyImmediate, "rri")
+    DIVISION = ("DIV", alu.Divide, "rrr")
+    LEFT_SHIFT = ("LSHIFT", alu.LeftShift, "rrr")
+    LEFT_SHIFT_IMMEDIATE = ("LSHIFTI", alu.LeftShiftImmediate, "rri")
+    RIGHT_SHIFT = ("RSHIFT", alu.RightShift, "rrr")
+    RIGHT_SHIFT_IMMEDIATE = ("RSHIFTI", alu.RightShiftImmediate, "rri")
+    JUMP_ABSOLUTE = ("JMP", control.JumpAbsolute, "r")
+    JUMP_ABSOLUTE_IMMEDIATE = ("JMPAI", control.JumpAbsoluteImmediate, "i")
+    BRANCH_ABSOLUTE_TRUE = ("BRAT", control.BranchAbsoluteTrue, "rr")
+    BRANCH_ABSOLUTE_TRUE_IMMEDIATE = ("BRATI", control.BranchAbsoluteTrueImmediate, "ri")
+    CALL = ("CALL", control.Call, "ri")
+    RETURN = ("RET", control.Return, "r")
+    LOAD_WORD = ("LDW", memory.LoadWord, "rrr")
+    LOAD_WORD_IMMEDIATE = ("LDWI", memory.LoadWordImmediate, "rri")
+    LOAD_WORD_CONSTANT = ("LDWC", memory.LoadWordConstant, "rr")
+    LOAD_WORD_CONSTANT_IMMEDIATE = ("LDWIC", memory.LoadWordConstantImmediate, "ri")
+    STORE_WORD = ("STW", memory.StoreWord, "rr")
+    STORE_WORD_IMMEDIATE = ("STWI", memory.StoreWordImmediate, "ri")
+    HALT = ("HALT", control.Halt, "")
+    NO_OP = ("NOP", control.NoOp, "")
+    LOOP = ("LOOP", control.LoopSetup, "ri")
+    LOOP_IMMEDIATE = ("LOOPI", control.LoopSetupImmediate, "ii")
+    SET_VECTOR_LENGTH = ("SETVL", vector.SetVectorLength, "r")
+    VECTOR_LOAD = ("VLD", vector.VectorLoad, "vrr")
+    VECTOR_STORE = ("VST", vector.VectorStore, "vrr")
+    VECTOR_ADD = ("VADD", vector.VectorAdd, "vvv")
+    VECTOR_MULTIPLY = ("VMUL", vector.VectorMultiply, "vvv")
+    VECTOR_MULTIPLY_SCALAR = ("VMULS", vector.VectorMultiplyScalar, "vvr")
+    VECTOR_REDUCE_SUM = ("VREDSUM", vector.VectorReduceSum, "rv")
 
 
 """
@@ -58,6 +72,21 @@ CONTROL:
 	- BRATI x #IMMEDIATE (if x PC = {immediate}
 	- BRT x y (if reg[x] then PC=PC+reg[y])
 	- BRTI x #IMMEDIATE (if reg[x] then PC=PC+{immediate})
+
+	- CALL link #IMMEDIATE (reg[link] = PC + 1, PC = {immediate})
+	- RET link (PC = reg[link])
 	
 	- HALT
+
+	- LOOP x #END (repeat the instructions up to END REG[x] times, without branching)
+	- LOOPI #COUNT #END (repeat the instructions up to END COUNT times, without branching)
+
+VECTOR (operating on the first VL elements; the rest of the destination is zeroed):
+	- SETVL x (VL = min(reg[x], maximum vector length))
+	- VLD vd base stride (vd[i] = MEM[reg[base] + i * reg[stride]])
+	- VST vs base stride (MEM[reg[base] + i * reg[stride]] = vs[i])
+	- VADD vd va vb (vd[i] = va[i] + vb[i])
+	- VMUL vd va vb (vd[i] = va[i] * vb[i])
+	- VMULS vd va x (vd[i] = va[i] * reg[x])
+	- VREDSUM dest va (dest = va[0] + ... + va[VL - 1])
 """
\ No newline at end of file
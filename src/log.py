@@ -0,0 +1,135 @@
+import contextlib
+import logging
+import sys
+from typing import Dict, List
+
+"""
+Diagnostic output from the simulator, split into categories (one for each stage or unit) that can be turned on and off
+separately, at two levels:
+
+    info  - what each stage does: what's fetched, decoded, executed and written back
+    debug - also what it's waiting for every cycle, and every register read
+
+Every category has a logger under "sim" (e.g. "sim.mem"), so they can also be set up with the logging module, after
+which `refresh()` has to be called. Messages are checked for before they're built, so a category that's off costs a
+single attribute lookup:
+
+    if log.MEM.enabled:
+        log.MEM.info(f"Queue {registers.PhysicalRegisters(reg).name} <- {value}")
+
+By default every category is on at info, and goes to stdout like the rest of the output.
+"""
+
+LEVELS: Dict[str, int] = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "off": logging.CRITICAL + 1,
+}
+
+ROOT = logging.getLogger("sim")
+
+
+class Category:
+    def __init__(self, name: str):
+        self.name = name
+        self.logger = ROOT.getChild(name)
+        # is info (enabled) or debug (verbose) output wanted? Kept up to date by refresh().
+        self.enabled = False
+        self.verbose = False
+
+    def info(self, message: str):
+        self.__log(logging.INFO, message)
+
+    def debug(self, message: str):
+        self.__log(logging.DEBUG, message)
+
+    # The level has already been checked. The record is made directly, as finding the caller's source line (which
+    # Logger.info does) takes longer than simulating the cycle.
+    def __log(self, level: int, message: str):
+        self.logger.handle(self.logger.makeRecord(self.logger.name, level, self.name, 0, message, None, None))
+
+
+FETCH = Category("fetch")
+DECODE = Category("decode")
+HAZARD = Category("hazard")
+CU = Category("cu")
+ALU = Category("alu")
+VEC = Category("vec")
+MEM = Category("mem")
+WB = Category("wb")
+# register reads
+REGS = Category("regs")
+# the register file at the end of every cycle
+CYCLE = Category("cycle")
+
+CATEGORIES: Dict[str, Category] = {category.name: category for category in
+                                   (FETCH, DECODE, HAZARD, CU, ALU, VEC, MEM, WB, REGS, CYCLE)}
+
+
+# Writes to whatever stdout is when the message is logged, so redirecting it (e.g. for a quiet run) works the same as
+# it does for print
+class StdoutHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        try:
+            sys.stdout.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+def refresh():
+    for category in CATEGORIES.values():
+        category.enabled = category.logger.isEnabledFor(logging.INFO)
+        category.verbose = category.logger.isEnabledFor(logging.DEBUG)
+
+
+def set_level(name: str, level: str):
+    if level not in LEVELS:
+        raise Exception(f"Unknown log level {level}: choose from {', '.join(LEVELS)}.")
+    if name == "all":
+        ROOT.setLevel(LEVELS[level])
+        for category in CATEGORIES.values():
+            category.logger.setLevel(logging.NOTSET)
+    elif name in CATEGORIES:
+        CATEGORIES[name].logger.setLevel(LEVELS[level])
+    else:
+        raise Exception(f"Unknown log category {name}: choose from all, {', '.join(CATEGORIES)}.")
+    refresh()
+
+
+# Nothing is logged inside this, whatever the levels are, e.g. for a run that's only there to compare against
+@contextlib.contextmanager
+def silenced():
+    saved = [(category, category.enabled, category.verbose) for category in CATEGORIES.values()]
+    for category in CATEGORIES.values():
+        category.enabled = category.verbose = False
+    try:
+        yield
+    finally:
+        for (category, enabled, verbose) in saved:
+            category.enabled = enabled
+            category.verbose = verbose
+
+
+# Sets up logging for a run. Each spec is CATEGORY=LEVEL (or just CATEGORY, for info), applied in order, so e.g.
+# ["all=off", "mem=debug"] only shows the memory unit. Given a file, messages go there instead of stdout.
+def configure(specs: List[str] = (), file: str | None = None):
+    for spec in specs:
+        (name, _, level) = spec.partition("=")
+        set_level(name.strip().lower(), level.strip().lower() if level else "info")
+
+    for handler in list(ROOT.handlers):
+        ROOT.removeHandler(handler)
+        handler.close()
+    if file is not None:
+        handler = logging.FileHandler(file, mode="w")
+        handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+    else:
+        handler = StdoutHandler()
+    ROOT.addHandler(handler)
+
+
+# everything at info, to stdout
+ROOT.setLevel(logging.INFO)
+ROOT.propagate = False
+configure()
+refresh()
@@ -0,0 +1,305 @@
+import json
+import tomllib
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import base_instruction
+from src import flags
+
+"""
+Machine description: the latencies and pipeline features of the simulated processor, so that design points can be
+explored without editing the source. Files are TOML (.toml) or JSON (anything else), e.g.
+
+    memory_latency = 100
+
+    [latencies]         # cycles per opcode, by mnemonic. Memory instructions default to memory_latency.
+    MUL = 10
+    DIV = 10
+
+    [features]
+    pipeline = true
+    rename_registers = true
+    forward_results = true
+    speculate = false   # dispatch past conditional branches, needs rename_registers
+    fuse = false        # fuse compare-and-branch pairs into one micro-op
+
+    [bypass]            # bypass paths from each functional unit, see bypass.PATHS
+    alu = true
+    mem = true
+    vec = true
+    cu = true
+
+    [vector]
+    lanes = 4           # elements processed per cycle by the vector unit and vector loads/stores
+    max_length = 16     # elements per vector register
+
+    [prefetch]          # stride prefetcher for scalar loads, see prefetch.py
+    enabled = false
+    distance = 4        # how many strides ahead the first prefetched word is
+    degree = 2          # words prefetched each time a load's stride is confirmed
+    threshold = 2       # times in a row a stride has to be seen before prefetching
+    table_size = 16     # load instructions whose strides are tracked
+    buffer_size = 32    # prefetched words kept
+    hit_latency = 1     # cycles for a load whose word has been prefetched
+
+    [return_stack]      # predicts where RETs go, see control.ReturnAddressStack
+    enabled = true
+    depth = 8           # return addresses kept; deeper calls overwrite the oldest
+
+    [speculation]       # when speculate is on, see speculation.py
+    depth = 4           # conditional branches that can be waiting to resolve at once
+    predictor = "BTFN"  # or "not-taken" or "BTB": where the fetch stage goes after a BRAT/BRATI
+    btb_entries = 64    # branches the BTB predictor remembers
+
+    [multicore]         # see multicore.py
+    cores = 1
+    protocol = "MESI"   # or "MSI": how the cores' private caches are kept coherent
+    interconnect_latency = 10   # cycles for a transaction on the bus between the caches and memory
+
+    [cache]             # each core's private data cache, only used by the multicore system
+    lines = 64
+    associativity = 4
+    line_words = 4
+    hit_latency = 2
+
+    [dram]              # DRAM timing in place of memory_latency, see dram.py
+    enabled = false
+    channels = 1
+    banks = 8           # per channel
+    row_words = 1024    # words in a row
+    t_rcd = 20          # cycles to open a row
+    t_cas = 20          # cycles from a column access to its data
+    t_rp = 20           # cycles to close a row
+    t_burst = 1         # cycles to transfer a word on a channel's data bus
+    controller_latency = 40     # cycles for a request to get to the memory controller
+    scheduler = "FR-FCFS"       # or "FCFS": the order requests queued together are issued in
+
+    [energy]            # picojoules per event, for the energy estimate (see energy.py)
+    frequency_mhz = 1000    # clock frequency, to turn cycles into time
+    instruction = 10.0      # fetching and decoding an instruction
+    register_read = 1.0
+    register_write = 1.5
+    bypass_read = 0.3       # an operand read from the bypass network instead of the register file
+    rename_lookup = 0.5     # a source looked up in the register alias table
+    rename_write = 1.0      # a destination given a new physical register
+    alu = 2.0               # an ALU operation that doesn't have its own energy in [energy.operations]
+    vector_element = 3.0
+    memory_read = 500.0     # per word
+    memory_write = 550.0
+    write_back = 0.5
+    leakage = 5.0           # every cycle, whatever's happening
+
+    [energy.operations]     # ALU operations by mnemonic
+    MUL = 8.0
+    MULI = 8.0
+    DIV = 20.0
+
+Anything left out keeps its default (flags.py for the features, each instruction's own latency otherwise).
+"""
+
+FEATURES = ("pipeline", "rename_registers", "forward_results", "speculate", "fuse")
+VECTOR_SETTINGS = ("lanes", "max_length")
+PREFETCH_DEFAULTS = {"enabled": False, "distance": 4, "degree": 2, "threshold": 2, "table_size": 16, "buffer_size": 32,
+                     "hit_latency": 1}
+RETURN_STACK_DEFAULTS = {"enabled": True, "depth": 8}
+SPECULATION_DEFAULTS = {"depth": 4, "predictor": "BTFN", "btb_entries": 64}
+PREDICTORS = ("not-taken", "BTFN", "BTB")
+MULTICORE_DEFAULTS = {"cores": 1, "protocol": "MESI", "interconnect_latency": 10}
+PROTOCOLS = ("MSI", "MESI")
+CACHE_DEFAULTS = {"lines": 64, "associativity": 4, "line_words": 4, "hit_latency": 2}
+DRAM_DEFAULTS = {"enabled": False, "channels": 1, "banks": 8, "row_words": 1024, "t_rcd": 20, "t_cas": 20, "t_rp": 20,
+                 "t_burst": 1, "controller_latency": 40, "scheduler": "FR-FCFS"}
+DRAM_SCHEDULERS = ("FR-FCFS", "FCFS")
+ENERGY_DEFAULTS = {"frequency_mhz": 1000, "instruction": 10.0, "register_read": 1.0, "register_write": 1.5,
+                   "bypass_read": 0.3, "rename_lookup": 0.5, "rename_write": 1.0, "alu": 2.0, "vector_element": 3.0,
+                   "memory_read": 500.0, "memory_write": 550.0, "write_back": 0.5, "leakage": 5.0}
+OPERATION_ENERGY_DEFAULTS = {"MUL": 8.0, "MULI": 8.0, "DIV": 20.0}
+SECTIONS = ("memory_latency", "latencies", "features", "bypass", "vector", "prefetch", "return_stack", "speculation",
+            "multicore", "cache", "dram", "energy")
+
+
+class MachineConfig:
+    def __init__(self, latencies: Dict[str, int] | None = None, memory_latency: int = 100,
+                 features: Dict[str, bool] | None = None, bypass_paths: Dict[str, bool] | None = None,
+                 vector: Dict[str, int] | None = None, prefetch: Dict[str, int | bool] | None = None,
+                 return_stack: Dict[str, int | bool] | None = None, speculation: Dict[str, int | str] | None = None,
+                 multicore: Dict[str, int | str] | None = None, cache: Dict[str, int] | None = None,
+                 dram: Dict[str, int | str | bool] | None = None, energy: Dict[str, Any] | None = None):
+        # the functional units are given a MachineConfig, so the instructions they execute can't be imported at the top
+        import instructions
+        import memory
+        mnemonics = {inst.value[0]: inst.value[1] for inst in instructions.Instructions}
+
+        self.latencies: Dict[str, int] = dict(latencies or {})
+        for (mnemonic, latency) in self.latencies.items():
+            if mnemonic not in mnemonics:
+                raise Exception(f"Machine config: there's no instruction called {mnemonic}.")
+            if latency < 1:
+                raise Exception(f"Machine config: {mnemonic} has to take at least 1 cycle, not {latency}.")
+
+        if memory_latency < 1:
+            raise Exception(f"Machine config: memory has to take at least 1 cycle, not {memory_latency}.")
+        self.memory_latency = memory_latency
+
+        # memory instructions take as long as memory does, unless they've been given their own latency
+        self.__class_latencies = {cls: memory_latency for cls in mnemonics.values()
+                                  if issubclass(cls, memory.BaseMemoryInstruction)}
+        self.__class_latencies.update({mnemonics[mnemonic]: latency for (mnemonic, latency) in self.latencies.items()})
+
+        features = features or {}
+        for feature in features:
+            if feature not in FEATURES:
+                raise Exception(f"Machine config: unknown feature {feature}, expected one of {', '.join(FEATURES)}.")
+        self.pipeline: bool = features.get("pipeline", flags.pipeline)
+        self.rename_registers: bool = features.get("rename_registers", flags.rename_registers)
+        self.forward_results: bool = features.get("forward_results", flags.forward_results)
+        # dispatch past conditional branches (see speculation.py). It relies on renaming to undo what's dispatched.
+        self.speculate: bool = features.get("speculate", flags.speculate)
+        # fetch a compare and the branch on its result as one micro-op (see control.FusedCompareBranch)
+        self.fuse: bool = features.get("fuse", flags.fuse)
+
+        self.bypass_paths: Dict[str, bool] = dict(flags.bypass_paths)
+        for (path, enabled) in (bypass_paths or {}).items():
+            if path not in self.bypass_paths:
+                raise Exception(f"Machine config: unknown bypass path {path}, expected one of "
+                                f"{', '.join(self.bypass_paths)}.")
+            self.bypass_paths[path] = enabled
+
+        vector = vector or {}
+        for setting in vector:
+            if setting not in VECTOR_SETTINGS:
+                raise Exception(f"Machine config: unknown vector setting {setting}, expected one of "
+                                f"{', '.join(VECTOR_SETTINGS)}.")
+        self.vector_lanes: int = vector.get("lanes", 4)
+        self.max_vector_length: int = vector.get("max_length", 16)
+        if self.vector_lanes < 1 or self.max_vector_length < 1:
+            raise Exception("Machine config: vectors need at least 1 lane and 1 element.")
+
+        self.prefetch: Dict[str, int | bool] = self.__get_settings("prefetch", PREFETCH_DEFAULTS, prefetch,
+                                                                   ("enabled", "threshold"))
+        if self.prefetch["threshold"] < 0:
+            raise Exception(f"Machine config: prefetch threshold can't be {self.prefetch['threshold']}.")
+
+        self.return_stack: Dict[str, int | bool] = self.__get_settings("return_stack", RETURN_STACK_DEFAULTS,
+                                                                       return_stack, ("enabled",))
+
+        self.speculation: Dict[str, int | str] = self.__get_settings("speculation", SPECULATION_DEFAULTS, speculation,
+                                                                     ("predictor",))
+        if self.speculation["predictor"] not in PREDICTORS:
+            raise Exception(f"Machine config: unknown branch predictor {self.speculation['predictor']}, expected one "
+                            f"of {', '.join(PREDICTORS)}.")
+
+        self.multicore: Dict[str, int | str] = self.__get_settings("multicore", MULTICORE_DEFAULTS, multicore,
+                                                                   ("protocol",))
+        if self.multicore["protocol"] not in PROTOCOLS:
+            raise Exception(f"Machine config: unknown coherence protocol {self.multicore['protocol']}, expected one "
+                            f"of {', '.join(PROTOCOLS)}.")
+
+        self.cache: Dict[str, int] = self.__get_settings("cache", CACHE_DEFAULTS, cache)
+        if self.cache["lines"] % self.cache["associativity"] != 0:
+            raise Exception(f"Machine config: a cache with {self.cache['lines']} lines can't be "
+                            f"{self.cache['associativity']}-way set associative.")
+
+        # DRAM timing instead of memory_latency, see dram.py
+        self.dram: Dict[str, int | str | bool] = self.__get_settings("dram", DRAM_DEFAULTS, dram,
+                                                                     ("enabled", "scheduler", "controller_latency"))
+        if self.dram["scheduler"] not in DRAM_SCHEDULERS:
+            raise Exception(f"Machine config: unknown DRAM scheduler {self.dram['scheduler']}, expected one of "
+                            f"{', '.join(DRAM_SCHEDULERS)}.")
+        if self.dram["controller_latency"] < 0:
+            raise Exception(f"Machine config: dram controller_latency can't be {self.dram['controller_latency']}.")
+
+        # energies can be 0, so they're checked here rather than as counts
+        energy = dict(energy or {})
+        operations = energy.pop("operations", {})
+        self.energy: Dict[str, float] = self.__get_settings("energy", ENERGY_DEFAULTS, energy, tuple(ENERGY_DEFAULTS))
+        self.operation_energy: Dict[str, float] = dict(OPERATION_ENERGY_DEFAULTS)
+        self.operation_energy.update(operations)
+        for (name, value) in list(self.energy.items()) + list(self.operation_energy.items()):
+            if value < 0:
+                raise Exception(f"Machine config: energy {name} can't be {value}.")
+        if self.energy["frequency_mhz"] <= 0:
+            raise Exception(f"Machine config: the clock frequency can't be {self.energy['frequency_mhz']} MHz.")
+        for mnemonic in self.operation_energy:
+            if mnemonic not in mnemonics:
+                raise Exception(f"Machine config: there's no instruction called {mnemonic}.")
+
+    # fills in the defaults for a section. Settings that aren't in `unchecked` are counts, so have to be at least 1.
+    @staticmethod
+    def __get_settings(section: str, defaults: Dict[str, Any], given: Dict[str, Any] | None,
+                       unchecked: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        settings = dict(defaults)
+        for (setting, value) in (given or {}).items():
+            if setting not in settings:
+                raise Exception(f"Machine config: unknown {section} setting {setting}, expected one of "
+                                f"{', '.join(settings)}.")
+            if setting not in unchecked and value < 1:
+                raise Exception(f"Machine config: {section} {setting} can't be {value}.")
+            settings[setting] = value
+        return settings
+
+    @staticmethod
+    def from_dict(description: Dict[str, Any]) -> "MachineConfig":
+        for section in description:
+            if section not in SECTIONS:
+                raise Exception(f"Machine config: unknown setting {section}, expected one of {', '.join(SECTIONS)}.")
+        return MachineConfig(latencies=description.get("latencies"),
+                             memory_latency=description.get("memory_latency", 100),
+                             features=description.get("features"),
+                             bypass_paths=description.get("bypass"),
+                             vector=description.get("vector"),
+                             prefetch=description.get("prefetch"),
+                             return_stack=description.get("return_stack"),
+                             speculation=description.get("speculation"),
+                             multicore=description.get("multicore"),
+                             cache=description.get("cache"),
+                             dram=description.get("dram"),
+                             energy=description.get("energy"))
+
+    # an independent copy, to change for another run
+    def copy(self) -> "MachineConfig":
+        return MachineConfig.from_dict(self.to_dict())
+
+    @staticmethod
+    def load(path: str | Path) -> "MachineConfig":
+        path = Path(path)
+        with open(path, "rb") as fh:
+            if path.suffix == ".toml":
+                description = tomllib.load(fh)
+            else:
+                description = json.load(fh)
+        try:
+            return MachineConfig.from_dict(description)
+        except Exception as e:
+            raise Exception(f"{path}: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "memory_latency": self.memory_latency,
+            "latencies": dict(self.latencies),
+            "features": {feature: getattr(self, feature) for feature in FEATURES},
+            "bypass": dict(self.bypass_paths),
+            "vector": {"lanes": self.vector_lanes, "max_length": self.max_vector_length},
+            "prefetch": dict(self.prefetch),
+            "return_stack": dict(self.return_stack),
+            "speculation": dict(self.speculation),
+            "multicore": dict(self.multicore),
+            "cache": dict(self.cache),
+            "dram": dict(self.dram),
+            "energy": dict(self.energy, operations=dict(self.operation_energy)),
+        }
+
+    # how many cycles this instruction takes to execute on this machine
+    def get_latency(self, instruction: base_instruction.BaseInstruction) -> int:
+        latency = self.__class_latencies.get(type(instruction))
+        if latency is not None:
+            return latency
+        # control instructions don't have an execution time
+        get_execution_cycles = getattr(instruction, "get_execution_cycles", None)
+        return get_execution_cycles() if get_execution_cycles is not None else 1
+
+    # Vector instructions are pipelined across the lanes: once the first group of elements is done, the next group
+    # finishes every cycle.
+    def get_vector_latency(self, instruction: base_instruction.BaseInstruction, length: int) -> int:
+        groups = -(-length // self.vector_lanes)
+        return self.get_latency(instruction) + max(groups - 1, 0)
@@ -1,23 +1,258 @@
 import argparse
+import contextlib
+import time
+from typing import List
+
+import analyzer
+import bypass
+import dashboard
+import datafiles
+import functional
+import log
+import machine
+import multicore
 import processor
-from assembler import Assembler
+import profiler
+import scheduler
+import simulation
+import tracefile
+from assembler import ObjectCache, load_program
+
+
+# How a run compares with the same program run another way, e.g. without one of the machine's features
+def print_comparison(what: str, baseline: processor.RunStatistics | multicore.MultiCoreStatistics,
+                     stats: processor.RunStatistics | multicore.MultiCoreStatistics, before: str = "without",
+                     after: str = "with"):
+    saved = baseline.cycles - stats.cycles
+    print(f"{what}: {baseline.cycles} cycles {before}, {stats.cycles} cycles {after} "
+          f"({100 * saved / baseline.cycles:.1f}% fewer, CPI {baseline.get_cpi():.3f} to {stats.get_cpi():.3f})")
+
+
+def main(input_file: str, speed: float, use_cache: bool = True, cache_dir: str | None = None,
+         memory_size: int = 1 << 24, word_bits: int = 64, load_data: List[str] = (), dump_data: List[str] = (),
+         schedule: bool = False, analyze: bool = False, analysis_window: int = 256, no_bypass: List[str] = (),
+         machine_file: str | None = None, prefetch: bool | None = None, fuse: bool | None = None,
+         dram: bool | None = None, cores: int | None = None,
+         entry: List[str] = (), record_trace: str | None = None, functional_only: bool = False,
+         show_dashboard: bool = False, frame_rate: float = 10, log_specs: List[str] = (),
+         log_file: str | None = None, profile: bool = False, profile_output: str | None = None):
+    log.configure(log_specs, log_file)
+    machine_config = machine.MachineConfig.load(machine_file) if machine_file is not None else machine.MachineConfig()
+    for path in no_bypass:
+        machine_config.bypass_paths[path] = False
+    if prefetch is not None:
+        machine_config.prefetch["enabled"] = prefetch
+    if fuse is not None:
+        machine_config.fuse = fuse
+    if dram is not None:
+        machine_config.dram["enabled"] = dram
+
+    # A trace is replayed: it has the program in it, and what every instruction did
+    trace = None
+    if tracefile.TraceReader.is_trace_file(input_file):
+        if schedule or analyze or record_trace is not None or cores is not None or len(entry) > 0:
+            raise Exception("A trace can only be replayed on a single core, as it was recorded.")
+        trace = tracefile.TraceReader(input_file)
+        program = trace.program
+    else:
+        # First load the program: object files are used as-is, and assembly is only re-assembled if it isn't cached
+        program = load_program(input_file, ObjectCache(cache_dir) if use_cache else None)
+    symbols = program.get_symbols()
+    entry_points = [datafiles.parse_address(address, symbols) for address in entry]
+
+    if record_trace is not None:
+        if schedule:
+            program = scheduler.schedule_object(program, machine_config)
+        # the functional simulator works out what every instruction does, for the pipeline to replay later
+        simulator = functional.FunctionalSimulator(program, memory_size, word_bits, machine_config)
+        multicore.load_data_files(simulator.storage, program, load_data)
+        with tracefile.TraceWriter(record_trace, program) as writer:
+            simulator.trace = writer
+            simulator.run()
+        print(f"Recorded {writer.records} instructions to {record_trace}")
+        return
+
+    if functional_only:
+        if schedule:
+            program = scheduler.schedule_object(program, machine_config)
+        # no timing, just the results: basic blocks are translated to Python to run them quickly
+        simulator = functional.FunctionalSimulator(program, memory_size, word_bits, machine_config, translate=True)
+        multicore.load_data_files(simulator.storage, program, load_data)
+        start = time.perf_counter()
+        simulator.run()
+        elapsed = time.perf_counter() - start
+        print(f"Executed {simulator.inst_count} instructions in {elapsed:.3f}s")
+        if simulator.translator is not None:
+            simulator.translator.print_statistics()
+        for spec in dump_data:
+            (address, length, path) = datafiles.parse_dump(spec, symbols)
+            datafiles.write_data_file(path, simulator.storage.read_words(address, length))
+        return
 
+    unscheduled_stats = None
+    if schedule:
+        # run the program as written first (quietly), to compare against
+        unscheduled_stats = simulation.run_quietly(program, machine_config, memory_size, word_bits, load_data, cores,
+                                                   entry_points)
+        program = scheduler.schedule_object(program, machine_config)
+
+    no_prefetch_stats = None
+    if prefetch:
+        # and without the prefetcher, to compare against
+        no_prefetch_config = machine_config.copy()
+        no_prefetch_config.prefetch["enabled"] = False
+        no_prefetch_stats = simulation.run_quietly(program, no_prefetch_config, memory_size, word_bits, load_data,
+                                                   cores, entry_points, trace)
+
+    no_fusion_stats = None
+    if fuse:
+        # and without fusion
+        no_fusion_config = machine_config.copy()
+        no_fusion_config.fuse = False
+        no_fusion_stats = simulation.run_quietly(program, no_fusion_config, memory_size, word_bits, load_data, cores,
+                                                 entry_points, trace)
+
+    dataflow = None
+    if analyze:
+        # find the dataflow limit by running the program functionally
+        dataflow = analyzer.DataflowAnalyzer(window=analysis_window, machine_config=machine_config)
+        simulator = functional.FunctionalSimulator(program, memory_size, word_bits, machine_config)
+        multicore.load_data_files(simulator.storage, program, load_data)
+        simulator.run(dataflow.observe)
 
-def main(input_file: str, speed: int):
-    # First parse the input file and load the program and data into memory
-    assembler = Assembler(input_file)
     # Then run the processor
-    a = processor.Processor(speed, assembler.assemble())
-    a.run()
+    a = multicore.build_processor(program, speed, memory_size, word_bits, load_data, machine_config, cores,
+                                  entry_points, trace)
+    stage_profiler = None
+    if profile:
+        # where the simulator's own time goes, stage by stage
+        stage_profiler = profiler.StageProfiler(a.cores if isinstance(a, multicore.MultiCore) else [a])
+    with profiler.record(profile_output) if profile_output is not None else contextlib.nullcontext():
+        if show_dashboard:
+            # the dashboard runs it to the end, leaving only the statistics to print
+            dashboard.Dashboard(a.cores if isinstance(a, multicore.MultiCore) else [a], frame_rate).run(a)
+        stats = a.run()
+
+    if stage_profiler is not None:
+        stage_profiler.print_report()
+
+    if dataflow is not None:
+        dataflow.print_report(stats.get_cpi())
+
+    if unscheduled_stats is not None:
+        print_comparison("Scheduling", unscheduled_stats, stats, "before", "after")
+    if no_prefetch_stats is not None:
+        print_comparison("Prefetching", no_prefetch_stats, stats)
+    if no_fusion_stats is not None:
+        print_comparison("Fusion", no_fusion_stats, stats)
+
+    for spec in dump_data:
+        (address, length, path) = datafiles.parse_dump(spec, symbols)
+        datafiles.write_data_file(path, a.dump_data(address, length))
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser(description="Run the simulator on a given assembly file")
     arg_parser.add_argument("input_file", type=str,
-                            help="The assembly file you wish to execute in the simulator")
+                            help="The assembly (or assembled object) file you wish to execute in the simulator, or a "
+                                 "trace to replay")
+
+    arg_parser.add_argument("--speed", "-s", type=float, default=0,
+                            help="How many cycles to simulate per second, to slow the simulation down enough to watch "
+                                 "it. Default: 0, as fast as it can go")
+
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="Always re-assemble the input file instead of using the cached object file.")
+    arg_parser.add_argument("--cache-dir", type=str, default=None,
+                            help="Where assembled object files are cached. Default: $XDG_CACHE_HOME/coms30046-sim")
+
+    arg_parser.add_argument("--machine", type=str, default=None, metavar="FILE",
+                            help="A machine description (.toml or .json) giving instruction and memory latencies and "
+                                 "which pipeline features are turned on. See examples/machines/.")
+
+    arg_parser.add_argument("--memory-size", type=int, default=1 << 24,
+                            help="The size of the address space in words. Memory is only allocated as it's used.")
+    arg_parser.add_argument("--word-bits", type=int, default=64,
+                            help="The width of a memory word in bits (at most 64). Stored values wrap around.")
+
+    arg_parser.add_argument("--load-data", action="append", default=[], metavar="FILE@ADDRESS",
+                            help="Copy a data file (.npy of integers, or raw little-endian 64-bit words) into memory "
+                                 "at ADDRESS (hex, or a label) before running. Can be repeated.")
+    arg_parser.add_argument("--dump-data", action="append", default=[], metavar="ADDRESS:LENGTH@FILE",
+                            help="After halting, write LENGTH words (hex) starting at ADDRESS (hex, or a label) to "
+                                 "FILE (.npy, or raw little-endian 64-bit words). Can be repeated.")
+
+    arg_parser.add_argument("--schedule", action="store_true",
+                            help="Reorder instructions within basic blocks to reduce stalls, and report the cycles "
+                                 "saved compared to the program as written.")
+
+    arg_parser.add_argument("--analyze", action="store_true",
+                            help="Also report the program's dataflow limit: its critical path, available ILP and the "
+                                 "best CPI possible at issue widths 1, 2, 4 and 8.")
+    arg_parser.add_argument("--analysis-window", type=int, default=256,
+                            help="How many instructions the idealised machines used by --analyze can look ahead.")
+
+    arg_parser.add_argument("--no-bypass", action="append", default=[], choices=bypass.PATHS,
+                            help="Turn off the bypass path from a functional unit's output, so instructions that use "
+                                 "its results wait for them to be written back. Can be repeated.")
+
+    arg_parser.add_argument("--prefetch", action=argparse.BooleanOptionalAction, default=None,
+                            help="Turn the stride prefetcher for loads on (and report the cycles saved compared to "
+                                 "running without it) or off, whatever the machine description says.")
+
+    arg_parser.add_argument("--fuse", action=argparse.BooleanOptionalAction, default=None,
+                            help="Fuse each compare and the BRATI after it that branches on its result into one "
+                                 "micro-op (and report the CPI compared to running without fusion), or don't, "
+                                 "whatever the machine description says.")
+
+    arg_parser.add_argument("--dram", action=argparse.BooleanOptionalAction, default=None,
+                            help="Model DRAM banks, row buffers and timings (the [dram] section of the machine "
+                                 "description) instead of a flat memory_latency, or don't, whatever the machine "
+                                 "description says.")
+
+    arg_parser.add_argument("--cores", type=int, default=None,
+                            help="Run the program on this many cores, which share memory and have their own caches "
+                                 "kept coherent with the machine description's protocol. Each core has its number in "
+                                 "the CORE register and the number of cores in CORES.")
+    arg_parser.add_argument("--entry", action="append", default=[], metavar="ADDRESS",
+                            help="Where a core starts executing (hex, or a label). Give it once for every core, or "
+                                 "once for all of them. Default: the start of the program.")
+
+    arg_parser.add_argument("--record-trace", type=str, default=None, metavar="FILE",
+                            help="Run the program on the functional simulator and record what every instruction did "
+                                 "to FILE, instead of running the pipeline. Pass FILE as the input file to replay it "
+                                 "on the pipeline without evaluating any instructions, e.g. with a different --machine.")
+
+    arg_parser.add_argument("--dashboard", action="store_true",
+                            help="Show the registers, pipeline and counters in the terminal as the program runs, "
+                                 "redrawn in place, instead of printing every cycle.")
+    arg_parser.add_argument("--frame-rate", type=float, default=10,
+                            help="How many times a second the dashboard is redrawn. Default: 10")
+
+    arg_parser.add_argument("--log", action="append", default=[], metavar="CATEGORY=LEVEL",
+                            help=f"Set how much a part of the simulator says about what it's doing: one of "
+                                 f"all, {', '.join(log.CATEGORIES)} at {', '.join(log.LEVELS)}. Applied in order, "
+                                 f"e.g. --log all=off --log mem=debug. Default: everything at info")
+    arg_parser.add_argument("--log-file", type=str, default=None, metavar="FILE",
+                            help="Write the log to FILE instead of the terminal.")
+
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="Time each pipeline stage of the simulator itself (host time, not simulated cycles), "
+                                 "and print how long it takes per cycle at the end.")
+    arg_parser.add_argument("--profile-output", type=str, default=None, metavar="FILE",
+                            help="Profile every function of the simulator and save the stats to FILE for pstats, or, "
+                                 "if FILE ends in .folded or .collapsed, save collapsed call stacks for a flame graph. "
+                                 "Slows the simulation down a lot.")
 
-    arg_parser.add_argument("--speed", "-s", type=int, default=0,
-                            help="The delay between ticks of the clock. A bigger number slows down the simulation.")
+    arg_parser.add_argument("--functional", action="store_true",
+                            help="Only run the program on the functional simulator, which has no timing but translates "
+                                 "basic blocks to Python as it goes, so it's much faster than the pipeline.")
 
     args = arg_parser.parse_args()
-    main(input_file=args.input_file, speed=args.speed)
+    main(input_file=args.input_file, speed=args.speed, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+         memory_size=args.memory_size, word_bits=args.word_bits, load_data=args.load_data, dump_data=args.dump_data,
+         schedule=args.schedule, analyze=args.analyze, analysis_window=args.analysis_window,
+         no_bypass=args.no_bypass, machine_file=args.machine, prefetch=args.prefetch, fuse=args.fuse,
+         dram=args.dram, cores=args.cores, entry=args.entry, record_trace=args.record_trace,
+         functional_only=args.functional, show_dashboard=args.dashboard, frame_rate=args.frame_rate,
+         log_specs=args.log, log_file=args.log_file, profile=args.profile, profile_output=args.profile_output)
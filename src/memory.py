@@ -3,15 +3,31 @@ from collections import deque
 from typing import List, Callable, Deque
 
 import base_instruction
+import bypass
+import coherence
+import dram
+import log
+import machine
+import prefetch
 import registers
+import speculation
+import storage
 import writeback
 import clock
 
 
 class MemoryAction:
-    def __init__(self, address: int, data: int | None = None, register: None | registers.Registers = None):
+    def __init__(self, address: int, data: int | List[int] | None = None, register: None | registers.Registers = None,
+                 count: int | None = None, stride: int = 1):
         # memory address to load (or store) from (or to)
         self.address = address
+        # address of the instruction that made this access, and the branch it was dispatched past if it was, set by the
+        # memory unit
+        self.pc: int | None = None
+        self.tag: int | None = None
+        # vector accesses are to `count` words, `stride` apart
+        self.count = count
+        self.stride = stride
 
         # One of the two of these should be set. Not both.
         # source register for loads
@@ -19,6 +35,9 @@ class MemoryAction:
         # data to store
         self.data = data
 
+        # how many cycles the access takes, set by the memory unit
+        self.latency: int | None = None
+
 
 class BaseMemoryInstruction(base_instruction.BaseInstruction, ABC):
     @abstractmethod
@@ -31,37 +50,57 @@ class BaseMemoryInstruction(base_instruction.BaseInstruction, ABC):
 
 
 class Memory:
-    # available size in bytes
-    __size = 32000
-
     # data types that can be stored in memory
-    __type = None | base_instruction.BaseInstruction | int
+    __type = base_instruction.BaseInstruction | int
 
-    def __init__(self, register_file: registers.RegisterFile, write_back: writeback.WriteBack, clock: clock.Clock):
+    def __init__(self, register_file: registers.RegisterFile, write_back: writeback.WriteBack, clock: clock.Clock,
+                 store: storage.Storage | None = None, bypass_network: bypass.BypassNetwork | None = None,
+                 machine_config: machine.MachineConfig | None = None, cache: coherence.Cache | None = None,
+                 speculation_state: speculation.Speculation | None = None):
         self._initialised = True
 
-        self.__memory: List[Memory.__type] = [None] * Memory.__size
+        self.__memory = store if store is not None else storage.Storage()
 
         self.__register_file = register_file
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.__bypass = bypass_network if bypass_network is not None else \
+            bypass.BypassNetwork(register_file, self.__machine)
         self.__write_back = write_back
         self.__clock = clock
         self.__finish_at = None
+        # a core of a multicore system has its own cache, and its accesses take however long the cache says.
+        # Otherwise they take memory_latency, or however long the DRAM says if it's modelled.
+        self.cache = cache
+        self.dram = dram.DRAM(self.__machine) if self.__machine.dram["enabled"] and cache is None else None
+        self.prefetcher = prefetch.StridePrefetcher(self.__machine, self.dram) \
+            if self.__machine.prefetch["enabled"] else None
+        # speculative stores wait until the branch they were dispatched past resolves
+        self.__speculation = speculation_state if speculation_state is not None else speculation.Speculation()
 
         self.__action_buffer: Deque[MemoryAction] = deque()
         self.__forward_wb: writeback.WriteBackAction | None = None
         self.__instruction: None | BaseMemoryInstruction = None
+        self.__instruction_pc: int | None = None
         self.__wb_res: None | writeback.WriteBackAction = None
 
+        # words read and written
+        self.reads = 0
+        self.writes = 0
+
     # Get address in memory
     def get(self, address: int) -> __type:
-        return self.__memory[address]
+        return self.__memory.get(address)
 
     # Set address in memory
     def set(self, address: int, val: __type):
-        self.__memory[address] = val
+        self.__memory.set(address, val)
+
+    def get_storage(self) -> storage.Storage:
+        return self.__memory
 
-    def give_instruction(self, instruction: BaseMemoryInstruction):
+    def give_instruction(self, instruction: BaseMemoryInstruction, pc: int | None = None):
         self.__instruction = instruction
+        self.__instruction_pc = pc
 
     def get_instruction(self) -> BaseMemoryInstruction | None:
         return self.__instruction
@@ -82,25 +121,76 @@ class Memory:
         if self.__instruction is None:
             return False
 
-        print(f"MEM execute: {self.__instruction}")
+        if log.MEM.enabled:
+            log.MEM.info(f"MEM execute: {self.__instruction}")
 
         # wait if the memory unit is busy executing in the mem stage
         if not self.is_mem_busy():
-            memory_action = self.__instruction.execute(self.__register_file, self)
+            memory_action = self.__get_action(self.__instruction)
+            if memory_action.count is not None:
+                memory_action.count = max(0, min(memory_action.count, self.__machine.max_vector_length))
+                memory_action.latency = self.__machine.get_vector_latency(self.__instruction, memory_action.count)
+            else:
+                memory_action.latency = self.__machine.get_latency(self.__instruction)
+            memory_action.pc = self.__instruction_pc
+            memory_action.tag = self.__instruction.speculation_tag
             self.__instruction = None
             self.add_memory_action(memory_action)
             return True
         else:
             return False
 
+    # a replayed instruction accesses the addresses in its record, and stores don't need their data
+    def __get_action(self, instruction: BaseMemoryInstruction) -> MemoryAction:
+        record = instruction.trace_record
+        if record is None:
+            return instruction.execute(self.__bypass, self)
+
+        dest = instruction.get_dest()
+        if record.count is None:
+            data = 0
+        else:
+            data = [0] * record.count
+        return MemoryAction(address=record.address, register=dest, data=None if dest is not None else data,
+                            count=record.count, stride=record.stride if record.stride is not None else 1)
+
     def is_mem_busy(self) -> bool:
         return len(self.__action_buffer) > 0 or self.__forward_wb is not None
 
+    # is it busy with anything from before the branch being speculated past?
+    def is_busy_with_older(self) -> bool:
+        if self.__forward_wb is not None and not self.__speculation.is_speculative(self.__forward_wb.tag):
+            return True
+        return any(not self.__speculation.is_speculative(action.tag) for action in self.__action_buffer)
+
+    # throws away everything from instructions dispatched past a taken branch
+    def squash(self, tag: int):
+        if self.__instruction is not None and self.__instruction.speculation_tag == tag:
+            self.__instruction = None
+        if self.__forward_wb is not None and self.__forward_wb.tag == tag:
+            self.__forward_wb = None
+        # only the oldest access can have started
+        if len(self.__action_buffer) > 0 and self.__action_buffer[0].tag == tag:
+            self.__finish_at = None
+        self.__action_buffer = deque(action for action in self.__action_buffer if action.tag != tag)
+
+    # Stores can't change memory until it's certain they happen. Nor can loads that would fail on the wrong path, as
+    # they'd fail on the right one too.
+    def __must_wait(self, action: MemoryAction) -> bool:
+        if not self.__speculation.is_speculative(action.tag):
+            return False
+        if action.register is None:
+            return True
+        count = action.count if action.count is not None else 1
+        last = action.address + (count - 1) * action.stride
+        return not (0 <= action.address < self.__memory.get_size() and 0 <= last < self.__memory.get_size())
+
     def exec_memory_actions(self):
         # if the execute stage put something that just needs to be forwarded to wb, forward it
         # there's no memory actions that need to be done
         if self.__forward_wb is not None:
-            print(f"Memory: Queue (Forwarded from EX) {registers.PhysicalRegisters(self.__forward_wb.reg).name} <- {self.__forward_wb.data}")
+            if log.MEM.enabled:
+                log.MEM.info(f"Memory: Queue (Forwarded from EX) {registers.PhysicalRegisters(self.__forward_wb.reg).name} <- {self.__forward_wb.data}")
             self.__write_back.prepare_write(self.__forward_wb)
             self.__forward_wb = None
             return
@@ -108,14 +198,34 @@ class Memory:
         if len(self.__action_buffer) == 0:
             return
 
+        action = self.__action_buffer[0]
+        if self.__finish_at is None and self.__must_wait(action):
+            if log.MEM.verbose:
+                log.MEM.debug("\tspeculative, waiting for the branch to resolve")
+            return
+        if log.MEM.verbose:
+            log.MEM.debug(f"Memory: data={action.data}, address={action.address}, reg={action.register}")
+
         # hasn't started "executing" yet.
         if self.__finish_at is None:
-            mem_exec_time = 100
-            self.__finish_at = self.__clock.get_time() + mem_exec_time
-
-        action = self.__action_buffer.popleft()
-        print(f"Memory: data={action.data}, address={action.address}, reg={action.register}")
-        self.__action_buffer.appendleft(action)
+            now = self.__clock.get_time()
+            mem_exec_time = action.latency if action.latency is not None else self.__machine.memory_latency
+            if self.cache is not None:
+                mem_exec_time = self.__get_cache_latency(action)
+            # scalar loads might find their word already prefetched
+            prefetching = self.prefetcher is not None and action.register is not None and action.count is None
+            prefetched_time = self.prefetcher.lookup(action.address, now) if prefetching else None
+            if prefetched_time is not None:
+                if log.MEM.enabled:
+                    log.MEM.info(f"\tPrefetched: takes {prefetched_time} cycles")
+                # a prefetch still on its way from DRAM can take longer than memory_latency
+                mem_exec_time = prefetched_time if self.dram is not None else min(mem_exec_time, prefetched_time)
+            elif self.dram is not None:
+                mem_exec_time = self.__get_dram_latency(action)
+            # the load goes to DRAM before anything the prefetcher sends after it
+            if prefetching:
+                self.prefetcher.train(action.pc, action.address, now)
+            self.__finish_at = now + mem_exec_time
 
         # only execute when the timer runs out, to simulate it taking however many cycles to execute
         # also wait for WB unit to be available
@@ -127,17 +237,57 @@ class Memory:
 
             # if loading data from memory to register
             if reg is not None:
-                print(f"\tQueue {registers.PhysicalRegisters(reg).name} <- {self.get(address)}")
-
-                write_back_action = writeback.WriteBackAction(reg=reg, data=self.get(address))
+                if action.count is not None:
+                    value = [self.get(address + idx * action.stride) for idx in range(action.count)]
+                    value += [0] * (self.__machine.max_vector_length - action.count)
+                else:
+                    value = self.get(address)
+                self.reads += action.count if action.count is not None else 1
+                if log.MEM.enabled:
+                    log.MEM.info(f"\tQueue {registers.PhysicalRegisters(reg).name} <- {value}")
+
+                write_back_action = writeback.WriteBackAction(reg=reg, data=value, tag=action.tag)
                 self.__write_back.prepare_write(write_back_action)
+                self.__bypass.publish(write_back_action, "mem")
             # if storing data from register to memory
+            elif action.count is not None:
+                if log.MEM.enabled:
+                    log.MEM.info(f"\tMEM[{address}:{address + action.count * action.stride}:{action.stride}] <- {data}")
+                for idx in range(action.count):
+                    self.set(address + idx * action.stride, data[idx])
+                self.writes += action.count
             else:
-                print(f"\tMEM[{address}] <- {data}")
+                if log.MEM.enabled:
+                    log.MEM.info(f"\tMEM[{address}] <- {data}")
                 self.set(address, data)
+                self.writes += 1
             self.__finish_at = None
         else:
-            print("\tin progress...")
+            if log.MEM.verbose:
+                log.MEM.debug("\tin progress...")
+
+    # Vector accesses go to the cache a word at a time, and take as long as the slowest word plus a cycle for each
+    # group of `lanes` words after the first
+    def __get_cache_latency(self, action: MemoryAction) -> int:
+        now = self.__clock.get_time()
+        is_write = action.register is None
+        if action.count is None:
+            return self.cache.access(action.address, is_write, now)
+
+        latencies = [self.cache.access(action.address + idx * action.stride, is_write, now)
+                     for idx in range(action.count)]
+        groups = -(-action.count // self.__machine.vector_lanes)
+        return max(latencies, default=self.__machine.cache["hit_latency"]) + max(groups - 1, 0)
+
+    # every word of a vector access goes to DRAM at once, and it takes until the last of them has been transferred
+    def __get_dram_latency(self, action: MemoryAction) -> int:
+        now = self.__clock.get_time()
+        count = action.count if action.count is not None else 1
+        words = [(action.address + idx * action.stride, action.register is None) for idx in range(count)]
+        latency = max(self.dram.access(words, now), default=now + 1) - now
+        if log.MEM.enabled:
+            log.MEM.info(f"\tDRAM: takes {latency} cycles")
+        return latency
 
     # is the value of this register going to be changed because of a MEM action?
     def wil_change_reg(self, register: registers.PhysicalRegisters) -> bool:
@@ -146,14 +296,6 @@ class Memory:
                 return True
         return False
 
-    # if just passing on a register write from EX, we can steal this for result forwarding.
-    def forward_result(self, register: registers.PhysicalRegisters):
-        if self.__forward_wb is None:
-            return
-        if self.__forward_wb.reg != register:
-            return None
-        return self.__forward_wb.data
-
 
 # REG[dest] = MEM[REG[base] + REG[offset]]
 class LoadWord(BaseMemoryInstruction):
@@ -203,13 +345,13 @@ class LoadWordImmediate(BaseMemoryInstruction):
     def update_dest(self, new: registers.PhysicalRegisters):
         self.__dest = registers.PhysicalRegisters(new)
 
+    # the offset is an immediate, not a register
     def get_sources(self) -> List[registers.Registers]:
-        return [self.__base, self.__offset]
+        return [self.__base]
 
     def update_source_registers(self, rat: List[int]):
         self.__dest = registers.PhysicalRegisters(rat[self.__dest])
         self.__base = registers.PhysicalRegisters(rat[self.__base])
-        self.__offset = registers.PhysicalRegisters(rat[self.__offset])
 
 
 # REG[dest] = MEM[REG[address]]
@@ -310,9 +452,9 @@ class StoreWordImmediate(BaseMemoryInstruction):
     def update_dest(self, new: registers.PhysicalRegisters):
         pass
 
+    # the data is an immediate, not a register
     def get_sources(self) -> List[registers.Registers]:
-        return [self.__data, self.__address]
+        return [self.__address]
 
     def update_source_registers(self, rat: List[int]):
-        self.__data = registers.PhysicalRegisters(rat[self.__data])
         self.__address = registers.PhysicalRegisters(rat[self.__address])
@@ -0,0 +1,133 @@
+from array import array
+from typing import List
+
+import coherence
+import datafiles
+import energy
+import log
+import machine
+import objectfile
+import processor
+import storage
+import tracefile
+from src.base_instruction import BaseInstruction
+
+
+class MultiCoreStatistics:
+    def __init__(self, cores: List[processor.RunStatistics], energy_report: energy.EnergyReport):
+        self.cores = cores
+        # the cores run side by side, so the system takes as long as the slowest
+        self.cycles = max(core.cycles for core in cores)
+        self.instructions = sum(core.instructions for core in cores)
+        self.energy = energy_report
+
+    def get_ipc(self) -> float:
+        return self.instructions / self.cycles if self.cycles != 0 else 0
+
+    def get_cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions != 0 else 0
+
+
+# Several cores, each with its own pipeline, registers and private cache, sharing one storage. The caches are kept
+# coherent over a shared bus (see coherence.py).
+# Every core runs the same program: each starts at its entry point (the start of the program by default) with its
+# number in CORE and the number of cores in CORES, so it can pick its share of the work.
+class MultiCore:
+    def __init__(self, clock_speed: float, preload: List[BaseInstruction | int] | objectfile.ObjectFile,
+                 memory_size: int = 1 << 24, word_bits: int = 64, machine_config: machine.MachineConfig | None = None,
+                 cores: int | None = None, entry_points: List[int] = ()):
+        self.machine = machine_config if machine_config is not None else machine.MachineConfig()
+        num_cores = cores if cores is not None else self.machine.multicore["cores"]
+        if num_cores < 1:
+            raise Exception(f"There has to be at least 1 core, not {num_cores}.")
+        if len(entry_points) > 1 and len(entry_points) != num_cores:
+            raise Exception(f"Give one entry point for every core, or one for all of them: there are {num_cores} "
+                            f"cores, and {len(entry_points)} entry points.")
+        if len(entry_points) == 1:
+            entry_points = list(entry_points) * num_cores
+        elif len(entry_points) == 0:
+            entry_points = [0] * num_cores
+
+        self.storage = storage.Storage(memory_size, word_bits=word_bits)
+        processor.preload_storage(self.storage, preload)
+
+        self.interconnect = coherence.Interconnect(self.machine)
+        self.cores = [processor.Processor(clock_speed, None, machine_config=self.machine, store=self.storage,
+                                          cache=self.interconnect.add_cache(), core_id=core_id, cores=num_cores,
+                                          entry=entry)
+                      for (core_id, entry) in enumerate(entry_points)]
+
+    def is_running(self) -> bool:
+        return any(core.is_running() for core in self.cores)
+
+    # Each core keeps its own clock, which doesn't always tick in a step. Only the cores furthest behind are stepped,
+    # so the cores stay in time with each other and the bus sees their accesses in order.
+    def step(self):
+        running = [core for core in self.cores if core.is_running()]
+        now = min(core.clock.get_time() for core in running)
+        for core in running:
+            if core.clock.get_time() == now:
+                if log.CYCLE.enabled:
+                    log.CYCLE.info(f"========== core {core.core_id} ==========")
+                core.step()
+
+    def run(self) -> MultiCoreStatistics:
+        while self.is_running():
+            self.step()
+
+        stats = self.get_statistics()
+        self.print_statistics(stats)
+        return stats
+
+    def get_statistics(self) -> MultiCoreStatistics:
+        return MultiCoreStatistics([core.get_statistics() for core in self.cores],
+                                   energy.estimate(self.cores, self.machine))
+
+    def print_statistics(self, stats: MultiCoreStatistics):
+        for core in self.cores:
+            cache = core.memory_unit.cache.statistics
+            print(f"========== core {core.core_id} ==========")
+            core.print_statistics()
+            print(f"Cache: {cache.reads} reads ({cache.read_misses} misses), {cache.writes} writes "
+                  f"({cache.write_misses} misses), hit rate {100 * cache.get_hit_rate():.1f}%")
+            print(f"\t Upgrades: {cache.upgrades} (silent: {cache.silent_upgrades}), invalidated: "
+                  f"{cache.invalidations}, supplied to other cores: {cache.interventions}, written back: "
+                  f"{cache.write_backs}, waited {cache.bus_wait} cycles for the bus")
+
+        print("========== all cores ==========")
+        print(f"{len(self.cores)} cores executed {stats.instructions} instructions in {stats.cycles} cycles "
+              f"({stats.get_ipc():.3f} instructions per cycle)")
+        stats.energy.print_report()
+        print(f"Bus ({self.machine.multicore['protocol']}): {self.interconnect.transactions} transactions, "
+              f"{self.interconnect.cache_to_cache} misses supplied by another cache")
+        if self.interconnect.dram is not None:
+            self.interconnect.dram.print_statistics(stats.cycles, self.storage.get_word_bits())
+
+    def dump_data(self, address: int, length: int) -> array:
+        return self.storage.read_words(address, length)
+
+
+# map data sets into memory on top of the program
+def load_data_files(store: storage.Storage, program: objectfile.ObjectFile, load_data: List[str]):
+    for spec in load_data:
+        (path, address) = datafiles.parse_load(spec, program.get_symbols())
+        store.load_words(address, datafiles.read_data_file(path))
+
+
+# A multicore system is built if there's more than one core, or the number of cores was given.
+# Given a trace, the processor replays it.
+def build_processor(program: objectfile.ObjectFile, speed: float, memory_size: int, word_bits: int,
+                    load_data: List[str], machine_config: machine.MachineConfig, cores: int | None = None,
+                    entry_points: List[int] = (),
+                    trace: tracefile.TraceReader | None = None) -> processor.Processor | MultiCore:
+    if trace is not None:
+        return processor.Processor(speed, program, memory_size=memory_size, word_bits=word_bits,
+                                   machine_config=machine_config, replay=tracefile.Replay(trace))
+    if cores is not None or machine_config.multicore["cores"] > 1 or len(entry_points) > 1:
+        a = MultiCore(speed, program, memory_size=memory_size, word_bits=word_bits, machine_config=machine_config,
+                      cores=cores, entry_points=entry_points)
+    else:
+        a = processor.Processor(speed, program, memory_size=memory_size, word_bits=word_bits,
+                                machine_config=machine_config, entry=entry_points[0] if entry_points else 0)
+    load_data_files(a.storage, program, load_data)
+    return a
@@ -0,0 +1,168 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import base_instruction
+import instructions
+import registers
+
+"""
+Object file layout (header and symbols little-endian, words in the host's byte order so they can be mapped directly):
+    header      magic (8 bytes), format version (u16), reserved (u16), ISA fingerprint (u32), word count (u32),
+                symbol count (u32)
+    words       4 x i64 per memory word: [opcode, operand 0, operand 1, operand 2]
+                opcode is the index into the Instructions enum, or -1 for a data word (whose value is operand 0)
+    symbols     per label: name length (u16), address (i64), name (utf-8)
+"""
+
+MAGIC = b"SIMOBJ\x00\x01"
+FORMAT_VERSION = 1
+# bump whenever the assembler's output for the same source changes
+ASSEMBLER_VERSION = 1
+
+DATA_WORD = -1
+WORD_SIZE = 4
+
+_header = struct.Struct("<8sHHIII")
+_symbol = struct.Struct("<Hq")
+
+_opcodes: List[instructions.Instructions] = list(instructions.Instructions)
+_opcode_numbers: Dict[instructions.Instructions, int] = {inst: idx for (idx, inst) in enumerate(_opcodes)}
+
+# an assembled word: either (instruction, operands) or a data value
+EncodedWord = Tuple[instructions.Instructions, List[int]] | int
+
+
+# Changes whenever an instruction is added, removed, reordered or has its operands changed, so that stale object
+# files are never decoded against a different instruction set.
+def isa_fingerprint() -> int:
+    description = ",".join(f"{inst.value[0]}:{inst.value[2]}" for inst in _opcodes)
+    return zlib.crc32(description.encode())
+
+
+def build_instruction(word: EncodedWord) -> base_instruction.BaseInstruction | int:
+    if isinstance(word, int):
+        return word
+
+    (inst, operands) = word
+    [_, instruction_class, operand_format] = inst.value
+    return instruction_class(*[registers.ArchRegisters(op) if kind in "rv" else op
+                               for (kind, op) in zip(operand_format, operands)])
+
+
+class ObjectFile:
+    def __init__(self, words: Sequence[int], symbols: Dict[str, int], backing: mmap.mmap | None = None):
+        # flat sequence of WORD_SIZE ints per memory word. Either an array, or a view into a memory-mapped file.
+        self.__words = words
+        self.__symbols = symbols
+        # keep the mapping open for as long as the view is in use
+        self.__backing = backing
+
+    @staticmethod
+    def encode(program: List[EncodedWord], symbols: Dict[str, int]) -> "ObjectFile":
+        words = array("q", bytes(8 * WORD_SIZE * len(program)))
+
+        for (idx, word) in enumerate(program):
+            base = idx * WORD_SIZE
+            if isinstance(word, int):
+                words[base] = DATA_WORD
+                words[base + 1] = word
+            else:
+                (inst, operands) = word
+                words[base] = _opcode_numbers[inst]
+                words[base + 1:base + 1 + len(operands)] = array("q", [int(op) for op in operands])
+
+        return ObjectFile(words, dict(symbols))
+
+    def __len__(self) -> int:
+        return len(self.__words) // WORD_SIZE
+
+    def get_symbols(self) -> Dict[str, int]:
+        return self.__symbols
+
+    def get_word(self, address: int) -> EncodedWord:
+        base = address * WORD_SIZE
+        opcode = self.__words[base]
+        if opcode == DATA_WORD:
+            return self.__words[base + 1]
+
+        inst = _opcodes[opcode]
+        return inst, list(self.__words[base + 1:base + 1 + len(inst.value[2])])
+
+    def get_words(self) -> List[EncodedWord]:
+        return [self.get_word(idx) for idx in range(len(self))]
+
+    # The value of every data word, with zeros where the instructions are (whose first operand is in that column), so
+    # it can be bulk-copied into memory.
+    def get_data_words(self) -> Sequence[int]:
+        values = array("q", self.__words[1::WORD_SIZE].tobytes())
+        for idx in self.get_instruction_addresses():
+            values[idx] = 0
+        return values
+
+    def get_instruction_addresses(self) -> List[int]:
+        return [idx for (idx, opcode) in enumerate(self.__words[0::WORD_SIZE]) if opcode != DATA_WORD]
+
+    def get_instruction(self, address: int) -> base_instruction.BaseInstruction | int:
+        return build_instruction(self.get_word(address))
+
+    def decode(self) -> List[base_instruction.BaseInstruction | int]:
+        return [self.get_instruction(idx) for idx in range(len(self))]
+
+    def to_bytes(self) -> bytes:
+        header = _header.pack(MAGIC, FORMAT_VERSION, 0, isa_fingerprint(), len(self), len(self.__symbols))
+        symbols = b"".join(_symbol.pack(len(name.encode()), address) + name.encode()
+                           for (name, address) in self.__symbols.items())
+        return header + self.__words.tobytes() + symbols
+
+    def save(self, path: str | Path):
+        # write to a temporary file first so that concurrent readers never see a partially written object
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def is_object_file(path: str | Path) -> bool:
+        with open(path, "rb") as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+
+    # memory-maps the file, so words are only decoded when they're read
+    @staticmethod
+    def load(path: str | Path) -> "ObjectFile":
+        if not ObjectFile.is_object_file(path):
+            raise Exception(f"{path} is not an object file.")
+
+        with open(path, "rb") as fh:
+            backing = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return ObjectFile.from_buffer(backing, str(path), backing)
+
+    # decodes an object file held in memory, e.g. one embedded in another file
+    @staticmethod
+    def from_buffer(buffer: bytes | mmap.mmap, name: str = "object file",
+                    backing: mmap.mmap | None = None) -> "ObjectFile":
+        (magic, version, _, fingerprint, num_words, num_symbols) = _header.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise Exception(f"{name} is not an object file.")
+        if version != FORMAT_VERSION:
+            raise Exception(f"{name} has object format version {version}, expected {FORMAT_VERSION}.")
+        if fingerprint != isa_fingerprint():
+            raise Exception(f"{name} was assembled for a different instruction set. Re-assemble it.")
+
+        words_end = _header.size + 8 * WORD_SIZE * num_words
+        words = memoryview(buffer)[_header.size:words_end].cast("q")
+
+        symbols = {}
+        offset = words_end
+        for _ in range(num_symbols):
+            (name_length, address) = _symbol.unpack_from(buffer, offset)
+            offset += _symbol.size
+            symbols[bytes(buffer[offset:offset + name_length]).decode()] = address
+            offset += name_length
+
+        return ObjectFile(words, symbols, backing)
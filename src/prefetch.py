@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import dram
+import machine
+
+
+# Detects constant strides in the addresses each load instruction (by PC) accesses, and once a stride has been seen
+# `threshold` times in a row, requests the words `distance` to `distance + degree - 1` strides ahead. Requests go to
+# memory in the background and land in a small prefetch buffer: a load that finds its word there takes `hit_latency`
+# cycles, or however long the request still has to go if it hasn't arrived yet. Given a DRAM, the requests go to it
+# together, otherwise they take memory_latency.
+class StridePrefetcher:
+    def __init__(self, machine_config: machine.MachineConfig | None = None, dram_model: dram.DRAM | None = None):
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.__settings = self.__machine.prefetch
+        self.__dram = dram_model
+
+        # PC -> (last address, stride, how many times in a row the stride has been seen)
+        self.__table: OrderedDict[int, Tuple[int, int, int]] = OrderedDict()
+        # address -> (cycle the word arrives, has a load used it yet?)
+        self.__buffer: OrderedDict[int, Tuple[int, bool]] = OrderedDict()
+
+        self.issued = 0
+        # prefetched words that were loaded before being evicted
+        self.useful = 0
+        # loads that went to memory through the prefetcher, and how many found their word prefetched
+        self.loads = 0
+        self.hits = 0
+        # hits on a word that was still on its way
+        self.late_hits = 0
+
+    # Called when a load starts its memory access. Returns how many cycles it takes, or None if the word wasn't
+    # prefetched and it has to go to memory as usual.
+    def lookup(self, address: int, now: int) -> int | None:
+        self.loads += 1
+        entry = self.__buffer.get(address)
+        if entry is None:
+            return None
+
+        (ready_at, used) = entry
+        self.hits += 1
+        if not used:
+            self.useful += 1
+            self.__buffer[address] = (ready_at, True)
+        if ready_at > now:
+            self.late_hits += 1
+            return max(ready_at - now, self.__settings["hit_latency"])
+        return self.__settings["hit_latency"]
+
+    # Then the load (if it's known which instruction it came from) trains the prefetcher, which may prefetch after it
+    def train(self, pc: int | None, address: int, now: int):
+        if pc is None:
+            return
+        (last_address, stride, confidence) = self.__table.pop(pc, (address, 0, 0))
+        new_stride = address - last_address
+        if new_stride != 0 and new_stride == stride:
+            confidence += 1
+        else:
+            confidence = 0
+        self.__table[pc] = (address, new_stride, confidence)
+        if len(self.__table) > self.__settings["table_size"]:
+            self.__table.popitem(last=False)
+
+        if new_stride == 0 or confidence < self.__settings["threshold"]:
+            return
+        distance = self.__settings["distance"]
+        self.__issue([address + ahead * new_stride for ahead in range(distance, distance + self.__settings["degree"])],
+                     now)
+
+    def __issue(self, addresses: List[int], now: int):
+        addresses = [address for address in addresses if address >= 0 and address not in self.__buffer]
+        if self.__dram is not None:
+            arrivals = self.__dram.access([(address, False) for address in addresses], now)
+        else:
+            arrivals = [now + self.__machine.memory_latency] * len(addresses)
+        for (address, ready_at) in zip(addresses, arrivals):
+            self.__buffer[address] = (ready_at, False)
+            self.issued += 1
+            if len(self.__buffer) > self.__settings["buffer_size"]:
+                self.__buffer.popitem(last=False)
+
+    # prefetched words that were used
+    def get_accuracy(self) -> float:
+        return self.useful / self.issued if self.issued != 0 else 0
+
+    # loads that found their word prefetched
+    def get_coverage(self) -> float:
+        return self.hits / self.loads if self.loads != 0 else 0
+
+    # hits where the word had already arrived
+    def get_timeliness(self) -> float:
+        return (self.hits - self.late_hits) / self.hits if self.hits != 0 else 0
+
+    def get_statistics(self) -> Dict[str, float]:
+        return {"issued": self.issued, "useful": self.useful, "loads": self.loads, "hits": self.hits,
+                "late_hits": self.late_hits, "accuracy": self.get_accuracy(), "coverage": self.get_coverage(),
+                "timeliness": self.get_timeliness()}
+
+    def print_statistics(self):
+        print(f"Prefetcher: {self.issued} prefetches issued, {self.hits}/{self.loads} loads hit "
+              f"({self.late_hits} of them before the prefetch had finished)")
+        print(f"\t Accuracy: {100 * self.get_accuracy():.1f}%, coverage: {100 * self.get_coverage():.1f}%, "
+              f"timeliness: {100 * self.get_timeliness():.1f}%")
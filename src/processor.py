@@ -1,111 +1,252 @@
-from typing import List
+from array import array
+from typing import Any, Dict, List, Sequence
 
 import alu
+import bypass
 import registers
 import clock
+import coherence
 import control
+import energy
+import log
+import machine
 import memory
+import objectfile
+import speculation
+import storage
+import tracefile
+import vector
 import writeback
-from src import flags
 from src.base_instruction import BaseInstruction
 
 
-class Processor:
-    def __init__(self, clock_speed: int, preload: List[BaseInstruction | int]):
-        self.register_file = registers.RegisterFile()
-        self.write_back = writeback.WriteBack()
-        self.clock = clock.Clock(clock_speed)
-
-        self.memory_unit = memory.Memory(self.register_file, self.write_back, self.clock)
-        self.alu = alu.ALU(self.register_file, self.write_back, self.clock, self.memory_unit)
-        self.control_unit = control.Control(self.alu, self.memory_unit, self.register_file, self.clock, self.write_back)
-
-        # load instructions and data to memory
-        self.preload_memory(preload)
+class RunStatistics:
+    def __init__(self, cycles: int, instructions: int, branches: int, mispredicts: int,
+                 energy_report: energy.EnergyReport | None = None):
+        self.cycles = cycles
+        self.instructions = instructions
+        self.branches = branches
+        self.mispredicts = mispredicts
+        self.energy = energy_report
 
-    def preload_memory(self, data: List[BaseInstruction | int]):
-        for (idx, item) in enumerate(data):
-            self.memory_unit.set(idx, item)
+    def get_cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions != 0 else 0
 
-    def run(self):
-        halted = False
-        inst_count = 0
-        should_continue_after_halt = False
 
-        num_mispredicts = 0
-        num_branches = 0
+# copies a program (and its data) into memory
+def preload_storage(store: storage.Storage, data: List[BaseInstruction | int] | objectfile.ObjectFile):
+    # Object files are decoded straight from the (memory-mapped) file.
+    # Data is copied in one go, then the instruction region is filled in.
+    if isinstance(data, objectfile.ObjectFile):
+        store.load_words(0, data.get_data_words())
+        for idx in data.get_instruction_addresses():
+            store.set(idx, data.get_instruction(idx))
+        return
 
-        while (not halted) or should_continue_after_halt:
-            # check hazards
-            is_branch, was_jmp = self.control_unit.check_hazards()
-            if is_branch:
-                num_branches += 1
+    for (idx, item) in enumerate(data):
+        store.set(idx, item)
 
-            # write-back stage
-            self.write_back.write()
-
-            # tick after every pipeline stage to simulate un-pipelined execution
-            if not flags.pipeline:
-                self.clock.tick()
-
-            # memory stage
-            self.memory_unit.exec_memory_actions()
-
-            if not flags.pipeline:
-                self.clock.tick()
 
-            # only memory and wb can happen after a halt has been executed
-            if not halted:
-                # execute stage
-                executed_cu, pc_changed, halted = self.control_unit.execute()
-                executed_alu = self.alu.execute()
-                executed_mem = self.memory_unit.execute()
+class Processor:
+    # The cores of a multicore system share their storage, which the program has already been loaded into, and each
+    # have a cache. A core starts executing at `entry`, with its number and the number of cores in CORE and CORES.
+    # Given a replay, the program's instructions do what the trace says they did instead of being evaluated.
+    def __init__(self, clock_speed: float, preload: List[BaseInstruction | int] | objectfile.ObjectFile | None,
+                 memory_size: int = 1 << 24, word_bits: int = 64, machine_config: machine.MachineConfig | None = None,
+                 store: storage.Storage | None = None, cache: coherence.Cache | None = None, core_id: int = 0,
+                 cores: int = 1, entry: int = 0, replay: tracefile.Replay | None = None):
+        # latencies and pipeline features
+        self.machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.core_id = core_id
 
-                if not flags.pipeline:
-                    self.clock.tick()
+        self.register_file = registers.RegisterFile()
+        self.register_file.set_register_value(registers.ArchRegisters.CORE, core_id)
+        self.register_file.set_register_value(registers.ArchRegisters.CORES, cores)
+        self.clock = clock.Clock(clock_speed)
+        self.bypass_network = bypass.BypassNetwork(self.register_file, self.machine)
+        self.write_back = writeback.WriteBack(self.register_file, self.bypass_network)
+
+        self.storage = store if store is not None else storage.Storage(memory_size, word_bits=word_bits)
+        self.speculation = speculation.Speculation(self.machine)
+        self.memory_unit = memory.Memory(self.register_file, self.write_back, self.clock, self.storage,
+                                         self.bypass_network, self.machine, cache, self.speculation)
+        self.alu = alu.ALU(self.register_file, self.write_back, self.clock, self.memory_unit, self.bypass_network,
+                           self.machine, self.speculation)
+        self.vector_unit = vector.VectorUnit(self.register_file, self.clock, self.memory_unit, self.bypass_network,
+                                             self.machine)
+        self.control_unit = control.Control(self.alu, self.memory_unit, self.register_file, self.clock, self.write_back,
+                                            self.bypass_network, self.machine, self.vector_unit, replay,
+                                            self.speculation)
+        self.control_unit.update_pc(entry)
 
-                inst_count = inst_count + executed_cu + executed_alu + executed_mem
+        # load instructions and data to memory
+        if preload is not None:
+            self.preload_memory(preload)
+
+        self.halted = False
+        # after a halt, the memory and write-back stages still need to finish what they started
+        self.__draining = False
+        self.inst_count = 0
+        self.num_branches = 0
+        self.num_mispredicts = 0
+
+    def preload_memory(self, data: List[BaseInstruction | int] | objectfile.ObjectFile):
+        preload_storage(self.storage, data)
+
+    # copies a block of data words into memory in one go, e.g. a data set loaded from a file
+    def load_data(self, address: int, words: Sequence[int]):
+        self.storage.load_words(address, words)
+
+    def dump_data(self, address: int, length: int) -> array:
+        return self.storage.read_words(address, length)
+
+    # has it still got anything to do?
+    def is_running(self) -> bool:
+        return (not self.halted) or self.__draining
+
+    # simulates one cycle
+    def step(self):
+        # check hazards
+        is_branch, was_jmp = self.control_unit.check_hazards()
+        if is_branch:
+            self.num_branches += 1
+
+        # write-back stage
+        self.write_back.write()
+
+        # tick after every pipeline stage to simulate un-pipelined execution
+        if not self.machine.pipeline:
+            self.clock.tick()
 
-                # if there has been a branch or HALT instruction, throw away the fetched instruction
-                # so that it isn't decoded on the next cycle
-                if pc_changed or halted:
-                    # the decoded result would be the instruction in the IR which now needs to be abandoned
-                    self.control_unit.update_ir(None)
-                    self.control_unit.decode()
+        # memory stage
+        self.memory_unit.exec_memory_actions()
 
-                    # if the PC was changed in the EX stage, it means that a Branch instruction changed the PC
-                    # since we predict that conditions are always false (i.e. no branch will happen), we mispredicted
-                    num_mispredicts += 1 if pc_changed else 0
-                    continue
+        if not self.machine.pipeline:
+            self.clock.tick()
 
-                else:
-                    self.control_unit.decode()
-                    if not flags.pipeline:
-                        self.clock.tick()
+        # only memory and wb can happen after a halt has been executed
+        if not self.halted:
+            # execute stage
+            executed_cu, pc_changed, self.halted = self.control_unit.execute()
+            executed_alu = self.alu.execute()
+            executed_mem = self.memory_unit.execute()
+            executed_vec = self.vector_unit.execute()
 
-                    # if there was a JMP that changed the PC, we still need to wait a cycle
-                    # the fetch stage shouldn't see the PC update until next cycle
-                    if not was_jmp:
-                        self.control_unit.instruction_fetch()
+            if not self.machine.pipeline:
+                self.clock.tick()
 
-            # tick -- this one happens in both pipelined and unpipelined
-            self.clock.tick()
+            self.inst_count = self.inst_count + executed_cu + executed_alu + executed_mem + executed_vec
+            # a fused compare-and-branch is two instructions
+            self.inst_count += self.control_unit.fusion.take_uncounted()
+            # instructions that were squashed after executing never really did
+            self.inst_count -= self.speculation.take_uncounted()
+
+            # if there has been a branch or HALT instruction, throw away the fetched instruction
+            # so that it isn't decoded on the next cycle
+            if pc_changed or self.halted:
+                # the decoded result would be the instruction in the IR which now needs to be abandoned
+                self.control_unit.update_ir(None)
+                self.control_unit.decode()
+
+                # if the PC was changed in the EX stage, it means that a Branch instruction changed the PC
+                # since we predict that conditions are always false (i.e. no branch will happen), we mispredicted
+                self.num_mispredicts += 1 if pc_changed else 0
+                return
+
+            else:
+                self.control_unit.decode()
+                if not self.machine.pipeline:
+                    self.clock.tick()
 
-            # Print Register File
-            print("----------------------")
-            self.register_file.print_register_file(self.clock.get_time())
-            print("----------------------")
-            print("")
-
-            # after a halt, we should let things further on from the execute stage (i.e. memory and writeback) finish
-            # what they started
-            should_continue_after_halt = (
-                    (not self.memory_unit.is_available())
-                    or self.memory_unit.is_mem_busy()
-                    or (not self.write_back.is_available())
-            )
-
-        print(f"Executed {inst_count} instructions in {self.clock.get_time()} cycles")
-        print(f"Cycles per Instruction: {self.clock.get_time() / inst_count}")
-        if num_branches != 0:
-            print(f"Branch mispredicts: {num_mispredicts}/{num_branches} ({100 - 100*num_mispredicts/num_branches}% correct)")
+                # if there was a JMP that changed the PC, we still need to wait a cycle
+                # the fetch stage shouldn't see the PC update until next cycle
+                if not was_jmp:
+                    self.control_unit.instruction_fetch()
+
+        # tick -- this one happens in both pipelined and unpipelined
+        self.clock.tick()
+
+        # Print Register File
+        if log.CYCLE.enabled:
+            self.log_register_file()
+
+        # after a halt, we should let things further on from the execute stage (i.e. memory and writeback) finish
+        # what they started
+        self.__draining = (
+                (not self.memory_unit.is_available())
+                or self.memory_unit.is_mem_busy()
+                or (not self.write_back.is_available())
+        )
+
+    # the register file at the end of every cycle, for the cycle log
+    def log_register_file(self):
+        log.CYCLE.info("----------------------\n"
+                       f"{self.register_file.format_register_file(self.clock.get_time())}\n"
+                       "----------------------\n")
+
+    def get_statistics(self) -> RunStatistics:
+        return RunStatistics(self.clock.get_time(), self.inst_count, self.num_branches, self.num_mispredicts,
+                             energy.estimate([self], self.machine))
+
+    # Every counter the statistics are printed from, by unit, for anything that wants them as data rather than text.
+    # Units that aren't in use (e.g. the prefetcher when it's turned off) are left out.
+    def get_counters(self) -> Dict[str, Any]:
+        return_stack = self.control_unit.return_stack
+        counters: Dict[str, Any] = {
+            "cycles": self.clock.get_time(),
+            "instructions": self.inst_count,
+            "branches": self.num_branches,
+            "mispredicts": self.num_mispredicts,
+            "hardware_loop_iterations": self.control_unit.hardware_loops.loop_backs,
+            "return_stack": {"pushes": return_stack.pushes, "predictions": return_stack.predictions,
+                             "correct": return_stack.correct, "empty": return_stack.empty,
+                             "overflows": return_stack.overflows},
+            "fusion": {"executed": self.control_unit.fusion.executed, "taken": self.control_unit.fusion.taken},
+            "bypass": {"register_reads": self.bypass_network.get_register_reads(),
+                       **self.bypass_network.get_uses()},
+            "speculation": {"branches": self.speculation.branches, "dispatched": self.speculation.dispatched,
+                            "squashed": self.speculation.squashed, "mispredicts": self.speculation.mispredicts,
+                            "wasted_cycles": self.speculation.wasted_cycles, "deepest": self.speculation.deepest,
+                            "predictions": self.speculation.predictor.predictions,
+                            "predicted_right": self.speculation.predictor.correct},
+            "vector": {"instructions": self.vector_unit.instructions, "elements": self.vector_unit.elements},
+            "memory": {"reads": self.memory_unit.reads, "writes": self.memory_unit.writes},
+            "register_file": {"writes": self.register_file.writes, "rename_lookups": self.register_file.rat_reads,
+                              "rename_writes": self.register_file.rat_writes},
+            "write_backs": self.write_back.writes,
+        }
+        if self.memory_unit.prefetcher is not None:
+            counters["prefetch"] = self.memory_unit.prefetcher.get_statistics()
+        if self.memory_unit.dram is not None:
+            counters["dram"] = self.memory_unit.dram.get_statistics(self.clock.get_time())
+        if self.memory_unit.cache is not None:
+            counters["cache"] = self.memory_unit.cache.statistics.get_statistics()
+        return counters
+
+    def print_statistics(self):
+        print(f"Executed {self.inst_count} instructions in {self.clock.get_time()} cycles")
+        print(f"Cycles per Instruction: {self.clock.get_time() / self.inst_count}")
+        energy.estimate([self], self.machine).print_report()
+        if self.num_branches != 0:
+            print(f"Branch mispredicts: {self.num_mispredicts}/{self.num_branches} "
+                  f"({100 - 100*self.num_mispredicts/self.num_branches}% correct)")
+        if self.control_unit.hardware_loops.loop_backs != 0:
+            print(f"Hardware loop iterations: {self.control_unit.hardware_loops.loop_backs}")
+        self.control_unit.return_stack.print_statistics()
+        self.control_unit.fusion.print_statistics(self.inst_count)
+        self.bypass_network.print_statistics()
+        self.speculation.print_statistics()
+        if self.vector_unit.instructions != 0:
+            print(f"Vector unit: {self.vector_unit.instructions} instructions over {self.vector_unit.elements} elements "
+                  f"({self.vector_unit.elements / self.vector_unit.instructions:.1f} per instruction)")
+        if self.memory_unit.prefetcher is not None:
+            self.memory_unit.prefetcher.print_statistics()
+        if self.memory_unit.dram is not None:
+            self.memory_unit.dram.print_statistics(self.clock.get_time(), self.storage.get_word_bits())
+
+    def run(self) -> RunStatistics:
+        while self.is_running():
+            self.step()
+
+        self.print_statistics()
+        return self.get_statistics()
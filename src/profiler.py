@@ -0,0 +1,159 @@
+import cProfile
+import contextlib
+import sys
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Tuple
+
+import processor
+
+"""
+Where the simulator itself spends its time, for working out why it got slower. Two kinds of profile:
+
+    stages      StageProfiler times each pipeline stage of every core with perf_counter_ns, and prints how much of
+                the run went to each one and how long it takes per simulated cycle. The stages' methods are wrapped
+                on the cores being profiled, so a run that isn't profiled doesn't pay anything for it.
+    functions   record() runs the simulation under cProfile and saves the stats for pstats (or snakeviz and the
+                like), or, for a FILE ending in .folded or .collapsed, traces every call and writes the time spent
+                in each call stack as collapsed stacks, one "a;b;c nanoseconds" line per stack, ready for
+                flamegraph.pl or speedscope. Both slow the simulation down a lot, so the stage times are only
+                worth looking at without them.
+"""
+
+# (what the stage is called, the part of a core it's a method of, or None for the core itself, and the method)
+STAGES: List[Tuple[str, str | None, str]] = [
+    ("hazards", "control_unit", "check_hazards"),
+    ("write-back", "write_back", "write"),
+    ("memory", "memory_unit", "exec_memory_actions"),
+    ("execute: control", "control_unit", "execute"),
+    ("execute: ALU", "alu", "execute"),
+    ("execute: memory", "memory_unit", "execute"),
+    ("execute: vector", "vector_unit", "execute"),
+    ("decode", "control_unit", "decode"),
+    ("fetch", "control_unit", "instruction_fetch"),
+    ("register dump", None, "log_register_file"),
+]
+
+COLLAPSED_SUFFIXES = (".folded", ".collapsed")
+
+
+class StageProfiler:
+    def __init__(self, cores: List[processor.Processor]):
+        self.__cores = cores
+        # [nanoseconds, calls] for each stage, shared by every core
+        self.__stages: Dict[str, List[int]] = {label: [0, 0] for (label, _, _) in STAGES}
+        # the whole of every step, which the stages are a part of
+        self.__steps = [0, 0]
+        for core in cores:
+            for (label, part, method) in STAGES:
+                owner = getattr(core, part) if part is not None else core
+                setattr(owner, method, self.__timed(getattr(owner, method), self.__stages[label]))
+            core.step = self.__timed(core.step, self.__steps)
+        self.__overhead = self.__calibrate()
+
+    @staticmethod
+    def __timed(method: Callable, totals: List[int]) -> Callable:
+        def timed(*args):
+            start = perf_counter_ns()
+            result = method(*args)
+            totals[0] += perf_counter_ns() - start
+            totals[1] += 1
+            return result
+        return timed
+
+    # roughly how many nanoseconds timing a call adds to the step around it
+    def __calibrate(self, samples: int = 10000) -> float:
+        timed = self.__timed(lambda: None, [0, 0])
+        start = perf_counter_ns()
+        for _ in range(samples):
+            timed()
+        timed_time = perf_counter_ns() - start
+        untimed = lambda: None
+        start = perf_counter_ns()
+        for _ in range(samples):
+            untimed()
+        return max(0.0, (timed_time - (perf_counter_ns() - start)) / samples)
+
+    def print_report(self):
+        (total, steps) = self.__steps
+        # every core's cycles, as each one has its own clock
+        cycles = sum(core.clock.get_time() for core in self.__cores)
+        if steps == 0 or cycles == 0:
+            return
+        print(f"Host time: {total / 1e9:.3f}s simulating {cycles} cycles ({total / cycles / 1000:.1f} us per cycle, "
+              f"{cycles / (total / 1e9):.0f} cycles per second)")
+        print(f"\t {'stage':<18} {'ms':>10} {'share':>7} {'ns/cycle':>10} {'calls':>10}")
+        rows = [(label, spent, calls) for (label, (spent, calls)) in self.__stages.items() if calls != 0]
+        timers = int(self.__overhead * sum(calls for (_, _, calls) in rows))
+        # whatever's left is the step itself, e.g. counting instructions
+        rows.append(("rest of the step", max(0, total - sum(spent for (_, spent, _) in rows) - timers), steps))
+        rows.append(("timers (estimate)", timers, 0))
+        for (label, spent, calls) in sorted(rows, key=lambda row: row[1], reverse=True):
+            print(f"\t {label:<18} {spent / 1e6:>10.1f} {100 * spent / total:>6.1f}% {spent / cycles:>10.0f} "
+                  f"{calls:>10}")
+
+
+# Times every call under sys.setprofile, charging the time between events to the call stack it was spent in.
+class CollapsedStacks:
+    def __init__(self):
+        # the stacks as "a;b;c", from the outermost call in
+        self.__stack: List[str] = []
+        self.__times: Dict[str, int] = {}
+        self.__last = 0
+
+    @staticmethod
+    def __get_name(frame, event: str, arg) -> str:
+        if event == "c_call":
+            return f"{getattr(arg, '__qualname__', repr(arg))} (builtin)"
+        code = frame.f_code
+        return f"{code.co_qualname if hasattr(code, 'co_qualname') else code.co_name} " \
+               f"({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+    def __event(self, frame, event: str, arg):
+        now = perf_counter_ns()
+        if len(self.__stack) > 0:
+            stack = self.__stack[-1]
+            self.__times[stack] = self.__times.get(stack, 0) + now - self.__last
+        if event == "call" or event == "c_call":
+            name = self.__get_name(frame, event, arg)
+            self.__stack.append(f"{self.__stack[-1]};{name}" if len(self.__stack) > 0 else name)
+        elif len(self.__stack) > 0:
+            # returns from calls made before tracing started have nothing to pop
+            self.__stack.pop()
+        self.__last = perf_counter_ns()
+
+    def start(self):
+        self.__last = perf_counter_ns()
+        sys.setprofile(self.__event)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def write(self, path: str):
+        with open(path, "w") as fh:
+            for (stack, spent) in sorted(self.__times.items()):
+                fh.write(f"{stack} {spent}\n")
+
+
+# Profiles what runs inside it, and saves the profile to `path` at the end (see the top of the file).
+@contextlib.contextmanager
+def record(path: str):
+    if path.endswith(COLLAPSED_SUFFIXES):
+        stacks = CollapsedStacks()
+        stacks.start()
+        try:
+            yield
+        finally:
+            stacks.stop()
+            stacks.write(path)
+        print(f"Wrote collapsed call stacks to {path} (times in nanoseconds)")
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+    print(f"Wrote the host profile to {path}, see it with: python -m pstats {path}")
@@ -1,6 +1,8 @@
 from collections import deque
 from enum import IntEnum, verify, UNIQUE
-from typing import Deque, List
+from typing import Deque, List, Tuple
+
+import log
 
 
 @verify(UNIQUE)
@@ -19,6 +21,21 @@ class ArchRegisters(IntEnum):
     R11 = 11
     R12 = 12
     R13 = 13
+    # vector registers, each holding up to the machine's maximum vector length of elements
+    V0 = 14
+    V1 = 15
+    V2 = 16
+    V3 = 17
+    V4 = 18
+    V5 = 19
+    V6 = 20
+    V7 = 21
+    # vector length: how many elements vector instructions operate on
+    VL = 22
+    # which core this is, and how many cores there are. Set when the program starts, so the same program can split
+    # its work between cores.
+    CORE = 23
+    CORES = 24
 
 
 @verify(UNIQUE)
@@ -80,37 +97,79 @@ class PhysicalRegisters(IntEnum):
     P54 = 54
     P55 = 55
     P56 = 56
+    P57 = 57
+    P58 = 58
+    P59 = 59
+    P60 = 60
+    P61 = 61
+    P62 = 62
+    P63 = 63
+    P64 = 64
+    P65 = 65
+    P66 = 66
+    P67 = 67
+    P68 = 68
+    P69 = 69
+    P70 = 70
+    P71 = 71
+    P72 = 72
+    P73 = 73
+    P74 = 74
+    P75 = 75
+    P76 = 76
+    P77 = 77
+    P78 = 78
+    P79 = 79
+    P80 = 80
+    P81 = 81
 
 
 Registers = ArchRegisters | PhysicalRegisters
 
+VECTOR_REGISTERS = frozenset(ArchRegisters(idx) for idx in range(ArchRegisters.V0, ArchRegisters.V7 + 1))
 
-class RegisterFile:
-    __registers = None
-    __rat = []  # idx is arch reg, value is physical
-    __available_reg: Deque[int] = deque()
-
-    def __new__(cls, ):
-        if cls.__registers is None:
-            cls.__registers = super(RegisterFile, cls).__new__(cls)
-        return cls.__registers
 
+class RegisterFile:
     def __init__(self):
         self.__registers = [0] * len(PhysicalRegisters)
         self.__rat = list(range(len(ArchRegisters)))
         self.__available_reg = deque(range(len(ArchRegisters), len(PhysicalRegisters)))
 
+        # activity, for the energy model
+        self.writes = 0
+        self.rat_reads = 0
+        self.rat_writes = 0
+
     def alias_register(self, arch: ArchRegisters) -> PhysicalRegisters:
         # free the physical reg that is currently there
         self.__available_reg.append(self.__rat[arch])
         reg = self.__available_reg.popleft()
         # alias it to a new one
         self.__rat[arch] = reg
+        self.rat_writes += 1
         return PhysicalRegisters(reg)
 
     def get_rat(self) -> List[int]:
         return self.__rat
 
+    # the register alias table and free registers, so renaming can be undone
+    def checkpoint(self) -> Tuple[List[int], Deque[int]]:
+        return list(self.__rat), deque(self.__available_reg)
+
+    def restore(self, checkpoint: Tuple[List[int], Deque[int]]):
+        (rat, available) = checkpoint
+        self.__rat = list(rat)
+        self.__available_reg = deque(available)
+
+    # looks up the physical registers an instruction's sources are mapped to, and replaces them
+    def rename_sources(self, instruction):
+        self.rat_reads += sum(1 for source in instruction.get_sources() if isinstance(source, ArchRegisters))
+        instruction.update_source_registers(self.__rat)
+
+    # a copy of every physical register's value
+    def get_physical_values(self) -> List[int]:
+        return list(self.__registers)
+
     def print_physica_register_file(self, time: int | None = None):
         if time is not None:
             print(f"Register file at t={time}")
@@ -122,20 +181,22 @@ class RegisterFile:
             print(f"{name} \t {val}")
 
     def print_register_file(self, time: int | None = None):
-        if time is not None:
-            print(f"Register file at t={time}")
-        else:
-            print("Register File")
+        print(self.format_register_file(time))
 
+    def format_register_file(self, time: int | None = None) -> str:
+        lines = [f"Register file at t={time}" if time is not None else "Register File"]
         for idx in ArchRegisters:
             name = ArchRegisters(idx).name
             phys = self.__rat[idx]
             val = self.__registers[phys]
-            print(f"{name} (P{phys}) \t {val}")
+            lines.append(f"{name} (P{phys}) \t {val}")
+        return "\n".join(lines)
 
     def get_register_value(self, register: ArchRegisters) -> int:
-        print(f"\t getting register {PhysicalRegisters(register).name} at index {register}")
+        if log.REGS.verbose:
+            log.REGS.debug(f"\t getting register {PhysicalRegisters(register).name} at index {register}")
         return self.__registers[register]
 
     def set_register_value(self, register: PhysicalRegisters, new_val: int):
+        self.writes += 1
         self.__registers[register] = new_val
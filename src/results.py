@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+import datafiles
+import energy
+import objectfile
+
+"""
+Persistent cache of simulation results, so a sweep only simulates the design points it hasn't seen before. Results are
+content-addressed: the key is a hash of everything that decides how a run turns out,
+
+    program     the assembled object file (so editing the source, or scheduling it, is a different program)
+    machine     the full machine description, with every default filled in, so a setting left out and the same
+                setting given explicitly share an entry
+    run         memory size, word width, number of cores and the contents of any data files loaded into memory
+    simulator   SIMULATOR_VERSION and a fingerprint of the simulator's source, so changing the simulator can never
+                return results from the old one
+
+Each result is a small JSON file named after its key, which also records which program it was for so that the results
+for one program can be thrown away on their own.
+"""
+
+# bump whenever the results change in a way the source fingerprint wouldn't notice
+SIMULATOR_VERSION = 1
+
+_fingerprint: str | None = None
+
+
+# A hash of the simulator's source files, worked out once.
+def simulator_fingerprint() -> str:
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(f"{SIMULATOR_VERSION}:{objectfile.isa_fingerprint()}".encode())
+        for path in sorted(Path(__file__).parent.glob("*.py")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+def get_program_hash(program: objectfile.ObjectFile) -> str:
+    return hashlib.sha256(program.to_bytes()).hexdigest()
+
+
+# What a run produced, as much as is needed to rank it against the others.
+class CachedResult:
+    def __init__(self, cycles: int, instructions: int, energy_report: energy.EnergyReport):
+        self.cycles = cycles
+        self.instructions = instructions
+        self.energy = energy_report
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"cycles": self.cycles, "instructions": self.instructions, "energy": self.energy.to_dict()}
+
+    @staticmethod
+    def from_dict(saved: Dict[str, Any]) -> "CachedResult":
+        return CachedResult(saved["cycles"], saved["instructions"], energy.EnergyReport.from_dict(saved["energy"]))
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str | Path | None = None):
+        if cache_dir is None:
+            cache_root = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+            cache_dir = Path(cache_root) / "coms30046-sim" / "results"
+        self.__cache_dir = Path(cache_dir)
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidated = 0
+
+    # run settings are plain values, apart from the data files, whose contents are hashed in
+    def get_key(self, program: objectfile.ObjectFile, description: Dict[str, Any], memory_size: int, word_bits: int,
+                load_data: List[str] = (), cores: int | None = None) -> str:
+        data = []
+        for spec in load_data:
+            (path, address) = datafiles.parse_load(spec, program.get_symbols())
+            data.append([hashlib.sha256(datafiles.read_data_file(path).tobytes()).hexdigest(), address])
+        key = {
+            "simulator": simulator_fingerprint(),
+            "program": get_program_hash(program),
+            "machine": description,
+            "run": {"memory_size": memory_size, "word_bits": word_bits, "cores": cores, "data": data},
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def __get_path(self, key: str) -> Path:
+        return self.__cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> CachedResult | None:
+        path = self.__get_path(key)
+        if path.exists():
+            try:
+                with open(path) as fh:
+                    result = CachedResult.from_dict(json.load(fh)["result"])
+                self.hits += 1
+                return result
+            except Exception:
+                # corrupted or stale entry, so it'll be overwritten
+                pass
+        self.misses += 1
+        return None
+
+    def put(self, key: str, program: objectfile.ObjectFile, result: CachedResult):
+        self.__cache_dir.mkdir(parents=True, exist_ok=True)
+        # Written under another name first, so a sweep that's interrupted never leaves half an entry behind. The name
+        # is this process's own, so sweeps storing the same point at once don't write into each other's file.
+        path = self.__get_path(key)
+        partial = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(partial, "w") as fh:
+            json.dump({"program": get_program_hash(program), "result": result.to_dict()}, fh)
+        os.replace(partial, path)
+        self.stores += 1
+
+    def __get_entries(self) -> List[Path]:
+        return sorted(self.__cache_dir.glob("*.json")) if self.__cache_dir.exists() else []
+
+    # Throws away the results for one program, or everything. Returns how many were thrown away.
+    def invalidate(self, program: objectfile.ObjectFile | None = None) -> int:
+        program_hash = get_program_hash(program) if program is not None else None
+        removed = 0
+        for path in self.__get_entries():
+            if program_hash is not None:
+                try:
+                    with open(path) as fh:
+                        if json.load(fh)["program"] != program_hash:
+                            continue
+                except Exception:
+                    # unreadable, so it may as well go
+                    pass
+            path.unlink(missing_ok=True)
+            removed += 1
+        self.invalidated += removed
+        return removed
+
+    def print_statistics(self):
+        looked_up = self.hits + self.misses
+        hit_rate = 100 * self.hits / looked_up if looked_up != 0 else 0
+        print(f"Result cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {self.stores} "
+              f"stored" + (f", {self.invalidated} invalidated" if self.invalidated != 0 else ""))
+
+    def print_summary(self):
+        entries = self.__get_entries()
+        size = sum(path.stat().st_size for path in entries)
+        print(f"{self.__cache_dir}: {len(entries)} results, {size / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Show or clear the cached simulation results")
+    arg_parser.add_argument("--cache-dir", type=str, default=None,
+                            help="Where results are cached. Default: $XDG_CACHE_HOME/coms30046-sim/results")
+    arg_parser.add_argument("--clear", action="store_true", help="Throw away every cached result")
+
+    args = arg_parser.parse_args()
+    cache = ResultCache(args.cache_dir)
+    if args.clear:
+        print(f"Removed {cache.invalidate()} results")
+    cache.print_summary()
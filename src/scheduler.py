@@ -0,0 +1,164 @@
+from typing import Dict, List, Set, Tuple
+
+import control
+import machine
+import memory
+import objectfile
+import registers
+
+
+# A node in a basic block's dependency DAG
+class ScheduleNode:
+    def __init__(self, idx: int, word: objectfile.EncodedWord, machine_config: machine.MachineConfig):
+        self.idx = idx
+        self.word = word
+
+        instruction = objectfile.build_instruction(word)
+        # immediates are stored alongside registers by some instructions, so only keep actual registers
+        self.sources: Set[int] = {src for src in instruction.get_sources() if isinstance(src, registers.ArchRegisters)}
+        dest = instruction.get_dest()
+        self.dest: int | None = dest if isinstance(dest, registers.ArchRegisters) else None
+
+        self.is_load = isinstance(instruction, memory.BaseMemoryInstruction) and self.dest is not None
+        self.is_store = isinstance(instruction, memory.BaseMemoryInstruction) and self.dest is None
+        self.latency = machine_config.get_latency(instruction)
+
+        # successors, and how many cycles after this starts each of them can start
+        self.successors: List[ScheduleNode] = []
+        self.edge_latencies: List[int] = []
+        self.num_predecessors = 0
+
+        # latency-weighted length of the longest path from here to the end of the block
+        self.priority = 0
+        # earliest cycle this can start, given the predecessors that have been scheduled
+        self.earliest = 0
+
+    def add_successor(self, node: "ScheduleNode", latency: int):
+        self.successors.append(node)
+        self.edge_latencies.append(latency)
+        node.num_predecessors += 1
+
+
+# Static list scheduler. Within each basic block, instructions are reordered so that consumers are moved away from their
+# producers, filling the gap with independent instructions. Blocks are never merged, and control instructions and data
+# words stay where they are, so every address that can be jumped to still holds the same instruction.
+class ListScheduler:
+    def __init__(self, program: List[objectfile.EncodedWord], symbols: Dict[str, int],
+                 machine_config: machine.MachineConfig | None = None):
+        self.__program = program
+        self.__symbols = symbols
+        # instructions are scheduled for this machine's latencies
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+
+    def schedule(self) -> List[objectfile.EncodedWord]:
+        scheduled = list(self.__program)
+        for (start, end) in self.get_basic_blocks():
+            scheduled[start:end] = self.__schedule_block(start, end)
+        return scheduled
+
+    def __is_instruction(self, idx: int) -> bool:
+        return not isinstance(self.__program[idx], int)
+
+    def __is_control(self, idx: int) -> bool:
+        return issubclass(self.__program[idx][0].value[1], control.BaseControlInstruction)
+
+    # Returns [start, end) of each run of schedulable instructions.
+    # A block starts at anything that might be jumped to: labels (which also covers targets of register jumps, as
+    # their targets have to come from somewhere) and immediate branch targets. Blocks end at control instructions.
+    def get_basic_blocks(self) -> List[Tuple[int, int]]:
+        leaders = set(self.__symbols.values())
+        for word in self.__program:
+            if isinstance(word, int):
+                continue
+            (inst, operands) = word
+            if issubclass(inst.value[1], control.BaseControlInstruction):
+                leaders.update(op for (kind, op) in zip(inst.value[2], operands) if kind == "i")
+
+        blocks = []
+        start = None
+        for idx in range(len(self.__program) + 1):
+            schedulable = idx < len(self.__program) and self.__is_instruction(idx) and not self.__is_control(idx)
+            if start is not None and (not schedulable or idx in leaders):
+                blocks.append((start, idx))
+                start = None
+            if schedulable and start is None:
+                start = idx
+        return blocks
+
+    def __build_dag(self, nodes: List[ScheduleNode]):
+        last_writer: Dict[int, ScheduleNode] = {}
+        readers_since_write: Dict[int, List[ScheduleNode]] = {}
+        last_store: ScheduleNode | None = None
+        loads_since_store: List[ScheduleNode] = []
+
+        for node in nodes:
+            # read after write: wait for the result
+            for src in node.sources:
+                if src in last_writer:
+                    last_writer[src].add_successor(node, last_writer[src].latency)
+
+            if node.dest is not None:
+                # write after write and write after read: just keep the order
+                if node.dest in last_writer:
+                    last_writer[node.dest].add_successor(node, 0)
+                for reader in readers_since_write.get(node.dest, []):
+                    if reader is not node:
+                        reader.add_successor(node, 0)
+
+            # memory is ordered around stores; loads can be reordered between themselves
+            if node.is_store:
+                if last_store is not None:
+                    last_store.add_successor(node, 0)
+                for load in loads_since_store:
+                    load.add_successor(node, 0)
+                last_store = node
+                loads_since_store = []
+            elif node.is_load:
+                if last_store is not None:
+                    last_store.add_successor(node, last_store.latency)
+                loads_since_store.append(node)
+
+            for src in node.sources:
+                readers_since_write.setdefault(src, []).append(node)
+            if node.dest is not None:
+                last_writer[node.dest] = node
+                readers_since_write[node.dest] = []
+
+        for node in reversed(nodes):
+            node.priority = max([node.latency] + [succ.priority + latency for (succ, latency)
+                                                  in zip(node.successors, node.edge_latencies)])
+
+    def __schedule_block(self, start: int, end: int) -> List[objectfile.EncodedWord]:
+        nodes = [ScheduleNode(idx, self.__program[idx], self.__machine) for idx in range(start, end)]
+        self.__build_dag(nodes)
+
+        candidates = [node for node in nodes if node.num_predecessors == 0]
+        order = []
+        cycle = 0
+
+        # single issue: one instruction per cycle, preferring whichever ready instruction is on the longest path
+        while len(candidates) > 0:
+            ready = [node for node in candidates if node.earliest <= cycle]
+            if len(ready) == 0:
+                # nothing can start yet, so stall until the first candidate can
+                cycle = min(node.earliest for node in candidates)
+                ready = [node for node in candidates if node.earliest <= cycle]
+
+            chosen = max(ready, key=lambda node: (node.priority, -node.idx))
+            candidates.remove(chosen)
+            order.append(chosen.word)
+
+            for (succ, latency) in zip(chosen.successors, chosen.edge_latencies):
+                succ.earliest = max(succ.earliest, cycle + latency)
+                succ.num_predecessors -= 1
+                if succ.num_predecessors == 0:
+                    candidates.append(succ)
+            cycle += 1
+
+        return order
+
+
+def schedule_object(obj: objectfile.ObjectFile, machine_config: machine.MachineConfig | None = None) \
+        -> objectfile.ObjectFile:
+    scheduled = ListScheduler(obj.get_words(), obj.get_symbols(), machine_config).schedule()
+    return objectfile.ObjectFile.encode(scheduled, obj.get_symbols())
@@ -0,0 +1,190 @@
+import contextlib
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import dashboard
+import energy
+import log
+import machine
+import multicore
+import objectfile
+import processor
+import registers
+import tracefile
+from assembler import Assembler, ObjectCache, load_program
+from src.base_instruction import BaseInstruction
+
+"""
+The simulator as a library, for notebooks and scripts that want to drive a run and look at it as it goes rather than
+read what main.py prints:
+
+    sim = simulation.Simulation.from_source(source, machine_config=machine.MachineConfig.load("fast.toml"))
+    sim.run_until(pc=sim.get_symbol("loop"))
+    print(sim.get_register("R3"), sim.read_memory(sim.get_symbol("array"), 8))
+    sim.step(100)
+    results = sim.run()
+    print(results.cycles, results.get_cpi(), results.energy.energy, results.to_dict())
+
+Nothing is printed: the simulator's log is turned off while it runs (unless `quiet` is False), and instead of
+statistics, a run gives back SimulationResults with every counter in it. With more than one core (or the number of
+cores given), it's a multicore system, and the state of each core can be looked at by its number.
+"""
+
+# why run_until() stopped
+STOP_REASONS = ("pc", "cycle", "instructions", "halted")
+
+
+# What a run did, as data: the totals, energy, and every core's counters (see Processor.get_counters()).
+class SimulationResults:
+    def __init__(self, target: processor.Processor | multicore.MultiCore, machine_config: machine.MachineConfig):
+        cores = target.cores if isinstance(target, multicore.MultiCore) else [target]
+        # the cores run side by side, so the system takes as long as the slowest
+        self.cycles = max(core.clock.get_time() for core in cores)
+        self.instructions = sum(core.inst_count for core in cores)
+        self.halted = not target.is_running()
+        self.energy = energy.estimate(cores, machine_config)
+        self.cores: List[Dict[str, Any]] = [core.get_counters() for core in cores]
+        # the bus between the cores' caches
+        self.bus: Dict[str, Any] | None = None
+        if isinstance(target, multicore.MultiCore):
+            interconnect = target.interconnect
+            self.bus = {"protocol": machine_config.multicore["protocol"], "transactions": interconnect.transactions,
+                        "cache_to_cache": interconnect.cache_to_cache}
+            if interconnect.dram is not None:
+                self.bus["dram"] = interconnect.dram.get_statistics(self.cycles)
+
+    def get_cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions != 0 else 0
+
+    def get_ipc(self) -> float:
+        return self.instructions / self.cycles if self.cycles != 0 else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        saved = {"cycles": self.cycles, "instructions": self.instructions, "cpi": self.get_cpi(),
+                 "halted": self.halted, "energy": {**self.energy.to_dict(), **self.energy.get_statistics()},
+                 "cores": self.cores}
+        if self.bus is not None:
+            saved["bus"] = self.bus
+        return saved
+
+
+class Simulation:
+    # Loads a program (an object file, or the words of one) into a new processor, or a multicore system. `load_data`
+    # are data files to copy into memory, as FILE@ADDRESS like main.py's --load-data. Given a trace of the program,
+    # the processor replays it.
+    def __init__(self, program: objectfile.ObjectFile | List[BaseInstruction | int],
+                 machine_config: machine.MachineConfig | None = None, memory_size: int = 1 << 24,
+                 word_bits: int = 64, cores: int | None = None, entry_points: List[int] = (),
+                 load_data: List[str] = (), trace: tracefile.TraceReader | None = None, quiet: bool = True):
+        self.machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.program = program
+        self.__quiet = quiet
+        if isinstance(program, objectfile.ObjectFile):
+            self.target = multicore.build_processor(program, 0, memory_size, word_bits, load_data, self.machine,
+                                                    cores, entry_points, trace)
+        elif cores is not None or self.machine.multicore["cores"] > 1 or len(entry_points) > 1 or len(load_data) > 0 \
+                or trace is not None:
+            raise Exception("Only an object file can be run on several cores, have data files loaded or be replayed, "
+                            "not a list of words.")
+        else:
+            self.target = processor.Processor(0, program, memory_size=memory_size, word_bits=word_bits,
+                                              machine_config=self.machine,
+                                              entry=entry_points[0] if entry_points else 0)
+        self.cores: List[processor.Processor] = \
+            self.target.cores if isinstance(self.target, multicore.MultiCore) else [self.target]
+
+    @staticmethod
+    def from_source(source: str, machine_config: machine.MachineConfig | None = None, **options) -> "Simulation":
+        return Simulation(Assembler(input_str=source).assemble_object(), machine_config, **options)
+
+    # assembly (assembled through the object cache unless `use_cache` is False) or an object file
+    @staticmethod
+    def from_file(path: str | Path, machine_config: machine.MachineConfig | None = None, use_cache: bool = True,
+                  **options) -> "Simulation":
+        return Simulation(load_program(path, ObjectCache() if use_cache else None), machine_config, **options)
+
+    def is_running(self) -> bool:
+        return self.target.is_running()
+
+    def get_cycles(self) -> int:
+        return max(core.clock.get_time() for core in self.cores)
+
+    def get_instructions(self) -> int:
+        return sum(core.inst_count for core in self.cores)
+
+    # Simulates until at least `cycles` more cycles have gone by (a step of an un-pipelined processor takes several),
+    # or it halts. Returns how many went by.
+    def step(self, cycles: int = 1) -> int:
+        start = self.get_cycles()
+        with log.silenced() if self.__quiet else contextlib.nullcontext():
+            while self.target.is_running() and self.get_cycles() - start < cycles:
+                self.target.step()
+        return self.get_cycles() - start
+
+    # Simulates until a core is about to fetch the instruction at `pc`, the clock reaches `cycle` or `instructions`
+    # have been executed, whichever comes first, or until it halts. It always moves on at least one step, so it can be
+    # called again to get to the next time `pc` is fetched. Returns which of STOP_REASONS it stopped for.
+    def run_until(self, pc: int | None = None, cycle: int | None = None, instructions: int | None = None) -> str:
+        with log.silenced() if self.__quiet else contextlib.nullcontext():
+            while self.target.is_running():
+                self.target.step()
+                if pc is not None and any(core.control_unit.get_pc() == pc for core in self.cores
+                                          if not core.halted):
+                    return "pc"
+                if cycle is not None and self.get_cycles() >= cycle:
+                    return "cycle"
+                if instructions is not None and self.get_instructions() >= instructions:
+                    return "instructions"
+        return "halted"
+
+    # Runs to the end
+    def run(self) -> SimulationResults:
+        self.run_until()
+        return self.get_results()
+
+    # what it's done so far, or in all once it's halted
+    def get_results(self) -> SimulationResults:
+        return SimulationResults(self.target, self.machine)
+
+    def get_symbol(self, name: str) -> int:
+        if not isinstance(self.program, objectfile.ObjectFile) or name not in self.program.get_symbols():
+            raise Exception(f"The program has no label {name}.")
+        return self.program.get_symbols()[name]
+
+    def get_pc(self, core: int = 0) -> int:
+        return self.cores[core].control_unit.get_pc()
+
+    # An architectural register (given by name, e.g. "R3" or "V0", or as a registers.ArchRegisters), through the
+    # register alias table. While instructions are in flight, this is the value of the latest renamed copy once it's
+    # been written back.
+    def get_register(self, register: str | registers.ArchRegisters, core: int = 0) -> int | List[int]:
+        if isinstance(register, str):
+            if register.upper() not in registers.ArchRegisters.__members__:
+                raise Exception(f"Unknown register {register}.")
+            register = registers.ArchRegisters[register.upper()]
+        register_file = self.cores[core].register_file
+        return register_file.get_register_value(register_file.get_rat()[register])
+
+    def get_registers(self, core: int = 0) -> Dict[str, int | List[int]]:
+        return {register.name: self.get_register(register, core) for register in registers.ArchRegisters}
+
+    # what the pipeline of a core looks like now: its latches, pending write-backs and counters
+    def get_snapshot(self, core: int = 0) -> dashboard.Snapshot:
+        return dashboard.Snapshot(self.cores[core])
+
+    # the cores of a multicore system share their memory
+    def read_memory(self, address: int, length: int = 1) -> List[int]:
+        return list(self.target.dump_data(address, length))
+
+    def write_memory(self, address: int, words: Sequence[int]):
+        self.cores[0].storage.load_words(address, words)
+
+
+# Runs a program to the end without printing anything, e.g. on a machine with one feature turned off to compare
+# against, and returns the statistics its run() would have.
+def run_quietly(program: objectfile.ObjectFile, machine_config: machine.MachineConfig, memory_size: int = 1 << 24,
+                word_bits: int = 64, load_data: List[str] = (), cores: int | None = None, entry_points: List[int] = (),
+                trace: tracefile.TraceReader | None = None) -> processor.RunStatistics | multicore.MultiCoreStatistics:
+    sim = Simulation(program, machine_config, memory_size, word_bits, cores, entry_points, load_data, trace)
+    sim.run_until()
+    return sim.target.get_statistics()
@@ -0,0 +1,163 @@
+from typing import Any, Dict, List
+
+import base_instruction
+import machine
+
+"""
+Speculative execution past conditional branches. The fetch stage asks the branch predictor where each BRAT/BRATI goes
+and carries on fetching from there. Rather than holding the instructions after it back until the branch resolves, the
+branch is dispatched to the control unit, where it waits for its condition, and the instructions after it are
+dispatched behind it. Up to `depth` branches (see the [speculation] section of the machine description) can be waiting
+at once, and they resolve in order, oldest first. Any other control instruction waits until they all have.
+
+When a branch is dispatched, the register alias table and the hardware loops are checkpointed, and it's given a tag.
+Every instruction dispatched after it, up to the next branch, is tagged with it, as is everything it produces (memory
+actions, results waiting to be written back and results on the bypass network). Speculative stores wait in the memory
+unit until they aren't speculative any more. If a branch goes the way it was predicted, its tag simply stops being
+speculative. If it doesn't, everything tagged with it or a younger branch's tag is thrown away wherever it is in the
+pipeline, and its checkpoint is restored, so the instructions renamed past the branch never happened. Then fetching
+starts again down the right path.
+"""
+
+
+# Predicts whether a conditional branch is taken, and where to, when the fetch stage finds it:
+#     not-taken   it never is
+#     BTFN        backward branches (which is how loops go round again) are taken, and forward ones aren't. Only a
+#                 BRATI's target is known when it's fetched, so a BRAT is predicted not taken.
+#     BTB         a branch target buffer of `btb_entries` branches, by address, each with where it last went and a
+#                 2-bit counter of whether it's been taken lately. A branch that isn't in it is predicted as BTFN does.
+class BranchPredictor:
+    def __init__(self, machine_config: machine.MachineConfig):
+        self.kind = machine_config.speculation["predictor"]
+        self.__entries = machine_config.speculation["btb_entries"]
+        # index -> [address of the branch, where it last went (None if it hasn't been taken), counter]
+        self.__btb: Dict[int, List[Any]] = {}
+
+        # branches resolved, and how many went the way they were predicted
+        self.predictions = 0
+        self.correct = 0
+
+    # Where the branch at `address` is predicted to go, or None if it's predicted not taken. `target` is where it goes
+    # if it's taken, if that's known from the instruction itself.
+    def predict(self, address: int, target: int | None) -> int | None:
+        if self.kind == "BTB":
+            entry = self.__btb.get(address % self.__entries)
+            if entry is not None and entry[0] == address:
+                return entry[1] if entry[2] >= 2 else None
+        if self.kind != "not-taken" and target is not None and target <= address:
+            return target
+        return None
+
+    # the branch at `address` went to `target` (None if it wasn't taken)
+    def update(self, address: int, target: int | None, correct: bool):
+        self.predictions += 1
+        self.correct += 1 if correct else 0
+        if self.kind != "BTB":
+            return
+        index = address % self.__entries
+        entry = self.__btb.get(index)
+        if entry is None or entry[0] != address:
+            # a new branch starts off only just going the way it went
+            self.__btb[index] = [address, target, 2 if target is not None else 1]
+        elif target is not None:
+            entry[1] = target
+            entry[2] = min(entry[2] + 1, 3)
+        else:
+            entry[2] = max(entry[2] - 1, 0)
+
+
+# A conditional branch that's been dispatched, and is waiting in the control unit to resolve
+class UnresolvedBranch:
+    def __init__(self, tag: int, instruction: base_instruction.BaseInstruction, address: int, predicted: int | None,
+                 checkpoint: Any):
+        self.tag = tag
+        self.instruction = instruction
+        self.address = address
+        # where the fetch stage went after it, or None if it went on to the next instruction
+        self.predicted = predicted
+        # whatever's needed to undo the instructions after it
+        self.checkpoint = checkpoint
+        # instructions tagged with it, and when the first of them was dispatched
+        self.dispatched = 0
+        self.first_dispatch: int | None = None
+
+
+class Speculation:
+    def __init__(self, machine_config: machine.MachineConfig | None = None):
+        self.predictor = BranchPredictor(machine_config if machine_config is not None else machine.MachineConfig())
+        # the branches being speculated past, oldest first
+        self.unresolved: List[UnresolvedBranch] = []
+        self.__next_tag = 0
+
+        # branches speculated past, how many of them went the other way, and the most waiting at once
+        self.branches = 0
+        self.mispredicts = 0
+        self.deepest = 0
+        # instructions dispatched past a branch, and how many of them were thrown away
+        self.dispatched = 0
+        self.squashed = 0
+        # cycles between the first instruction being dispatched down the wrong path and the branch resolving
+        self.wasted_cycles = 0
+        # thrown away instructions that had already finished executing, which mustn't be counted as executed
+        self.__uncounted = 0
+
+    def is_active(self) -> bool:
+        return len(self.unresolved) > 0
+
+    # is something with this tag on the speculative path?
+    def is_speculative(self, tag: int | None) -> bool:
+        return tag is not None and any(branch.tag == tag for branch in self.unresolved)
+
+    def get_oldest(self) -> UnresolvedBranch:
+        return self.unresolved[0]
+
+    # a conditional branch has been dispatched
+    def start(self, instruction: base_instruction.BaseInstruction, address: int, predicted: int | None,
+              checkpoint: Any):
+        self.unresolved.append(UnresolvedBranch(self.__next_tag, instruction, address, predicted, checkpoint))
+        self.__next_tag += 1
+        self.branches += 1
+        self.deepest = max(self.deepest, len(self.unresolved))
+
+    # an instruction dispatched past the youngest branch
+    def tag(self, instruction: base_instruction.BaseInstruction, now: int):
+        youngest = self.unresolved[-1]
+        instruction.speculation_tag = youngest.tag
+        self.dispatched += 1
+        youngest.dispatched += 1
+        if youngest.first_dispatch is None:
+            youngest.first_dispatch = now
+
+    # the oldest branch went the way it was predicted
+    def commit(self):
+        self.unresolved.pop(0)
+
+    # The oldest branch went the other way, so it and every younger branch are done with. `unfinished` of the
+    # instructions dispatched past it were still executing. Returns the branch, to restore its checkpoint.
+    def squash(self, now: int, unfinished: int) -> UnresolvedBranch:
+        oldest = self.unresolved[0]
+        past_branch = sum(branch.dispatched for branch in self.unresolved)
+        self.mispredicts += 1
+        self.squashed += past_branch
+        self.__uncounted += past_branch - unfinished
+        if oldest.first_dispatch is not None:
+            self.wasted_cycles += now - oldest.first_dispatch
+        self.unresolved = []
+        return oldest
+
+    # thrown away instructions that were counted as executed since this was last called
+    def take_uncounted(self) -> int:
+        uncounted = self.__uncounted
+        self.__uncounted = 0
+        return uncounted
+
+    def print_statistics(self):
+        if self.branches == 0:
+            return
+        predictor = self.predictor
+        print(f"Speculation: {self.dispatched} instructions dispatched past {self.branches} branches (up to "
+              f"{self.deepest} unresolved at once), {self.squashed} squashed ({self.mispredicts} branches "
+              f"mispredicted), {self.wasted_cycles} cycles wasted on the wrong path")
+        if predictor.predictions != 0:
+            print(f"\t {predictor.kind} predictor: {predictor.correct}/{predictor.predictions} branches predicted "
+                  f"right ({100 * predictor.correct / predictor.predictions:.1f}%)")
@@ -0,0 +1,123 @@
+from array import array
+from typing import Dict, List, Sequence
+
+import base_instruction
+
+
+# Word-addressed backing store for the simulated memory.
+# Data words live in fixed-size pages of signed 64-bit integers, which are only allocated when they're first written
+# to, so a large address space only costs memory for the pages that are used. Decoded instructions are kept in their
+# own region, so they don't need to be re-decoded every time they're fetched.
+class Storage:
+    def __init__(self, size: int = 1 << 24, page_bits: int = 12, word_bits: int = 64):
+        if not 0 < word_bits <= 64:
+            raise ValueError(f"Word width must be between 1 and 64 bits, not {word_bits}.")
+
+        self.__size = size
+        self.__page_bits = page_bits
+        self.__page_size = 1 << page_bits
+        self.__offset_mask = self.__page_size - 1
+
+        # values are wrapped to the word width and stored as two's complement
+        self.__word_bits = word_bits
+        self.__word_mask = (1 << word_bits) - 1
+        self.__sign_bit = 1 << (word_bits - 1)
+
+        self.__pages: List[array | None] = [None] * ((size + self.__page_size - 1) >> page_bits)
+        self.__instructions: Dict[int, base_instruction.BaseInstruction] = {}
+
+    def get_size(self) -> int:
+        return self.__size
+
+    def get_word_bits(self) -> int:
+        return self.__word_bits
+
+    def get_allocated_pages(self) -> int:
+        return sum(page is not None for page in self.__pages)
+
+    def __check_address(self, address: int):
+        if not 0 <= address < self.__size:
+            raise Exception(f"Memory address {address} is out of range (memory size is {self.__size} words).")
+
+    def __get_page(self, page_num: int) -> array:
+        page = self.__pages[page_num]
+        if page is None:
+            page = array("q", bytes(8 * self.__page_size))
+            self.__pages[page_num] = page
+        return page
+
+    def wrap(self, value: int) -> int:
+        value &= self.__word_mask
+        return value - (self.__sign_bit << 1) if value & self.__sign_bit else value
+
+    # returns the instruction at this address, or the data word if there isn't one
+    def get(self, address: int) -> base_instruction.BaseInstruction | int:
+        instruction = self.__instructions.get(address)
+        if instruction is not None:
+            return instruction
+        return self.get_word(address)
+
+    def get_word(self, address: int) -> int:
+        self.__check_address(address)
+        page = self.__pages[address >> self.__page_bits]
+        return 0 if page is None else page[address & self.__offset_mask]
+
+    def set(self, address: int, val: base_instruction.BaseInstruction | int):
+        self.__check_address(address)
+        if isinstance(val, base_instruction.BaseInstruction):
+            self.__instructions[address] = val
+            return
+
+        # data overwrites whatever instruction was there
+        self.__instructions.pop(address, None)
+        self.__get_page(address >> self.__page_bits)[address & self.__offset_mask] = self.wrap(val)
+
+    def is_instruction(self, address: int) -> bool:
+        return address in self.__instructions
+
+    # Copies a block of words into memory, one slice assignment per page.
+    # With 64-bit words, an array of 'q' (or a memoryview of one) is copied without touching each word.
+    def load_words(self, address: int, words: Sequence[int]):
+        if len(words) == 0:
+            return
+        self.__check_address(address)
+        self.__check_address(address + len(words) - 1)
+
+        if self.__word_bits != 64:
+            words = array("q", [self.wrap(word) for word in words])
+        elif isinstance(words, memoryview):
+            words = array("q", words.tobytes())
+        elif not isinstance(words, array) or words.typecode != "q":
+            words = array("q", words)
+
+        idx = 0
+        while idx < len(words):
+            current = address + idx
+            offset = current & self.__offset_mask
+            count = min(self.__page_size - offset, len(words) - idx)
+
+            self.__get_page(current >> self.__page_bits)[offset:offset + count] = words[idx:idx + count]
+            idx += count
+
+        if self.__instructions:
+            for instruction_address in range(address, address + len(words)):
+                self.__instructions.pop(instruction_address, None)
+
+    # reads a block of data words. Unallocated pages read as zeroes.
+    def read_words(self, address: int, length: int) -> array:
+        if length == 0:
+            return array("q")
+        self.__check_address(address)
+        self.__check_address(address + length - 1)
+
+        words = array("q")
+        idx = 0
+        while idx < length:
+            current = address + idx
+            offset = current & self.__offset_mask
+            count = min(self.__page_size - offset, length - idx)
+
+            page = self.__pages[current >> self.__page_bits]
+            words.extend(page[offset:offset + count] if page is not None else array("q", bytes(8 * count)))
+            idx += count
+        return words
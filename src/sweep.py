@@ -0,0 +1,184 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+import machine
+import results
+import simulation
+from assembler import ObjectCache, load_program
+
+"""
+Runs a program on a set of design points and ranks them by speed or efficiency. Design points are every machine
+description given (or the default machine) with every combination of the --set values on top, e.g.
+
+    python sweep.py ../examples/matmul.s --set memory_latency=50,100,200 --set vector.lanes=2,4 --rank edp
+
+runs 6 machines and lists them from the lowest energy-delay product to the highest.
+
+Results are kept in a ResultCache (see results.py), so running it again with another value added to one of the --set
+lists only simulates the new design points.
+"""
+
+RANKINGS = {
+    "cycles": lambda result: result.cycles,
+    "energy": lambda result: result.energy.energy,
+    "edp": lambda result: result.energy.get_edp(),
+}
+
+
+# one machine and how the program did on it
+class DesignPoint:
+    def __init__(self, name: str, description: Dict[str, Any]):
+        self.name = name
+        self.description = description
+        self.cycles = 0
+        self.instructions = 0
+        self.energy = None
+
+    def get_cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions != 0 else 0
+
+    def to_row(self) -> Dict[str, Any]:
+        return {"design": self.name, "cycles": self.cycles, "instructions": self.instructions, "cpi": self.get_cpi(),
+                **self.energy.get_statistics()}
+
+
+# "section.setting=a,b,c" (or "setting=a,b,c" at the top level) -> (path, values). Values are JSON where they can be,
+# and strings otherwise.
+def parse_setting(spec: str) -> Tuple[List[str], List[Any]]:
+    (path, sep, values) = spec.partition("=")
+    if sep == "" or path == "" or values == "":
+        raise Exception(f"Expected SETTING=VALUE[,VALUE...], not {spec}.")
+    parsed = []
+    for value in values.split(","):
+        try:
+            parsed.append(json.loads(value))
+        except json.JSONDecodeError:
+            parsed.append(value)
+    return path.split("."), parsed
+
+
+def apply_setting(description: Dict[str, Any], path: List[str], value: Any):
+    for key in path[:-1]:
+        description = description.setdefault(key, {})
+    description[path[-1]] = value
+
+
+def get_design_points(machine_files: List[str], settings: List[str]) -> List[DesignPoint]:
+    bases = [(os.path.basename(path), machine.MachineConfig.load(path).to_dict()) for path in machine_files] or \
+            [("default", machine.MachineConfig().to_dict())]
+    axes = [parse_setting(spec) for spec in settings]
+
+    points = []
+    for (base_name, base) in bases:
+        for values in itertools.product(*(values for (_, values) in axes)):
+            description = json.loads(json.dumps(base))
+            changes = []
+            for ((path, _), value) in zip(axes, values):
+                apply_setting(description, path, value)
+                changes.append(f"{'.'.join(path)}={value}")
+            points.append(DesignPoint(" ".join([base_name] + changes), description))
+    return points
+
+
+# Simulates the design point, unless its result is in the cache. Returns whether it was simulated.
+def run_point(point: DesignPoint, program, memory_size: int, word_bits: int, load_data: List[str],
+              cores: int | None, cache: results.ResultCache | None = None, rerun: bool = False) -> bool:
+    config = machine.MachineConfig.from_dict(point.description)
+    key = None
+    if cache is not None:
+        # the whole description, so that leaving a setting at its default and giving it explicitly are the same point
+        key = cache.get_key(program, config.to_dict(), memory_size, word_bits, load_data, cores)
+        result = cache.get(key) if not rerun else None
+        if result is not None:
+            point.cycles = result.cycles
+            point.instructions = result.instructions
+            point.energy = result.energy
+            return False
+
+    # only the statistics are wanted
+    stats = simulation.run_quietly(program, config, memory_size, word_bits, load_data, cores)
+    point.cycles = stats.cycles
+    point.instructions = stats.instructions
+    point.energy = stats.energy
+    if cache is not None:
+        cache.put(key, program, results.CachedResult(stats.cycles, stats.instructions, stats.energy))
+    return True
+
+
+def print_ranking(points: List[DesignPoint], rank: str):
+    width = max(len(point.name) for point in points)
+    print(f"{'#':>3}  {'design':<{width}}  {'cycles':>9}  {'CPI':>7}  {'energy (nJ)':>11}  {'pJ/inst':>8}  "
+          f"{'power (mW)':>10}  {'EDP (Js)':>10}")
+    for (idx, point) in enumerate(points):
+        report = point.energy
+        print(f"{idx + 1:>3}  {point.name:<{width}}  {point.cycles:>9}  {point.get_cpi():>7.3f}  "
+              f"{report.energy / 1000:>11.1f}  {report.get_energy_per_instruction():>8.1f}  "
+              f"{1000 * report.get_power():>10.2f}  {report.get_edp():>10.3e}")
+    print(f"Ranked by {rank}")
+
+
+def main(input_file: str, machine_files: List[str] = (), settings: List[str] = (), rank: str = "cycles",
+         csv_file: str | None = None, use_cache: bool = True, memory_size: int = 1 << 24, word_bits: int = 64,
+         load_data: List[str] = (), cores: int | None = None, use_result_cache: bool = True,
+         result_cache_dir: str | None = None, rerun: bool = False, invalidate: bool = False) -> List[DesignPoint]:
+    program = load_program(input_file, ObjectCache() if use_cache else None)
+    cache = results.ResultCache(result_cache_dir) if use_result_cache else None
+    if cache is not None and invalidate:
+        cache.invalidate(program)
+
+    points = get_design_points(machine_files, settings)
+    for (idx, point) in enumerate(points):
+        simulated = run_point(point, program, memory_size, word_bits, load_data, cores, cache, rerun)
+        print(f"[{idx + 1}/{len(points)}] {point.name}" + ("" if simulated else " (cached)"))
+
+    points.sort(key=RANKINGS[rank])
+    print_ranking(points, rank)
+    if cache is not None:
+        cache.print_statistics()
+
+    if csv_file is not None:
+        with open(csv_file, "w", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(points[0].to_row()))
+            writer.writeheader()
+            for point in points:
+                writer.writerow(point.to_row())
+    return points
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Run a program on several machines and rank them")
+    arg_parser.add_argument("input_file", type=str, help="The assembly or object file to run")
+    arg_parser.add_argument("--machine", action="append", default=[], metavar="FILE",
+                            help="A machine description to start from (repeatable). Default: the default machine")
+    arg_parser.add_argument("--set", action="append", default=[], metavar="SETTING=VALUE[,VALUE...]",
+                            help="Values to try for a machine description setting, e.g. memory_latency=50,100 or "
+                                 "energy.leakage=2.5,5. Every combination of the values given is run.")
+    arg_parser.add_argument("--rank", choices=list(RANKINGS), default="cycles",
+                            help="What to rank the designs by, lowest first: cycles, total energy or energy-delay "
+                                 "product. Default: cycles")
+    arg_parser.add_argument("--csv", type=str, default=None, metavar="FILE",
+                            help="Also write the results to a CSV file")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Always re-assemble the program")
+    arg_parser.add_argument("--no-result-cache", action="store_true",
+                            help="Simulate every design point, and don't save the results")
+    arg_parser.add_argument("--result-cache-dir", type=str, default=None,
+                            help="Where results are cached. Default: $XDG_CACHE_HOME/coms30046-sim/results")
+    arg_parser.add_argument("--rerun", action="store_true",
+                            help="Simulate every design point again, replacing any cached results")
+    arg_parser.add_argument("--invalidate", action="store_true",
+                            help="Throw away every cached result for this program before running")
+    arg_parser.add_argument("--memory-size", type=int, default=1 << 24, help="Words of memory. Default: 2^24")
+    arg_parser.add_argument("--word-bits", type=int, default=64, help="Bits per word of memory. Default: 64")
+    arg_parser.add_argument("--load-data", action="append", default=[], metavar="FILE@ADDRESS",
+                            help="Copy the words in FILE into memory at ADDRESS before each run")
+    arg_parser.add_argument("--cores", type=int, default=None, help="Run on a multicore system with this many cores")
+
+    args = arg_parser.parse_args()
+    main(args.input_file, machine_files=args.machine, settings=args.set, rank=args.rank, csv_file=args.csv,
+         use_cache=not args.no_cache, memory_size=args.memory_size, word_bits=args.word_bits,
+         load_data=args.load_data, cores=args.cores, use_result_cache=not args.no_result_cache,
+         result_cache_dir=args.result_cache_dir, rerun=args.rerun, invalidate=args.invalidate)
@@ -0,0 +1,182 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Tuple
+
+import base_instruction
+import objectfile
+
+"""
+Dynamic instruction traces, recorded by the functional simulator and replayed by the pipeline (see Replay), so that
+the timing of a run can be looked at again without working out any values. The replayed instructions still go through
+the whole pipeline, so it takes about as long as running the program.
+
+Trace file layout (little-endian):
+    header      magic (8 bytes), format version (u16), reserved (u16), object file size (u32), record count (u64)
+    program     the object file that was run, so that the pipeline can fetch (and mispredict) exactly as it did
+    records     zlib-compressed, one per executed instruction: PC (u32), flags (u8), then an i64 for each of
+                ADDRESS, COUNT, STRIDE and TARGET that's set in the flags, in that order
+
+The instruction at each PC (its opcode and registers) comes from the program. A record holds what the instruction
+did that can't be known without its values:
+    memory instructions         the address, and for vector accesses the number of words and the stride
+    vector instructions         the vector length (COUNT)
+    hardware loops              the number of iterations (COUNT)
+    jumps and taken branches    where they went (TARGET)
+    HALT                        the HALT flag
+"""
+
+MAGIC = b"SIMTRC\x00\x01"
+FORMAT_VERSION = 1
+
+ADDRESS = 1
+COUNT = 2
+STRIDE = 4
+TARGET = 8
+HALT = 16
+# the flags that have a value after the PC, in the order they're written
+VALUE_FLAGS = (ADDRESS, COUNT, STRIDE, TARGET)
+
+_header = struct.Struct("<8sHHIQ")
+_record = struct.Struct("<IB")
+_value = struct.Struct("<q")
+
+# records are compressed this many bytes at a time
+CHUNK_SIZE = 1 << 16
+
+
+class TraceRecord:
+    def __init__(self, pc: int, address: int | None = None, count: int | None = None, stride: int | None = None,
+                 target: int | None = None, halt: bool = False):
+        self.pc = pc
+        self.address = address
+        self.count = count
+        self.stride = stride
+        self.target = target
+        self.halt = halt
+
+    def get_flags(self) -> int:
+        values = (self.address, self.count, self.stride, self.target)
+        return sum(flag for (flag, value) in zip(VALUE_FLAGS, values) if value is not None) + (HALT if self.halt else 0)
+
+    def to_bytes(self) -> bytes:
+        values = [value for value in (self.address, self.count, self.stride, self.target) if value is not None]
+        return _record.pack(self.pc, self.get_flags()) + b"".join(_value.pack(value) for value in values)
+
+
+class TraceWriter:
+    def __init__(self, path: str | Path, program: objectfile.ObjectFile):
+        self.__path = Path(path)
+        self.__fh: BinaryIO = open(self.__path, "wb")
+        self.__compressor = zlib.compressobj()
+        self.__pending: List[bytes] = []
+        self.__pending_size = 0
+        self.records = 0
+
+        program_bytes = program.to_bytes()
+        self.__program_size = len(program_bytes)
+        # the record count is filled in when the trace is closed
+        self.__fh.write(_header.pack(MAGIC, FORMAT_VERSION, 0, self.__program_size, 0))
+        self.__fh.write(program_bytes)
+
+    def write(self, record: TraceRecord):
+        encoded = record.to_bytes()
+        self.__pending.append(encoded)
+        self.__pending_size += len(encoded)
+        self.records += 1
+        if self.__pending_size >= CHUNK_SIZE:
+            self.__flush()
+
+    def __flush(self):
+        self.__fh.write(self.__compressor.compress(b"".join(self.__pending)))
+        self.__pending = []
+        self.__pending_size = 0
+
+    def close(self):
+        self.__flush()
+        self.__fh.write(self.__compressor.flush())
+        self.__fh.seek(0)
+        self.__fh.write(_header.pack(MAGIC, FORMAT_VERSION, 0, self.__program_size, self.records))
+        self.__fh.close()
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TraceReader:
+    def __init__(self, path: str | Path):
+        self.__path = Path(path)
+        with open(self.__path, "rb") as fh:
+            (magic, version, _, program_size, self.records) = _header.unpack(fh.read(_header.size))
+            if magic != MAGIC:
+                raise Exception(f"{path} is not a trace file.")
+            if version != FORMAT_VERSION:
+                raise Exception(f"{path} has trace format version {version}, expected {FORMAT_VERSION}.")
+            self.program = objectfile.ObjectFile.from_buffer(fh.read(program_size), str(path))
+        self.__records_offset = _header.size + program_size
+
+    @staticmethod
+    def is_trace_file(path: str | Path) -> bool:
+        with open(path, "rb") as fh:
+            return fh.read(len(MAGIC)) == MAGIC
+
+    # decompresses the records a chunk at a time, so the trace never has to be held in memory
+    def get_records(self) -> Iterator[TraceRecord]:
+        decompressor = zlib.decompressobj()
+        buffer = b""
+        with open(self.__path, "rb") as fh:
+            fh.seek(self.__records_offset)
+            while True:
+                chunk = fh.read(CHUNK_SIZE)
+                buffer += decompressor.decompress(chunk) if chunk else decompressor.flush()
+                (records, used) = self.__parse_records(buffer, not chunk)
+                buffer = buffer[used:]
+                yield from records
+                if not chunk:
+                    break
+
+    # parses as many whole records as there are in the buffer. Returns them, and how many bytes they took up.
+    @staticmethod
+    def __parse_records(buffer: bytes, is_last: bool) -> Tuple[List[TraceRecord], int]:
+        records = []
+        offset = 0
+        while offset + _record.size <= len(buffer):
+            (pc, flags) = _record.unpack_from(buffer, offset)
+            num_values = sum(1 for flag in VALUE_FLAGS if flags & flag)
+            end = offset + _record.size + num_values * _value.size
+            if end > len(buffer):
+                break
+
+            values = iter(struct.unpack_from(f"<{num_values}q", buffer, offset + _record.size))
+            (address, count, stride, target) = [next(values) if flags & flag else None for flag in VALUE_FLAGS]
+            records.append(TraceRecord(pc, address, count, stride, target, bool(flags & HALT)))
+            offset = end
+
+        if is_last and offset != len(buffer):
+            raise Exception("Trace ends part-way through a record.")
+        return records, offset
+
+
+# Feeds a trace to the pipeline. Control gives each instruction that's about to be decoded the record of what it did,
+# as long as it's at the PC of the next instruction in the trace: otherwise it was fetched after a branch that will be
+# taken, and will be thrown away. The functional units then use the record instead of working anything out.
+class Replay:
+    def __init__(self, reader: TraceReader):
+        self.__records = reader.get_records()
+        self.__next: TraceRecord | None = next(self.__records, None)
+        self.replayed = 0
+
+    def get_record(self, pc: int) -> TraceRecord | None:
+        if self.__next is not None and self.__next.pc == pc:
+            return self.__next
+        return None
+
+    # called when an instruction is dispatched, which has to be the next one in the trace
+    def dispatch(self, instruction: base_instruction.BaseInstruction):
+        if instruction.trace_record is None or instruction.trace_record is not self.__next:
+            raise Exception(f"Replay: dispatching {instruction}, which isn't the next instruction in the trace.")
+        self.__next = next(self.__records, None)
+        self.replayed += 1
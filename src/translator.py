@@ -0,0 +1,226 @@
+from math import floor
+from typing import Callable, Dict, List, Set, Tuple
+
+import control
+import instructions
+import objectfile
+import storage
+
+"""
+Basic-block translation for the functional simulator. A block starts at the PC it's first entered at (the start of the
+program, a branch target or the instruction after one) and runs up to and including the first branch, jump, call or
+return. It's compiled into a Python function with the registers and memory accesses written out, e.g. for
+
+    ADDI R0 R0 1
+    LT R5 R0 R2
+    BRATI R5 loop
+
+    def block_4(R, S, W, X):
+        R[0] = R[0] + 1
+        R[5] = R[0] < R[2]
+        if R[5]: return 4, 3
+        return None, 3
+
+which returns where to go next (None to fall through) and how many instructions it executed. R is the register list,
+S the storage, W the addresses holding translated code and X the function that invalidates them.
+
+Blocks also end before any instruction that doesn't have a template (vector instructions, hardware loop set-up and
+HALT), which the simulator interprets, and at the end of every hardware loop's body, so the simulator can decide whether
+to go round again. A store to an address holding translated code, whether it's in a block or interpreted, invalidates
+every block containing it, and a store in a block leaves it straight away, as the rest of the block may have been
+overwritten. A cached block is also checked against the code in memory before it's used again.
+"""
+
+# Instruction -> line of Python, given its operands (registers as indices into R, immediates as they are).
+# Results are exactly what the instructions' own execute methods give.
+TEMPLATES: Dict[instructions.Instructions, str] = {
+    instructions.Instructions.BitWiseAnd: "R[{0}] = R[{1}] & R[{2}]",
+    instructions.Instructions.BitWiseOr: "R[{0}] = R[{1}] | R[{2}]",
+    instructions.Instructions.BitWiseXOr: "R[{0}] = R[{1}] ^ R[{2}]",
+    instructions.Instructions.BitWiseNot: "R[{0}] = ~R[{1}]",
+    instructions.Instructions.LogicalNot: "R[{0}] = not R[{1}]",
+    instructions.Instructions.ADDITION: "R[{0}] = R[{1}] + R[{2}]",
+    instructions.Instructions.ADDITION_IMMEDIATE: "R[{0}] = R[{1}] + {2}",
+    instructions.Instructions.SUBTRACT: "R[{0}] = R[{1}] - R[{2}]",
+    instructions.Instructions.SUBTRACT_IMMEDIATE: "R[{0}] = R[{1}] - {2}",
+    instructions.Instructions.LESSER_THAN: "R[{0}] = R[{1}] < R[{2}]",
+    instructions.Instructions.GREATER_THAN: "R[{0}] = R[{1}] > R[{2}]",
+    instructions.Instructions.EQUAL_TO: "R[{0}] = R[{1}] == R[{2}]",
+    instructions.Instructions.MULTIPLY: "R[{0}] = R[{1}] * R[{2}]",
+    instructions.Instructions.MULTIPLY_IMMEDIATE: "R[{0}] = R[{1}] * {2}",
+    instructions.Instructions.DIVISION: "R[{0}] = floor(R[{1}] / R[{2}])",
+    instructions.Instructions.LEFT_SHIFT: "R[{0}] = R[{1}] << R[{2}]",
+    instructions.Instructions.LEFT_SHIFT_IMMEDIATE: "R[{0}] = R[{1}] << {2}",
+    instructions.Instructions.RIGHT_SHIFT: "R[{0}] = R[{1}] >> R[{2}]",
+    instructions.Instructions.RIGHT_SHIFT_IMMEDIATE: "R[{0}] = R[{1}] >> {2}",
+    instructions.Instructions.LOAD_WORD: "R[{0}] = S.get(R[{1}] + R[{2}])",
+    instructions.Instructions.LOAD_WORD_IMMEDIATE: "R[{0}] = S.get(R[{1}] + {2})",
+    instructions.Instructions.LOAD_WORD_CONSTANT: "R[{0}] = S.get(R[{1}])",
+    instructions.Instructions.LOAD_WORD_CONSTANT_IMMEDIATE: "R[{0}] = S.get({1})",
+    instructions.Instructions.NO_OP: "pass",
+}
+
+# stores: (address, value). They're followed by a check for self-modifying code.
+STORE_TEMPLATES: Dict[instructions.Instructions, Tuple[str, str]] = {
+    instructions.Instructions.STORE_WORD: ("R[{0}]", "R[{1}]"),
+    instructions.Instructions.STORE_WORD_IMMEDIATE: ("R[{0}]", "{1}"),
+}
+
+# jumps, branches and returns, which end the block: (condition or None if always taken, target)
+BRANCH_TEMPLATES: Dict[instructions.Instructions, Tuple[str | None, str]] = {
+    instructions.Instructions.JUMP_ABSOLUTE: (None, "R[{0}]"),
+    instructions.Instructions.JUMP_ABSOLUTE_IMMEDIATE: (None, "{0}"),
+    instructions.Instructions.BRANCH_ABSOLUTE_TRUE: ("R[{0}]", "R[{1}]"),
+    instructions.Instructions.BRANCH_ABSOLUTE_TRUE_IMMEDIATE: ("R[{0}]", "{1}"),
+    instructions.Instructions.RETURN: (None, "R[{0}]"),
+}
+
+# (registers, storage, translated code addresses, invalidate) -> (next PC or None to fall through, instructions run)
+BlockFunction = Callable[[List[int], storage.Storage, Dict[int, List["Block"]], Callable[[int], None]],
+                         Tuple[int | None, int]]
+
+
+class Block:
+    def __init__(self, start: int, length: int, function: BlockFunction):
+        self.start = start
+        self.length = length
+        self.function = function
+        self.valid = True
+        # blocks this one has gone on to, by PC, so they don't need looking up again
+        self.successors: Dict[int, "Block"] = {}
+
+
+class TranslationStatistics:
+    def __init__(self):
+        self.translations = 0
+        self.lookups = 0
+        self.cache_hits = 0
+        # next blocks found through a chain, without looking them up
+        self.chained = 0
+        self.invalidations = 0
+        self.translated_instructions = 0
+        self.interpreted_instructions = 0
+
+
+class BlockTranslator:
+    def __init__(self, store: storage.Storage, program: objectfile.ObjectFile):
+        self.__storage = store
+        self.__program = program
+        # the instructions as they were loaded: translating from the encoded words is only right while they're there
+        self.__loaded: Dict[int, object] = {idx: store.get(idx) for idx in program.get_instruction_addresses()}
+
+        self.__cache: Dict[int, Block] = {}
+        # address -> blocks containing it
+        self.__code: Dict[int, List[Block]] = {}
+        # a block can't run past the end of a hardware loop's body
+        self.__loop_ends: Set[int] = {instruction.get_end() for idx in program.get_instruction_addresses()
+                                      if isinstance(instruction := program.get_instruction(idx),
+                                                    control.BaseLoopInstruction)}
+        self.statistics = TranslationStatistics()
+
+    def get_code_addresses(self) -> Dict[int, List[Block]]:
+        return self.__code
+
+    # Returns the block starting at this PC, translating it if it isn't cached, or None if the instruction there has
+    # to be interpreted. A cached block is only used while it's valid and the code it was translated from is still
+    # there, whichever way that code was overwritten.
+    def lookup(self, pc: int) -> Block | None:
+        self.statistics.lookups += 1
+        block = self.__cache.get(pc)
+        if block is not None:
+            for address in range(block.start, block.start + block.length):
+                if not self.__is_loaded(address):
+                    self.invalidate(address)
+                    break
+            if block.valid:
+                self.statistics.cache_hits += 1
+                return block
+
+        block = self.__translate(pc)
+        if block is not None:
+            self.__cache[pc] = block
+            for address in range(block.start, block.start + block.length):
+                self.__code.setdefault(address, []).append(block)
+        return block
+
+    def invalidate(self, address: int):
+        for block in self.__code.pop(address, []):
+            if not block.valid:
+                continue
+            block.valid = False
+            self.statistics.invalidations += 1
+            if self.__cache.get(block.start) is block:
+                del self.__cache[block.start]
+            for other in range(block.start, block.start + block.length):
+                if other != address and block in self.__code.get(other, []):
+                    self.__code[other].remove(block)
+
+    # whether the instruction at this PC is still the one that was loaded (a store may have replaced it)
+    def __is_loaded(self, pc: int) -> bool:
+        loaded = self.__loaded.get(pc)
+        return loaded is not None and self.__storage.get(pc) is loaded
+
+    # the encoded instruction at this PC, if it's still what was loaded
+    def __get_word(self, pc: int) -> objectfile.EncodedWord | None:
+        return self.__program.get_word(pc) if self.__is_loaded(pc) else None
+
+    def __translate(self, start: int) -> Block | None:
+        lines: List[str] = []
+        pc = start
+        while True:
+            word = self.__get_word(pc)
+            if word is None:
+                break
+            (inst, operands) = word
+            count = pc - start + 1
+
+            if inst in TEMPLATES:
+                lines.append(TEMPLATES[inst].format(*operands))
+            elif inst in STORE_TEMPLATES:
+                (address, value) = STORE_TEMPLATES[inst]
+                lines.append(f"_a = {address.format(*operands)}")
+                lines.append(f"S.set(_a, {value.format(*operands)})")
+                lines.append(f"if _a in W: X(_a); return None, {count}")
+            elif inst is instructions.Instructions.CALL:
+                # the return address is where the CALL is, which is known now
+                lines.append(f"R[{operands[0]}] = {pc + 1}")
+                lines.append(f"return {operands[1]}, {count}")
+                pc += 1
+                break
+            elif inst in BRANCH_TEMPLATES:
+                (condition, target) = BRANCH_TEMPLATES[inst]
+                if condition is None:
+                    lines.append(f"return {target.format(*operands)}, {count}")
+                else:
+                    lines.append(f"if {condition.format(*operands)}: return {target.format(*operands)}, {count}")
+                pc += 1
+                break
+            else:
+                break
+
+            pc += 1
+            if pc in self.__loop_ends:
+                break
+
+        length = pc - start
+        if length == 0:
+            return None
+        if not lines[-1].startswith("return"):
+            lines.append(f"return None, {length}")
+
+        name = f"block_{start}"
+        source = f"def {name}(R, S, W, X):\n" + "".join(f"    {line}\n" for line in lines)
+        namespace = {"floor": floor}
+        exec(compile(source, f"<translated {name}>", "exec"), namespace)
+        self.statistics.translations += 1
+        return Block(start, length, namespace[name])
+
+    def print_statistics(self):
+        stats = self.statistics
+        total = stats.translated_instructions + stats.interpreted_instructions
+        if total == 0:
+            return
+        print(f"Translation: {stats.translations} blocks translated, {stats.cache_hits}/{stats.lookups} lookups hit "
+              f"the cache, {stats.chained} blocks reached through a chain, {stats.invalidations} invalidated")
+        print(f"\t {stats.translated_instructions} instructions run translated "
+              f"({100 * stats.translated_instructions / total:.1f}%), {stats.interpreted_instructions} interpreted")
@@ -0,0 +1,319 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+import bypass
+import base_instruction
+import clock
+import log
+import machine
+import memory
+import registers
+import writeback
+
+
+# Elements of a vector register. Registers start out as 0, which for a vector register means every element is 0.
+def get_elements(value: int | List[int], length: int) -> List[int]:
+    if isinstance(value, int):
+        return [0] * length
+    return list(value[:length]) + [0] * (length - len(value))
+
+
+# Results always fill the whole register: elements past the vector length are zeroed.
+def make_vector(elements: List[int], max_length: int) -> List[int]:
+    return elements + [0] * (max_length - len(elements))
+
+
+def get_vector_length(register_file: registers.RegisterFile, vl: registers.Registers, max_length: int) -> int:
+    return max(0, min(register_file.get_register_value(vl), max_length))
+
+
+class BaseVectorInstruction(base_instruction.BaseInstruction, ABC):
+    @abstractmethod
+    def execute(self, register_file: registers.RegisterFile, max_length: int) -> writeback.WriteBackAction:
+        pass
+
+    @abstractmethod
+    def get_execution_cycles(self) -> int:
+        pass
+
+    # how many elements this will operate on, which decides how long it takes
+    @abstractmethod
+    def get_length(self, register_file: registers.RegisterFile, max_length: int) -> int:
+        pass
+
+
+# VL = min(REG[source], maximum vector length)
+class SetVectorLength(BaseVectorInstruction):
+    def __init__(self, source: registers.Registers):
+        self.__dest = registers.ArchRegisters.VL
+        self.__source = source
+
+    def execute(self, register_file: registers.RegisterFile, max_length: int):
+        return writeback.WriteBackAction(self.__dest, get_vector_length(register_file, self.__source, max_length))
+
+    def get_execution_cycles(self) -> int:
+        return 1
+
+    def get_length(self, register_file: registers.RegisterFile, max_length: int) -> int:
+        return 1
+
+    def get_dest(self) -> registers.Registers:
+        return self.__dest
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__source]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__source = registers.PhysicalRegisters(rat[self.__source])
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.__dest = new
+
+
+# Elementwise operations on the first VL elements of two vector registers
+class BaseVectorElementwise(BaseVectorInstruction, ABC):
+    def __init__(self, dest: registers.Registers, op1: registers.Registers, op2: registers.Registers):
+        self.__dest = dest
+        self.__op1 = op1
+        self.__op2 = op2
+        self.__vl = registers.ArchRegisters.VL
+
+    @abstractmethod
+    def operation(self, val1: int, val2: int) -> int:
+        pass
+
+    # the second operand is a vector, but a scalar version can broadcast it instead
+    def get_second_operand(self, register_file: registers.RegisterFile, op2: registers.Registers,
+                           length: int) -> List[int]:
+        return get_elements(register_file.get_register_value(op2), length)
+
+    def execute(self, register_file: registers.RegisterFile, max_length: int):
+        length = get_vector_length(register_file, self.__vl, max_length)
+        vals1 = get_elements(register_file.get_register_value(self.__op1), length)
+        vals2 = self.get_second_operand(register_file, self.__op2, length)
+        return writeback.WriteBackAction(
+            self.__dest,
+            make_vector([self.operation(val1, val2) for (val1, val2) in zip(vals1, vals2)], max_length)
+        )
+
+    def get_length(self, register_file: registers.RegisterFile, max_length: int) -> int:
+        return get_vector_length(register_file, self.__vl, max_length)
+
+    def get_dest(self) -> registers.Registers:
+        return self.__dest
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__op1, self.__op2, self.__vl]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__op1 = registers.PhysicalRegisters(rat[self.__op1])
+        self.__op2 = registers.PhysicalRegisters(rat[self.__op2])
+        self.__vl = registers.PhysicalRegisters(rat[self.__vl])
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.__dest = new
+
+
+# dest[i] = op1[i] + op2[i]
+class VectorAdd(BaseVectorElementwise):
+    def operation(self, val1: int, val2: int) -> int:
+        return val1 + val2
+
+    def get_execution_cycles(self) -> int:
+        return 1
+
+
+# dest[i] = op1[i] * op2[i]
+class VectorMultiply(BaseVectorElementwise):
+    def operation(self, val1: int, val2: int) -> int:
+        return val1 * val2
+
+    def get_execution_cycles(self) -> int:
+        return 10
+
+
+# dest[i] = op1[i] * REG[scalar]
+class VectorMultiplyScalar(BaseVectorElementwise):
+    def operation(self, val1: int, val2: int) -> int:
+        return val1 * val2
+
+    def get_second_operand(self, register_file: registers.RegisterFile, op2: registers.Registers,
+                           length: int) -> List[int]:
+        return [register_file.get_register_value(op2)] * length
+
+    def get_execution_cycles(self) -> int:
+        return 10
+
+
+# REG[dest] = op[0] + op[1] + ... + op[VL - 1]
+class VectorReduceSum(BaseVectorInstruction):
+    def __init__(self, dest: registers.Registers, op: registers.Registers):
+        self.__dest = dest
+        self.__op = op
+        self.__vl = registers.ArchRegisters.VL
+
+    def execute(self, register_file: registers.RegisterFile, max_length: int):
+        length = get_vector_length(register_file, self.__vl, max_length)
+        return writeback.WriteBackAction(self.__dest, sum(get_elements(register_file.get_register_value(self.__op),
+                                                                       length)))
+
+    def get_execution_cycles(self) -> int:
+        return 1
+
+    def get_length(self, register_file: registers.RegisterFile, max_length: int) -> int:
+        return get_vector_length(register_file, self.__vl, max_length)
+
+    def get_dest(self) -> registers.Registers:
+        return self.__dest
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__op, self.__vl]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__op = registers.PhysicalRegisters(rat[self.__op])
+        self.__vl = registers.PhysicalRegisters(rat[self.__vl])
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.__dest = new
+
+
+# dest[i] = MEM[REG[base] + i * REG[stride]]
+class VectorLoad(memory.BaseMemoryInstruction):
+    def __init__(self, dest: registers.Registers, base: registers.Registers, stride: registers.Registers):
+        self.__dest = dest
+        self.__base = base
+        self.__stride = stride
+        self.__vl = registers.ArchRegisters.VL
+
+    def execute(self, register_file: registers.RegisterFile, memory_unit: memory.Memory):
+        return memory.MemoryAction(address=register_file.get_register_value(self.__base), register=self.__dest,
+                                   count=register_file.get_register_value(self.__vl),
+                                   stride=register_file.get_register_value(self.__stride))
+
+    def get_execution_cycles(self) -> int:
+        return 100
+
+    def get_dest(self) -> registers.Registers | None:
+        return self.__dest
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        self.__dest = registers.PhysicalRegisters(new)
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__base, self.__stride, self.__vl]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__base = registers.PhysicalRegisters(rat[self.__base])
+        self.__stride = registers.PhysicalRegisters(rat[self.__stride])
+        self.__vl = registers.PhysicalRegisters(rat[self.__vl])
+
+
+# MEM[REG[base] + i * REG[stride]] = source[i]
+class VectorStore(memory.BaseMemoryInstruction):
+    def __init__(self, source: registers.Registers, base: registers.Registers, stride: registers.Registers):
+        self.__source = source
+        self.__base = base
+        self.__stride = stride
+        self.__vl = registers.ArchRegisters.VL
+
+    def execute(self, register_file: registers.RegisterFile, memory_unit: memory.Memory):
+        count = max(0, register_file.get_register_value(self.__vl))
+        return memory.MemoryAction(address=register_file.get_register_value(self.__base),
+                                   data=get_elements(register_file.get_register_value(self.__source), count),
+                                   count=count, stride=register_file.get_register_value(self.__stride))
+
+    def get_execution_cycles(self) -> int:
+        return 100
+
+    def get_dest(self) -> registers.Registers | None:
+        return None
+
+    def update_dest(self, new: registers.PhysicalRegisters):
+        pass
+
+    def get_sources(self) -> List[registers.Registers]:
+        return [self.__source, self.__base, self.__stride, self.__vl]
+
+    def update_source_registers(self, rat: List[int]):
+        self.__source = registers.PhysicalRegisters(rat[self.__source])
+        self.__base = registers.PhysicalRegisters(rat[self.__base])
+        self.__stride = registers.PhysicalRegisters(rat[self.__stride])
+        self.__vl = registers.PhysicalRegisters(rat[self.__vl])
+
+
+class VectorUnit:
+    def __init__(self, register_file: registers.RegisterFile, clock: clock.Clock, memory: memory.Memory,
+                 bypass_network: bypass.BypassNetwork | None = None,
+                 machine_config: machine.MachineConfig | None = None):
+        self.__clock = clock
+        self.__memory = memory
+        self.__machine = machine_config if machine_config is not None else machine.MachineConfig()
+        self.__bypass = bypass_network if bypass_network is not None else \
+            bypass.BypassNetwork(register_file, self.__machine)
+
+        self.__instruction: None | BaseVectorInstruction = None
+        # the result is worked out when the instruction starts, and handed on once its time is up
+        self.__result: None | writeback.WriteBackAction = None
+        self.__finish_at: None | int = None
+
+        self.instructions = 0
+        self.elements = 0
+
+    def give_instruction(self, instruction: BaseVectorInstruction):
+        self.__instruction = instruction
+
+    def get_instruction(self) -> BaseVectorInstruction | None:
+        return self.__instruction
+
+    def is_available(self) -> bool:
+        return self.__instruction is None
+
+    # throws away an instruction dispatched past a taken branch
+    def squash(self, tag: int):
+        if self.__instruction is not None and self.__instruction.speculation_tag == tag:
+            self.__instruction = None
+            self.__result = None
+            self.__finish_at = None
+
+    # returns whether instruction was executed
+    def execute(self) -> bool:
+        if self.__instruction is None:
+            return False
+
+        if log.VEC.enabled:
+            log.VEC.info(f"VEC execute: {self.__instruction}")
+
+        # hasn't started "executing" yet. Its operands are ready, as it was dispatched.
+        if self.__finish_at is None:
+            max_length = self.__machine.max_vector_length
+            record = self.__instruction.trace_record
+            if record is not None:
+                length = record.count
+                self.__result = writeback.WriteBackAction(self.__instruction.get_dest(), make_vector([], max_length))
+            else:
+                length = self.__instruction.get_length(self.__bypass, max_length)
+                self.__result = self.__instruction.execute(self.__bypass, max_length)
+            self.__finish_at = self.__clock.get_time() + self.__machine.get_vector_latency(self.__instruction, length)
+            # reductions combine the lanes' partial sums in a tree
+            if isinstance(self.__instruction, VectorReduceSum):
+                self.__finish_at += (self.__machine.vector_lanes - 1).bit_length()
+            self.__result.tag = self.__instruction.speculation_tag
+            self.instructions += 1
+            self.elements += length
+
+        if self.__clock.get_time() + 1 >= self.__finish_at:
+            # stall if memory unit busy
+            if not self.__memory.is_mem_busy():
+                if log.VEC.enabled:
+                    log.VEC.info(f"\t forward through MEM: {registers.PhysicalRegisters(self.__result.reg).name} <- {self.__result.data}")
+                self.__memory.pass_to_wb(self.__result)
+                self.__bypass.publish(self.__result, "vec")
+                self.__finish_at = None
+                self.__instruction = None
+                self.__result = None
+                return True
+            else:
+                if log.VEC.verbose:
+                    log.VEC.debug(f"\t Stalling waiting for memory")
+
+        return False
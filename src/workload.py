@@ -0,0 +1,363 @@
+import argparse
+import json
+import math
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import functional
+import machine
+import registers
+import simulation
+from assembler import Assembler
+
+"""
+Synthetic workloads: generates a program for this ISA from a handful of parameters, so the design space can be covered
+without writing assembly by hand. Every program is made of loops whose bodies are drawn at random (from a seeded
+generator, so the same parameters and seed always give the same program) with a given mix of instructions:
+
+    dependency distance   how far back the producers of each instruction's sources are, on average (1 means every
+                          instruction uses the one before it, so there's no ILP at all)
+    mul, div              fraction of multiplies and divides
+    load, store           fraction of loads and stores, and their address locality: the fraction of them that access
+                          words close to a pointer that streams through the data, rather than anywhere in the footprint
+    branches              fraction of forward branches over the next few instructions, how often they're taken, and
+                          how predictable they are: a predictable branch follows the loop counter (e.g. taken every
+                          4th iteration), an unpredictable one a pseudo-random number
+    loops, trips          how many loops there are, and how many times each one goes round
+
+The registers are laid out as:
+
+    R0          loop counter
+    R1          pseudo-random number for unpredictable branches (a 16-bit linear congruential generator)
+    R2          0xFFFF, which values are masked with to keep them from growing without bound
+    R3          threshold below which an unpredictable branch is taken
+    R4          mask of the loop counter's bits a predictable branch looks at
+    R5          the divisor for DIV, which is never 0
+    R6          the pointer that streams through the data, one word per iteration
+    R7          branch conditions and store addresses
+    R8 - R13    the values the generated instructions work on
+
+so multiplies are followed by masking their result, every loop masks R8-R13 at the end of each iteration, branches
+take 3 (predictable) or 5 (unpredictable) instructions and a store 2. The mix is of the generated instructions, not
+counting these or the loop's counter and branch.
+
+Alongside the program, the final state from the functional simulator (registers, instruction count and the data the
+program works on) is written out, which any pipeline configuration has to reach:
+
+    python workload.py -o mix.s --mul 0.2 --load 0.3 --taken 0.1 --trips 500 --seed 4
+    python workload.py -o mix.s ... --check --machine ../examples/machines/default.toml
+"""
+
+# values the generated instructions work on
+POOL = [registers.ArchRegisters(idx) for idx in range(8, 14)]
+# words around the streaming pointer that count as close to it
+WINDOW = 8
+# 16-bit linear congruential generator for the unpredictable branches
+LCG_MULTIPLIER = 0x6255
+LCG_INCREMENT = 0x3619
+LCG_RANGE = 1 << 16
+# ALU operations, as (mnemonic, operand format after the destination)
+ALU_OPERATIONS = [("ADD", "rr"), ("SUB", "rr"), ("AND", "rr"), ("OR", "rr"), ("XOR", "rr"), ("ADDI", "ri"),
+                  ("SUBI", "ri"), ("LSHIFTI", "rs"), ("RSHIFTI", "rs")]
+
+
+class WorkloadParameters:
+    def __init__(self, seed: int = 0, body: int = 32, loops: int = 1, trips: int = 100,
+                 dependency_distance: float = 4.0, mul: float = 0.1, div: float = 0.02, load: float = 0.2,
+                 store: float = 0.1, locality: float = 0.8, footprint: int = 256, branches: float = 0.05,
+                 taken: float = 0.2, predictability: float = 0.5):
+        self.seed = seed
+        self.body = body
+        self.loops = loops
+        self.trips = trips
+        self.dependency_distance = dependency_distance
+        self.mul = mul
+        self.div = div
+        self.load = load
+        self.store = store
+        self.locality = locality
+        self.footprint = footprint
+        self.branches = branches
+        self.taken = taken
+        self.predictability = predictability
+
+        for (name, value) in (("body", body), ("loops", loops), ("trips", trips), ("footprint", footprint)):
+            if value < 1:
+                raise Exception(f"Workload: {name} has to be at least 1, not {value}.")
+        if dependency_distance < 1:
+            raise Exception(f"Workload: the dependency distance has to be at least 1, not {dependency_distance}.")
+        for (name, value) in (("mul", mul), ("div", div), ("load", load), ("store", store), ("locality", locality),
+                              ("branches", branches), ("taken", taken), ("predictability", predictability)):
+            if not 0 <= value <= 1:
+                raise Exception(f"Workload: {name} has to be between 0 and 1, not {value}.")
+        if mul + div + load + store + branches > 1:
+            raise Exception("Workload: the fractions of multiplies, divides, loads, stores and branches add up to "
+                            "more than 1.")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class Generator:
+    def __init__(self, parameters: WorkloadParameters):
+        self.__parameters = parameters
+        self.__random = random.Random(parameters.seed)
+        self.__lines: List[str] = []
+        # registers written by the generated instructions so far, most recent last
+        self.__history: List[registers.ArchRegisters] = []
+        self.__next_dest = 0
+        self.__labels = 0
+
+    def generate(self) -> str:
+        params = self.__parameters
+        rng = self.__random
+        (period_mask, predictable_negated) = self.__get_period()
+
+        self.__lines = [f"; generated by workload.py: {json.dumps(params.to_dict())}", "", "_start:"]
+        self.__emit(f"ADDI r2 r2 {LCG_RANGE - 1:#x}")
+        self.__emit(f"ADDI r3 r3 {round(params.taken * LCG_RANGE):#x}")
+        self.__emit(f"ADDI r4 r4 {period_mask:#x}")
+        self.__emit(f"ADDI r5 r5 {rng.randint(2, 9):#x}")
+        self.__emit(f"ADDI r1 r1 {rng.randrange(LCG_RANGE):#x}")
+        self.__emit("ADDI r6 r6 data")
+        for reg in POOL:
+            self.__emit(f"ADDI {self.__name(reg)} {self.__name(reg)} {rng.randrange(1, 256):#x}")
+
+        for loop in range(params.loops):
+            self.__lines += ["", f"; loop {loop}: {params.trips} iterations"]
+            self.__emit(f"ADDI r0 r0 {params.trips:#x}")
+            self.__lines.append(f"loop{loop}:")
+            self.__generate_body(predictable_negated)
+            # keep the values bounded, move the pointer along and go round again
+            for reg in POOL:
+                self.__emit(f"AND {self.__name(reg)} {self.__name(reg)} r2")
+            self.__emit("ADDI r6 r6 0x1")
+            self.__emit("SUBI r0 r0 0x1")
+            self.__emit(f"BRATI r0 loop{loop}")
+
+        self.__lines += ["", "HALT", "", "data:"]
+        # the pointer moves a word every iteration, and the furthest any access reaches from it is the footprint
+        for _ in range(self.get_data_length()):
+            self.__lines.append(f"{rng.randrange(1 << 16):#x}")
+        return "\n".join(self.__lines) + "\n"
+
+    def get_data_length(self) -> int:
+        params = self.__parameters
+        return params.loops * params.trips + max(params.footprint, WINDOW)
+
+    # Predictable branches are taken when the loop counter's low bits are all 0 (or, if they're mostly taken, when
+    # they aren't), which happens once every 2^n iterations. Returns the mask, and whether the test is negated.
+    def __get_period(self) -> Tuple[int, bool]:
+        taken = self.__parameters.taken
+        if taken in (0, 1):
+            # with no bits to look at, the test is always 0
+            return 0, taken == 1
+        rate = min(taken, 1 - taken)
+        period = 1 << max(0, round(-math.log2(rate)))
+        return period - 1, taken <= 0.5
+
+    def __generate_body(self, predictable_negated: bool):
+        params = self.__parameters
+        rng = self.__random
+        kinds = ["mul", "div", "load", "store", "branch", "alu"]
+        weights = [params.mul, params.div, params.load, params.store, params.branches,
+                   1 - (params.mul + params.div + params.load + params.store + params.branches)]
+
+        # a branch skips the instructions up to its label, which is put in once they've been generated
+        pending: List[Tuple[str, int]] = []
+        for slot in range(params.body):
+            kind = rng.choices(kinds, weights)[0]
+            # a branch needs something after it in the body to skip
+            if kind == "branch" and slot == params.body - 1:
+                kind = "alu"
+
+            if kind == "mul":
+                dest = self.__get_dest()
+                if rng.random() < 0.5:
+                    self.__emit(f"MUL {self.__name(dest)} {self.__name(self.__get_source())} "
+                                f"{self.__name(self.__get_source())}")
+                else:
+                    self.__emit(f"MULI {self.__name(dest)} {self.__name(self.__get_source())} "
+                                f"{rng.randint(2, 15):#x}")
+                self.__emit(f"AND {self.__name(dest)} {self.__name(dest)} r2")
+                self.__history.append(dest)
+            elif kind == "div":
+                dest = self.__get_dest()
+                self.__emit(f"DIV {self.__name(dest)} {self.__name(self.__get_source())} r5")
+                self.__history.append(dest)
+            elif kind == "load":
+                dest = self.__get_dest()
+                self.__emit(f"LDWI {self.__name(dest)} r6 {self.__get_offset():#x}")
+                self.__history.append(dest)
+            elif kind == "store":
+                self.__emit(f"ADDI r7 r6 {self.__get_offset():#x}")
+                self.__emit(f"STW r7 {self.__name(self.__get_source())}")
+            elif kind == "branch":
+                label = f"skip{self.__labels}"
+                self.__labels += 1
+                if rng.random() < params.predictability:
+                    self.__emit("AND r7 r0 r4")
+                    if predictable_negated:
+                        self.__emit("LNOT r7 r7")
+                else:
+                    self.__emit(f"MULI r1 r1 {LCG_MULTIPLIER:#x}")
+                    self.__emit(f"ADDI r1 r1 {LCG_INCREMENT:#x}")
+                    self.__emit("AND r1 r1 r2")
+                    self.__emit("LT r7 r1 r3")
+                self.__emit(f"BRATI r7 {label}")
+                pending.append((label, slot + rng.randint(1, 3)))
+            else:
+                (mnemonic, operands) = rng.choice(ALU_OPERATIONS)
+                dest = self.__get_dest()
+                # registers, immediates and (small) shift amounts
+                sources = [self.__name(self.__get_source()) if operand == "r" else
+                           f"{rng.randint(1, 3) if operand == 's' else rng.randint(1, 255):#x}"
+                           for operand in operands]
+                self.__emit(f"{mnemonic} {self.__name(dest)} {' '.join(sources)}")
+                self.__history.append(dest)
+
+            # the labels of branches whose last skipped instruction this was
+            for (label, last) in [branch for branch in pending if branch[1] <= slot]:
+                self.__lines.append(f"{label}:")
+                pending.remove((label, last))
+        for (label, _) in pending:
+            self.__lines.append(f"{label}:")
+
+    # The source is whatever was written the given number of instructions ago, where the distance is geometrically
+    # distributed with the mean asked for. Registers are reused round-robin, so it can't be more than there are.
+    def __get_source(self) -> registers.ArchRegisters:
+        distance = 1
+        while distance < len(POOL) and self.__random.random() > 1 / self.__parameters.dependency_distance:
+            distance += 1
+        if distance > len(self.__history):
+            return self.__random.choice(POOL)
+        return self.__history[-distance]
+
+    def __get_dest(self) -> registers.ArchRegisters:
+        dest = POOL[self.__next_dest]
+        self.__next_dest = (self.__next_dest + 1) % len(POOL)
+        return dest
+
+    # offset of a memory access from the streaming pointer
+    def __get_offset(self) -> int:
+        params = self.__parameters
+        if self.__random.random() < params.locality:
+            return self.__random.randrange(min(WINDOW, params.footprint))
+        return self.__random.randrange(params.footprint)
+
+    def __emit(self, line: str):
+        self.__lines.append(line)
+
+    @staticmethod
+    def __name(reg: registers.ArchRegisters) -> str:
+        return reg.name.lower()
+
+
+# Runs the program on the functional simulator: what it should end up as, whatever it runs on
+def get_expected_state(source: str, data_length: int, max_instructions: int | None = None) -> Dict[str, Any]:
+    assembler = Assembler(input_str=source)
+    program = assembler.assemble_object()
+    simulator = functional.FunctionalSimulator(program, translate=True)
+    simulator.run(max_instructions=max_instructions)
+    if not simulator.halted:
+        raise Exception(f"Workload: the program didn't halt within {max_instructions} instructions.")
+
+    address = assembler.get_label("data")
+    values = simulator.register_file.get_registers()
+    return {
+        "instructions": simulator.inst_count,
+        "registers": {reg.name: values[reg] for reg in registers.ArchRegisters if reg not in registers.VECTOR_REGISTERS},
+        "data": {"address": address, "words": list(simulator.storage.read_words(address, data_length))},
+    }
+
+
+# Runs the program on the pipeline and compares where it ends up with the expected state. Returns the differences
+# (empty if there aren't any) and the cycles it took.
+def check(source: str, expected: Dict[str, Any], machine_config: machine.MachineConfig | None = None) \
+        -> Tuple[List[str], int]:
+    sim = simulation.Simulation.from_source(source, machine_config)
+    results = sim.run()
+
+    differences = []
+    if results.instructions != expected["instructions"]:
+        differences.append(f"executed {results.instructions} instructions, expected {expected['instructions']}")
+    for (name, value) in expected["registers"].items():
+        actual = sim.get_register(name)
+        if actual != value:
+            differences.append(f"{name} is {actual}, expected {value}")
+    data = expected["data"]
+    words = sim.read_memory(data["address"], len(data["words"]))
+    for (idx, (actual, value)) in enumerate(zip(words, data["words"])):
+        if actual != value:
+            differences.append(f"MEM[{data['address'] + idx}] is {actual}, expected {value}")
+    return differences, results.cycles
+
+
+def main(output: str, parameters: WorkloadParameters, run_check: bool = False, machine_file: str | None = None,
+         max_instructions: int | None = 10_000_000) -> bool:
+    generator = Generator(parameters)
+    source = generator.generate()
+    expected = get_expected_state(source, generator.get_data_length(), max_instructions)
+    expected["parameters"] = parameters.to_dict()
+
+    output = Path(output)
+    with open(output, "w") as fh:
+        fh.write(source)
+    expected_path = output.with_suffix(".expected.json")
+    with open(expected_path, "w") as fh:
+        json.dump(expected, fh, indent=1)
+    print(f"Wrote {output} ({expected['instructions']} instructions executed) and {expected_path}")
+
+    if not run_check:
+        return True
+    machine_config = machine.MachineConfig.load(machine_file) if machine_file is not None else None
+    (differences, cycles) = check(source, expected, machine_config)
+    for difference in differences:
+        print(f"\t {difference}")
+    print(f"Pipeline: {cycles} cycles, {'matches' if len(differences) == 0 else 'DOES NOT match'} the expected state")
+    return len(differences) == 0
+
+
+if __name__ == '__main__':
+    defaults = WorkloadParameters()
+    arg_parser = argparse.ArgumentParser(description="Generate a synthetic workload and its expected final state")
+    arg_parser.add_argument("--output", "-o", type=str, required=True,
+                            help="Where to write the assembly. The expected state goes next to it, in .expected.json")
+    arg_parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed for the random choices. Default: 0")
+    arg_parser.add_argument("--body", type=int, default=defaults.body,
+                            help="Instructions generated for each loop's body. Default: 32")
+    arg_parser.add_argument("--loops", type=int, default=defaults.loops, help="Loops, one after the other. Default: 1")
+    arg_parser.add_argument("--trips", type=int, default=defaults.trips,
+                            help="Iterations of each loop. Default: 100")
+    arg_parser.add_argument("--dependency-distance", type=float, default=defaults.dependency_distance,
+                            help="Mean distance (in instructions) from each source's producer, from 1 (a single "
+                                 "chain) up to 6. Default: 4")
+    arg_parser.add_argument("--mul", type=float, default=defaults.mul, help="Fraction of multiplies. Default: 0.1")
+    arg_parser.add_argument("--div", type=float, default=defaults.div, help="Fraction of divides. Default: 0.02")
+    arg_parser.add_argument("--load", type=float, default=defaults.load, help="Fraction of loads. Default: 0.2")
+    arg_parser.add_argument("--store", type=float, default=defaults.store, help="Fraction of stores. Default: 0.1")
+    arg_parser.add_argument("--locality", type=float, default=defaults.locality,
+                            help=f"Fraction of loads and stores within {WINDOW} words of the streaming pointer, "
+                                 f"rather than anywhere in the footprint. Default: 0.8")
+    arg_parser.add_argument("--footprint", type=int, default=defaults.footprint,
+                            help="Words ahead of the streaming pointer that loads and stores can reach. Default: 256")
+    arg_parser.add_argument("--branches", type=float, default=defaults.branches,
+                            help="Fraction of forward branches. Default: 0.05")
+    arg_parser.add_argument("--taken", type=float, default=defaults.taken,
+                            help="How often branches are taken. Default: 0.2")
+    arg_parser.add_argument("--predictability", type=float, default=defaults.predictability,
+                            help="Fraction of branches that follow the loop counter rather than a pseudo-random "
+                                 "number. Default: 0.5")
+    arg_parser.add_argument("--check", action="store_true",
+                            help="Also run it on the pipeline and check it reaches the expected state")
+    arg_parser.add_argument("--machine", type=str, default=None, metavar="FILE",
+                            help="The machine description to check it on")
+
+    args = arg_parser.parse_args()
+    params = WorkloadParameters(seed=args.seed, body=args.body, loops=args.loops, trips=args.trips,
+                                dependency_distance=args.dependency_distance, mul=args.mul, div=args.div,
+                                load=args.load, store=args.store, locality=args.locality, footprint=args.footprint,
+                                branches=args.branches, taken=args.taken, predictability=args.predictability)
+    if not main(args.output, params, run_check=args.check, machine_file=args.machine):
+        exit(1)
@@ -1,49 +1,49 @@
 from collections import deque
-from typing import Deque, Optional
+from typing import Deque, List
 
+import log
 import registers
 
 
 class WriteBackAction:
-    def __init__(self, reg: registers.PhysicalRegisters, data: int):
+    def __init__(self, reg: registers.PhysicalRegisters, data: int, tag: int | None = None):
         self.reg = reg
         self.data = data
+        # the branch the instruction that produced it was dispatched past, if it was
+        self.tag = tag
 
 
 class WriteBack:
-    # singleton instance
-    __instance = None
-
-    def __new__(cls):
-        if cls.__instance is None:
-            cls.__instance = super(WriteBack, cls).__new__(cls)
-
-        return cls.__instance
-
-    def __init__(self):
-        if not hasattr(self, "_initialised"):
-            self._initialised = True
-            self.__register_file = registers.RegisterFile()
-            self.__action_buffer: Deque[WriteBackAction] = deque()
+    # If given a bypass network, results are written back through it.
+    def __init__(self, register_file: registers.RegisterFile, bypass_network=None):
+        self.__register_file = register_file
+        self.__action_buffer: Deque[WriteBackAction] = deque()
+        self.__bypass = bypass_network
+        self.writes = 0
 
     def prepare_write(self, action: WriteBackAction):
         self.__action_buffer.append(action)
 
-    def is_available(self) -> bool:
-        return len(self.__action_buffer) == 0
+    # results waiting to be written, oldest first
+    def get_pending(self) -> List[WriteBackAction]:
+        return list(self.__action_buffer)
 
-    # if there is an action pending to write this result to a register, return the value
-    def forward_result(self, register: registers.PhysicalRegisters) -> Optional[int]:
-        for action in self.__action_buffer:
-            if action.reg == register:
-                return action.data
-        return None
+    # throws away results of instructions dispatched past a taken branch
+    def squash(self, tag: int):
+        self.__action_buffer = deque(action for action in self.__action_buffer if action.tag != tag)
 
+    def is_available(self) -> bool:
+        return len(self.__action_buffer) == 0
 
     def write(self):
         if len(self.__action_buffer) == 0:
             return
 
         action = self.__action_buffer.popleft()
-        print(f"write-back: Writing {registers.PhysicalRegisters(action.reg).name} <- {action.data}")
-        self.__register_file.set_register_value(action.reg, action.data)
+        self.writes += 1
+        if log.WB.enabled:
+            log.WB.info(f"write-back: Writing {registers.PhysicalRegisters(action.reg).name} <- {action.data}")
+        if self.__bypass is not None:
+            self.__bypass.write_back(action)
+        else:
+            self.__register_file.set_register_value(action.reg, action.data)